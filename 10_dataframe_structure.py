@@ -10,9 +10,11 @@ openai_key = os.getenv("OPENAI_API_KEY")
 # Load documents
 from pathlib import Path
 from llama_index.readers.file import PyMuPDFReader
+from utils.reader_cache import CachedReader
 import re
 
-loader = PyMuPDFReader()
+# The extracted text of every CV is cached (./storage/cache), so unchanged files are not parsed again.
+loader = CachedReader(PyMuPDFReader())
 
 pdf_files = Path("./resumes/").glob("*.pdf")
 
@@ -21,43 +23,53 @@ from llama_index.program.openai import OpenAIPydanticProgram
 from llama_index.program.evaporate.df import DataFrameRowsOnly 
 from llama_index.llms.openai import OpenAI
 
+prompt = (
+    "Please extract the following text into a structured data:"
+    " {input_str}. The column names are the following: ['Name', 'Birth date',"
+    " 'City', 'Current company', 'Proffesion', 'Years of experience', 'Technologies', 'E-mail', 'Phone']. "
+    " For tecnologies column, extract only programming languages, if there are none set value to null. For proffesion column, write the industry in which the person is operating. "
+    " Do not specify additional parameters that"
+    " are not in the function schema. "
+)
 program = OpenAIPydanticProgram.from_defaults(
     output_cls=DataFrameRowsOnly,
     llm=OpenAI(temperature=0, model="gpt-4o"),
-    prompt_template_str=(
-        "Please extract the following text into a structured data:"
-        " {input_str}. The column names are the following: ['Name', 'Birth date',"
-        " 'City', 'Current company', 'Proffesion', 'Years of experience', 'Technologies', 'E-mail', 'Phone']. "
-        " For tecnologies column, extract only programming languages, if there are none set value to null. For proffesion column, write the industry in which the person is operating. "
-        " Do not specify additional parameters that"
-        " are not in the function schema. "
-    ),
+    prompt_template_str=prompt,
     verbose=True,
 )
 
-# Analyze documents.
-rows_list =[]
-for i, pdf_file in enumerate(pdf_files):
+# Analyze one document and return its row.
+def extract_row(pdf_file):
     document = loader.load_data(file_path=str(pdf_file), metadata=True)
-    doc_text = ""
-    file = ""
-
-    for doc in document:
-        # If the text contains more than one newline, set only one newline.
-        file = os.path.basename(doc.metadata['file_path'])
-        doc_text = doc_text + re.sub(r'\n\s*\n', '\n', doc.text)
-
-    # if i == 0: # Limitation for analyzing only one document.
+    # If the text contains more than one newline, set only one newline.
+    doc_text = "".join(re.sub(r'\n\s*\n', '\n', doc.text) for doc in document)
     res = program(
         input_str=doc_text
     )
-    row = res.rows[0].row_values
-    row.append(file)
-    rows_list.append(row)
+    return res.rows[0].row_values
+
+# The documents are analyzed concurrently (max_workers) within the requests per minute limit of the API.
+# Every row is saved in a checkpoint keyed by the content of the PDF and the prompt, so when the script is
+# run again (e.g. after an error or with new CVs) only the new files are sent to the LLM.
+# A file that fails is logged and skipped. The rows are streamed to a Parquet file instead of a list in memory.
+from utils.batch_extraction import BatchExtractor
+
+columns = ['Name', 'Birth date', 'City', 'Current company', 'Profession', 'Year of experience', 'Technologies', 'E-mail', 'Phone', 'File']
+extractor = BatchExtractor(
+    extract_row,
+    columns,
+    job=f"gpt-4o|{prompt}",
+    file_column='File',
+    max_workers=8,
+    requests_per_minute=500,
+)
+metrics = extractor.run(pdf_files, "./storage/resumes.parquet")
+print(metrics.summary())
+for failed_file in metrics.failed:
+    print(f"Failed: {failed_file}")
 
 # Structuring the results into a table.
 import pandas as pd
 
-columns = ['Name', 'Birth date', 'City', 'Current company', 'Profession', 'Year of experience', 'Technologies', 'E-mail', 'Phone', 'File']
-df = pd.DataFrame(rows_list, columns=columns)
+df = pd.read_parquet("./storage/resumes.parquet")
 print(df)
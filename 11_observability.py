@@ -10,41 +10,43 @@ openai_key = os.getenv("OPENAI_API_KEY")
 # Traceloop is initialized with an API key obtained after registration on their website (https://app.traceloop.com/). 
 # For the purposes of this tutorial, Traceloop is free. 
 # After sending a query, all steps are recorded and can be reviewed on the Traceloop website.
-from traceloop.sdk import Traceloop
-traceloop_key = os.getenv("TRACELOOP_API_KEY")
+#
+# With TRACING=local in .env, the same steps (retrieve, synthesize, LLM calls, embeddings) are recorded locally instead,
+# without network access. The spans, the time spent in each step and the token counts of every query are written
+# in batches by a background thread to ./traces/traces.jsonl, so the query does not wait for the export.
+# TRACE_SAMPLE_RATE sets the share of queries that are recorded (e.g. 0.1 in production).
+tracing = os.getenv("TRACING", "traceloop")
+
+if tracing == "local":
+    from utils.local_tracing import enable_local_tracing
+    trace_handler = enable_local_tracing(
+        path="./traces/traces.jsonl",
+        sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "1.0")),
+    )
+else:
+    from traceloop.sdk import Traceloop
+    traceloop_key = os.getenv("TRACELOOP_API_KEY")
 
-Traceloop.init(disable_batch=True, api_key=traceloop_key)
+    Traceloop.init(disable_batch=True, api_key=traceloop_key)
 
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
 from llama_index.llms.openai import OpenAI
 
 llm = OpenAI(
   system_prompt="Always respond in Croatian language"
 )
 
-from llama_index.core import (
-    StorageContext,
-    load_index_from_storage,
+from utils.index_loader import load_index
+index = load_index(
+    "./storage/2021",
+    input_files=["./godisnje-izvjesce-2021-CA.pdf"]
 )
-try:
-    storage_context = StorageContext.from_defaults(
-        persist_dir="./storage/2021"
-    )
-    index = load_index_from_storage(storage_context)
-
-    index_loaded = True
-except:
-    index_loaded = False
-
-if not index_loaded:
-    docs = SimpleDirectoryReader(
-        input_files=["./godisnje-izvjesce-2021-CA.pdf"]
-    ).load_data()
-
-    index = VectorStoreIndex.from_documents(docs)
-
-    index.storage_context.persist(persist_dir="./storage/2021")
 
 query_engine = index.as_query_engine(streaming=True)
 streaming_response = query_engine.query("Branch offices abroad")
 streaming_response.print_response_stream()
+
+if tracing == "local":
+    # Time spent in every step, over the recorded queries.
+    print()
+    for stage, stats in trace_handler.stage_summary().items():
+        print(f"{stage}: {stats['count']} x, p50 {stats['p50_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms")
@@ -0,0 +1,64 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+openai_key = os.getenv("OPENAI_API_KEY")
+
+# In this module, it will be shown how a whole set of questions can be evaluated, and how two configurations
+# of a query engine can be compared on quality (faithfulness of the answers) and on cost (latency and tokens).
+# Script 12 evaluates only one question, which is not enough to decide e.g. how many nodes should be retrieved.
+
+from utils.index_loader import load_index
+index = load_index(
+    "./storage/2021",
+    input_files=["./godisnje-izvjesce-2021-CA.pdf"]
+)
+
+# The questions are read from a file with one question per line. If the file does not exist yet,
+# the LLM writes one question for each of 20 randomly chosen nodes of the index and the file is saved,
+# so every run uses the same questions. The file can also be edited or written by hand.
+from utils.eval_runner import generate_queries, load_queries, save_queries
+
+queries_file = "./eval/queries.txt"
+if not os.path.exists(queries_file):
+    save_queries(generate_queries(index, num_nodes=20), queries_file)
+queries = load_queries(queries_file)
+
+# Every question is sent to a new query engine (4 at a time), and the answer is evaluated with FaithfulnessEvaluator
+# (the verdicts are cached, see script 12). For every question, the time spent on retrieval and synthesis and the number
+# of tokens are recorded as well. Every run is appended to ./eval/runs.jsonl.
+from llama_index.core.evaluation import FaithfulnessEvaluator
+from utils.eval_engine import EvaluationEngine
+from utils.eval_runner import EvaluationRunner
+
+runner = EvaluationRunner(EvaluationEngine(FaithfulnessEvaluator()), max_concurrency=4)
+
+run_2 = runner.run(
+    "similarity_top_k=2",
+    lambda: index.as_query_engine(similarity_top_k=2),
+    queries,
+    config={"similarity_top_k": 2},
+)
+run_4 = runner.run(
+    "similarity_top_k=4",
+    lambda: index.as_query_engine(similarity_top_k=4),
+    queries,
+    config={"similarity_top_k": 4},
+)
+
+# # A chat engine configuration can be evaluated the same way, every question starts a new conversation.
+# run_chat = runner.run(
+#     "condense_plus_context",
+#     lambda: index.as_chat_engine(chat_mode="condense_plus_context", similarity_top_k=2),
+#     queries,
+#     config={"chat_mode": "condense_plus_context", "similarity_top_k": 2},
+# )
+
+# Comparison of both runs: pass rate, latency (mean and p95) and tokens per question.
+from utils.eval_runner import compare_runs, format_comparison
+print(format_comparison(compare_runs(run_2, run_4)))
+
+# # Earlier runs can be compared later by name or run_id.
+# from utils.eval_runner import find_run, load_runs
+# runs = load_runs()
+# print(format_comparison(compare_runs(find_run(runs, "similarity_top_k=2"), find_run(runs, "similarity_top_k=4"))))
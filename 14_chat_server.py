@@ -0,0 +1,81 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+openai_key = os.getenv("OPENAI_API_KEY")
+
+# In this module, the indexes are served to many users at once. The previous scripts load the documents, build or load
+# an index and answer one question in one process (script 6 even ends with an interactive chat_repl()).
+# Here, the indexes of both years are loaded once, and a long-running web service answers queries and chat messages,
+# streaming the answer token by token as server-sent events. Every chat session keeps its own conversation history.
+#
+#   python 14_chat_server.py
+#   curl -N -X POST localhost:8000/query -d '{"question": "Koliko poslovnica ima banka?", "year": "2021"}'
+#   curl -N -X POST localhost:8000/chat -d '{"message": "Koliko poslovnica ima banka?", "session_id": "ana"}'
+#   curl -N -X POST localhost:8000/chat -d '{"message": "A koliko ih je bilo 2020?", "session_id": "ana"}'
+#   curl localhost:8000/health
+#
+# With MOCK_LLM=1, the OpenAI LLM and embeddings are replaced by the offline mocks from utils/mocks.py
+# (the answers are meaningless, but the server can be tested and load tested without API costs,
+# see benchmarks/load_test.py).
+#
+# Every query and chat message needs an embedding of the question. MicroBatchEmbedding sends the questions of
+# concurrent users that arrive within a few milliseconds as one request to the embedding model, and remembers
+# the vectors of recent questions (see utils/embedding_batcher.py).
+from llama_index.core import Settings
+from utils.embedding_batcher import MicroBatchEmbedding
+
+mock_llm = os.getenv("MOCK_LLM") == "1"
+years = ["2021", "2022"]
+
+if mock_llm:
+    from llama_index.core import VectorStoreIndex
+    from llama_index.core.storage.docstore import SimpleDocumentStore
+    from utils.mocks import HashEmbedding, MockLatencyLLM
+
+    Settings.embed_model = MicroBatchEmbedding(HashEmbedding(embed_dim=256, latency=0.05))
+    Settings.llm = MockLatencyLLM(max_tokens=64, latency=0.3, token_latency=0.01)
+    # The nodes stored by the previous scripts are embedded in memory, ./storage is not changed.
+    indexes = {
+        year: VectorStoreIndex(list(SimpleDocumentStore.from_persist_dir(f"./storage/{year}").docs.values()))
+        for year in years
+    }
+else:
+    from llama_index.embeddings.openai import OpenAIEmbedding
+    from utils.embedding_cache import CachedEmbedding
+    from utils.index_loader import load_index
+
+    # All LLM calls go through one gateway (see utils/llm_gateway.py): pooled connections, the rate limits
+    # of the model, retries with backoff, and with a GROQ_API_KEY in .env, answers that take longer than 5 seconds
+    # are also requested from Groq and the first answer is used.
+    from utils.llm_gateway import LLMGateway
+    gateway = LLMGateway()
+    gateway.add_provider(
+        "gpt-4o-mini", gateway.openai(model="gpt-4o-mini"), requests_per_minute=500, tokens_per_minute=200_000
+    )
+    if os.getenv("GROQ_API_KEY"):
+        gateway.add_provider(
+            "groq", gateway.groq(model="llama3-70b-8192", api_key=os.getenv("GROQ_API_KEY")), requests_per_minute=30
+        )
+    Settings.llm = gateway.llm(priority="interactive", hedge_after=5.0)
+    Settings.embed_model = MicroBatchEmbedding(CachedEmbedding(OpenAIEmbedding()))
+    indexes = {
+        year: load_index(f"./storage/{year}", input_files=[f"./godisnje-izvjesce-{year}-CA.pdf"])
+        for year in years
+    }
+
+# At most 16 answers are generated at a time and 64 more requests can wait; further requests get 503 with Retry-After,
+# so the server does not pile up requests while the LLM is the bottleneck. Sessions that are idle for 30 minutes
+# are removed, together with their conversation history.
+import logging
+from aiohttp import web
+from utils.chat_server import create_app
+
+logging.basicConfig(level=logging.INFO)
+app = create_app(
+    indexes,
+    max_concurrent=int(os.getenv("MAX_CONCURRENT", "16")),
+    max_waiting=int(os.getenv("MAX_WAITING", "64")),
+    idle_timeout=1800,
+)
+web.run_app(app, host="127.0.0.1", port=int(os.getenv("PORT", "8000")))
@@ -7,6 +7,9 @@ openai_model = os.getenv("OPENAI_MODEL")
 
 from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, Settings
 from llama_index.llms.openai import OpenAI
+from llama_index.embeddings.openai import OpenAIEmbedding
+from utils.embedding_cache import CachedEmbedding
+from utils.reader_cache import cached_file_extractor
 
 # Sequence of events leading to the result:
 # Loading -> Indexing -> Query (Result)
@@ -35,10 +38,16 @@ Settings.llm = llm
 Settings.num_output = num_output
 Settings.context_window = context_window
 
+# Embeddings of unchanged chunks are kept in a local cache (./storage/cache), so rebuilding the index
+# on every run only sends new or changed text to the embedding model.
+Settings.embed_model = CachedEmbedding(OpenAIEmbedding())
+
 # To load local documents, the SimpleDirectoryReader is used, which supports popular formats
 # such as .pdf, .docx, .csv, .md, .jpg, .jpeg, and others.
+# Extracted text is cached in ./storage/cache, so an unchanged PDF is parsed only once.
 documents = SimpleDirectoryReader(
-    input_files=["./godisnje-izvjesce-2022-CA.pdf"]
+    input_files=["./godisnje-izvjesce-2022-CA.pdf"],
+    file_extractor=cached_file_extractor()
 ).load_data()
 
 # The next step is to create an index used for extracting context and/or knowledge from your own documents and/or sources.
@@ -60,6 +69,19 @@ query_engine = index.as_query_engine(streaming=True)
 streaming_response = query_engine.query("Branch offices abroad")
 streaming_response.print_response_stream()
 
+# By default, the retrieved nodes are put into one LLM call as long as they fit in the context window
+# (context_window - num_output), and the rest is sent in further "refine" calls, one after another.
+# PackedSynthesizer counts the tokens up front, removes the text that neighbouring chunks share (chunk overlap),
+# packs the nodes into as few calls as possible, and when more than one call is needed, runs them in parallel
+# and merges the answers in one last call (see utils/packed_synthesizer.py).
+from utils.packed_synthesizer import PackedSynthesizer
+
+packed_synthesizer = PackedSynthesizer(streaming=True)
+query_engine = index.as_query_engine(similarity_top_k=8, response_synthesizer=packed_synthesizer)
+streaming_response = query_engine.query("Branch offices abroad")
+streaming_response.print_response_stream()
+print(packed_synthesizer.metrics.summary())
+
 ## ----------------------------------------------------------------------------------
 
 # If it is necessary to customize the stream, it can be done in the following way:
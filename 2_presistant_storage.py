@@ -5,8 +5,10 @@ load_dotenv()
 openai_key = os.getenv("OPENAI_API_KEY")
 openai_model = os.getenv("OPENAI_MODEL")
 
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
+from llama_index.core import Settings
 from llama_index.llms.openai import OpenAI
+from llama_index.embeddings.openai import OpenAIEmbedding
+from utils.embedding_cache import CachedEmbedding
 
 llm = OpenAI(
     model=openai_model,
@@ -14,35 +16,42 @@ llm = OpenAI(
 )
 
 Settings.llm = llm
+Settings.embed_model = CachedEmbedding(OpenAIEmbedding())
 
 #To avoid creating a new vector record every time the script is run, 
 #it is possible to save the record locally and load it each time the script is executed.
 
-# If a created record already exists, load that record.
-from llama_index.core import StorageContext, load_index_from_storage
-try:
-    storage_context = StorageContext.from_defaults(
-        persist_dir="./storage/2021"
-    )
-    index = load_index_from_storage(storage_context)
-
-    index_loaded = True
-except:
-    index_loaded = False
-
-# If not, create new one
-if not index_loaded:
-    # Load data
-    docs = SimpleDirectoryReader(
-        input_files=["./godisnje-izvjesce-2021-CA.pdf"]
-    ).load_data()
-
-    # Create index
-    index = VectorStoreIndex.from_documents(docs)
-
-    # Save
-    index.storage_context.persist(persist_dir="./storage/2021")
+# If a created record already exists, load that record. If not, or if the record is incomplete or outdated,
+# it is (re)created and saved. load_index logs the reason for every rebuild, and when only the vector store
+# is missing, the nodes already saved in docstore.json are embedded again without parsing the PDF.
+from utils.index_loader import load_index
+index = load_index(
+    "./storage/2021",
+    input_files=["./godisnje-izvjesce-2021-CA.pdf"]
+)
 
-query_engine = index.as_query_engine(streaming=True)
+# Vector search alone often misses exact names, figures and inflected Croatian words.
+# HybridRetriever also searches a keyword (BM25) index saved next to the record in ./storage/2021
+# and merges both result lists, so fewer, more relevant nodes (similarity_top_k) are sent to the LLM.
+from llama_index.core.query_engine import RetrieverQueryEngine
+from utils.bm25 import HybridRetriever, load_bm25_index
+retriever = HybridRetriever(
+    index,
+    load_bm25_index("./storage/2021", index),
+    similarity_top_k=2
+)
+query_engine = RetrieverQueryEngine.from_args(retriever, streaming=True)
 streaming_response = query_engine.query("Poslovnice u inozemstvu")
 streaming_response.print_response_stream()
+
+## -----------------------------------------------------------------------------------------------------
+
+# # When a report is re-issued with small corrections, load_index only processes the pages that changed.
+# # For a folder where files are added or edited over time, the folder can be watched and every change
+# # is applied to the saved index (new and changed pages are embedded, removed ones are deleted).
+# from utils.incremental import watch_directory
+# whitepapers_index = load_index(
+#     "./storage/whitepapers",
+#     input_files=["./whitepapers/bitcoin.pdf"]
+# )
+# watch_directory(whitepapers_index, "./whitepapers", "./storage/whitepapers", required_exts=[".pdf"])
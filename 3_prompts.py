@@ -7,6 +7,9 @@ openai_model = os.getenv("OPENAI_MODEL")
 
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
 from llama_index.llms.openai import OpenAI
+from llama_index.embeddings.openai import OpenAIEmbedding
+from utils.embedding_cache import CachedEmbedding
+from utils.reader_cache import cached_file_extractor
 
 llm = OpenAI(
     model=openai_model,
@@ -15,8 +18,12 @@ llm = OpenAI(
 
 Settings.llm = llm
 
+# Reuse embeddings from the local cache created in 1_query_engine.py.
+Settings.embed_model = CachedEmbedding(OpenAIEmbedding())
+
 documents = SimpleDirectoryReader(
-    input_files=["./whitepapers/bitcoin.pdf"]
+    input_files=["./whitepapers/bitcoin.pdf"],
+    file_extractor=cached_file_extractor()
 ).load_data()
 
 index = VectorStoreIndex.from_documents(
@@ -36,6 +43,13 @@ for k, v in prompts_dict.items():
     print(v.get_template())
     print(f"\n\n")
 
+# # With PackedSynthesizer (see 1_query_engine.py), the nodes are packed into as few calls as possible
+# # and the answers of several calls are merged by "merge_template" (it needs "context_str" and "query_str" too)
+# # instead of a chain of "refine_template" calls.
+# from utils.packed_synthesizer import PackedSynthesizer
+# query_engine = index.as_query_engine(response_synthesizer=PackedSynthesizer())
+# prompts_dict = query_engine.get_prompts()
+
 ## -----------------------------------------------------------------------------------------
 
 # # To change the query templates, it is always necessary to have variables "context_str" for the retrieved context and 
@@ -7,6 +7,7 @@ openai_model = os.getenv("OPENAI_MODEL")
 
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
 from llama_index.llms.openai import OpenAI
+from utils.reader_cache import cached_file_extractor
 
 llm = OpenAI(
     temperature=0.1,
@@ -22,7 +23,8 @@ Settings.llm = llm
 # During loading, documents are broken down into smaller parts. To load individual documents, input_files are used. 
 # Since it is a list, it is possible to add a larger number of documents in this way.
 documents = SimpleDirectoryReader(
-    input_files=["./godisnje-izvjesce-2022-CA.pdf"]
+    input_files=["./godisnje-izvjesce-2022-CA.pdf"],
+    file_extractor=cached_file_extractor()
 ).load_data()
 
 ## -----------------------------------------------------------------------------------------------------------------------------------------
@@ -86,10 +88,29 @@ documents = SimpleDirectoryReader(
 #     file_metadata=get_meta
 # ).load_data()
 
+# # NumpyVectorStore keeps an inverted index of the metadata (coin, tech, filename, page_label, ...),
+# # so filtered queries score only the matching nodes and always return similarity_top_k of them.
+# from llama_index.core import StorageContext
+# from utils.numpy_store import NumpyVectorStore
+# storage_context = StorageContext.from_defaults(vector_store=NumpyVectorStore())
 # index = VectorStoreIndex.from_documents(
-#     documents
+#     documents,
+#     storage_context=storage_context
 # )
 
+# # For large folders, files can be parsed in parallel processes. iter_documents selects the same files
+# # and returns the same documents and metadata as above, but yields them as soon as they are ready.
+# # get_meta must be defined at module level, and on Windows the code has to be inside if __name__ == "__main__":
+# from utils.parallel_reader import iter_documents
+# index = VectorStoreIndex([], storage_context=StorageContext.from_defaults(vector_store=NumpyVectorStore()))
+# for document in iter_documents(
+#     input_dir="./whitepapers",
+#     required_exts=[".pdf"],
+#     recursive=True,
+#     file_metadata=get_meta
+# ):
+#     index.insert(document)
+
 # # A filter is defined to specify the criteria for searching.
 # from llama_index.core.vector_stores import MetadataFilters, ExactMatchFilter
 # filters = MetadataFilters(
@@ -45,20 +45,32 @@ from pypdf import PdfReader
 from llama_index.core import Document
 
 # An instance of a document is created for each page of text, and arbitrary metadata is added.
-reader = PdfReader("./whitepapers/bitcoin.pdf")
-documents = []
-for i, page in enumerate(reader.pages):
-    text = page.extract_text()
-    documents.append(
-        Document(
-            text=text,
-            metadata={
-                "filename": "bitcoin.pdf", 
-                "page_label": i + 1,
-                "coin": "btc"
-            },
+def load_pages(file_path):
+    reader = PdfReader(file_path)
+    documents = []
+    for i, page in enumerate(reader.pages):
+        text = page.extract_text()
+        documents.append(
+            Document(
+                text=text,
+                metadata={
+                    "filename": "bitcoin.pdf", 
+                    "page_label": i + 1,
+                    "coin": "btc"
+                },
+            )
         )
-    )
+    return documents
+
+# The extracted pages are cached in ./storage/cache, so the PDF is parsed only when it changes.
+# config is part of the cache key: change it when load_pages changes (e.g. other metadata).
+from utils.reader_cache import cached_load
+documents = cached_load(
+    "./whitepapers/bitcoin.pdf",
+    lambda: load_pages("./whitepapers/bitcoin.pdf"),
+    reader_name="pypdf",
+    config="load_pages:v1:filename,page_label,coin"
+)
 
 # TokenTextSplitter is used for creating nodes. Documents that need to be broken down into individual nodes are provided.
 from llama_index.core.node_parser import TokenTextSplitter
@@ -76,14 +88,21 @@ for node in custom_nodes:
     print(node.metadata)
 
 #  Processing nodes with automatic metadata.
+# Extractors are wrapped in an ExtractionEngine: LLM calls for different nodes run concurrently (at most max_concurrency at a time),
+# stay under the given tokens/requests per minute, and every result is cached in ./storage/cache,
+# so running the script again does not repeat (and pay for) the same extraction.
 from llama_index.core.ingestion import IngestionPipeline
-pipeline = IngestionPipeline(transformations=[node_parser, *extractors_1])
+from utils.concurrent_extraction import ExtractionEngine
+engine = ExtractionEngine(max_concurrency=8, tokens_per_minute=200_000, requests_per_minute=500)
+
+pipeline = IngestionPipeline(transformations=[node_parser, *engine.wrap(extractors_1)])
 nodes_1 = pipeline.run(nodes=custom_nodes, in_place=False, show_progress=True)
 print(nodes_1[3].get_content(metadata_mode="all"))
 
-pipeline = IngestionPipeline(transformations=[node_parser, *extractors_2])
+pipeline = IngestionPipeline(transformations=[node_parser, *engine.wrap(extractors_2)])
 nodes_2 = pipeline.run(nodes=custom_nodes, in_place=False, show_progress=True)
 print(nodes_2[3].get_content(metadata_mode="all"))
+print(engine.metrics.summary())
 
 index1 = VectorStoreIndex(
     nodes_1
@@ -114,6 +133,20 @@ for node in response2.source_nodes:
     print("node.text -> ", node.text)
     print("node.metadata -> ", node.metadata)
 
+## -----------------------------------------------------------------------------------------------------------------------
+
+# # Above, all pages, all nodes and the results of both pipelines are kept in memory at the same time.
+# # For documents with thousands of pages, pages can instead be streamed through the transformations in small batches,
+# # and every batch is embedded and added to the index as soon as it is ready, so memory usage stays flat.
+# from utils.streaming_ingest import iter_pdf_pages, stream_into_index
+# index3 = VectorStoreIndex([])
+# stream_into_index(
+#     iter_pdf_pages("./whitepapers/bitcoin.pdf", metadata={"filename": "bitcoin.pdf", "coin": "btc"}),
+#     index3,
+#     transformations=[node_parser, *extractors_1],
+#     batch_size=4
+# )
+
 # Conclusion: If it is necessary to independently define metadata, the QuestionsAnsweredExtractor will often be sufficient for precisely retrieving relevant nodes. 
 # Other tools for automatic metadata setting will be used in specific cases. 
 # One such case might be when setting long nodes is desired due to the need for context during queries, where SummaryExtractor could be helpful.
\ No newline at end of file
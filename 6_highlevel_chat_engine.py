@@ -7,14 +7,21 @@ groq_api_key = os.getenv("GROQ_API_KEY")
 
 from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
 from llama_index.llms.groq import Groq
+from llama_index.embeddings.openai import OpenAIEmbedding
+from utils.embedding_cache import CachedEmbedding
+from utils.reader_cache import cached_file_extractor
 
 llama_llm = Groq(model="llama3-70b-8192", api_key=groq_api_key)
 
+# Groq is only used for chat; embeddings are still created by OpenAI and cached locally.
+Settings.embed_model = CachedEmbedding(OpenAIEmbedding())
+
 # Chat_engine is used in cases where communication involves multiple iterations, during which the conversation history is tracked. 
 # This is in contrast to query_engine, which is used for single questions.
 
 documents = SimpleDirectoryReader(
-    input_files=["./whitepapers/bitcoin.pdf"]
+    input_files=["./whitepapers/bitcoin.pdf"],
+    file_extractor=cached_file_extractor()
 ).load_data()
 
 index = VectorStoreIndex.from_documents(
@@ -45,9 +52,12 @@ index = VectorStoreIndex.from_documents(
 # logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 # logging.getLogger().addHandler(logging.StreamHandler(stream=sys.stdout))
 
-# # A simple memory is added as a buffer.
-# from llama_index.core.memory import ChatMemoryBuffer
-# memory = ChatMemoryBuffer.from_defaults()
+# # A memory with a token budget is added. The tokens of every message are counted once, and when the conversation
+# # grows over token_limit, the oldest turns are folded into a short summary in the background,
+# # so long conversations do not get slower and more expensive with every message.
+# # (ChatMemoryBuffer.from_defaults() from llama_index.core.memory is the simple buffer without a summary.)
+# from utils.chat_memory import TokenBudgetMemory
+# memory = TokenBudgetMemory.from_defaults(llm=llama_llm, token_limit=1500)
 
 # chat_engine = index.as_chat_engine(
 #   chat_mode="condense_plus_context",
@@ -5,15 +5,22 @@ load_dotenv()
 openai_key = os.getenv("OPENAI_API_KEY")
 openai_model = os.getenv("OPENAI_MODEL")
 
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
+from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
 from llama_index.llms.openai import OpenAI
+from llama_index.embeddings.openai import OpenAIEmbedding
+from utils.embedding_cache import CachedEmbedding
+from utils.reader_cache import cached_file_extractor
 
 llm = OpenAI(
     model=openai_model
 )
 
+# Cached embeddings (see 1_query_engine.py).
+Settings.embed_model = CachedEmbedding(OpenAIEmbedding())
+
 documents = SimpleDirectoryReader(
-    input_files=["./whitepapers/bitcoin.pdf"]
+    input_files=["./whitepapers/bitcoin.pdf"],
+    file_extractor=cached_file_extractor()
 ).load_data()
 
 index = VectorStoreIndex.from_documents(
@@ -24,9 +31,6 @@ index = VectorStoreIndex.from_documents(
 # As mentioned in the previous module, a significant difference is the addition of the conversation history throughout the entire conversation. 
 # So far, mostly high-level API concepts have been used. For utilizing a custom conversation history, low-level API composition must be used.
 from llama_index.core.llms import ChatMessage, MessageRole
-from llama_index.core.chat_engine.condense_plus_context import (
-    CondensePlusContextChatEngine,
-)
 
 # The conversation history is defined; first, the user's message is defined, and then the assistant's.
 custom_chat_history = [
@@ -37,6 +41,15 @@ custom_chat_history = [
     ChatMessage(role=MessageRole.ASSISTANT, content="Bitcoin."),
 ]
 
+# The history is kept in a memory with a token budget (see 6_highlevel_chat_engine.py): older turns are
+# summarized in the background when the conversation grows over token_limit.
+from utils.chat_memory import TokenBudgetMemory
+memory = TokenBudgetMemory.from_defaults(
+    chat_history=custom_chat_history,
+    llm=llm,
+    token_limit=1500
+)
+
 # Define query_engine
 query_engine = index.as_query_engine(llm=llm)
 
@@ -44,16 +57,32 @@ query_engine = index.as_query_engine(llm=llm)
 # Retrievers are responsible for fetching the most relevant context based on the user's query from the index.
 retreiver = index.as_retriever()
 
-# Define CondensePlusContextChatEngine
-# This is equivalent to "chat_engine = index.as_chat_engine(chat_mode="condense_plus_context")" 
-# but with low-level API composition, where each aspect is defined "manually."
-chat_engine = CondensePlusContextChatEngine.from_defaults(
+# # Define CondensePlusContextChatEngine
+# # This is equivalent to "chat_engine = index.as_chat_engine(chat_mode="condense_plus_context")" 
+# # but with low-level API composition, where each aspect is defined "manually."
+# from llama_index.core.chat_engine.condense_plus_context import CondensePlusContextChatEngine
+# chat_engine = CondensePlusContextChatEngine.from_defaults(
+#     retriever=retreiver,
+#     query_engine=query_engine,
+#     memory=memory,
+#     verbose=True # Show context and prompt
+# )
+
+# Before answering, the standard CondensePlusContextChatEngine (above) asks the LLM to rewrite the message and the
+# history into a standalone question, and only then retrieves the context, so the first token of every answer waits
+# for an extra LLM call.
+# The speculative variant takes the same arguments. It skips the rewrite when the history is empty or the message
+# does not refer to it (no "it", "that", "more", ...), caches rewritten questions, and retrieves for the raw message
+# while the rewrite is running (see utils/speculative_chat.py).
+from utils.speculative_chat import SpeculativeCondensePlusContextChatEngine
+chat_engine = SpeculativeCondensePlusContextChatEngine.from_defaults(
     retriever=retreiver,
-    query_engine=query_engine,
-    chat_history=custom_chat_history,
-    verbose=True # Show context and prompt
+    llm=llm,
+    memory=memory,
+    verbose=True
 )
-  
+
 # Define prompt
 streaming_response = chat_engine.stream_chat("Can you tell me more about it?")
 streaming_response.print_response_stream()
+print(chat_engine.metrics.summary())
@@ -5,62 +5,49 @@ load_dotenv()
 openai_key = os.getenv("OPENAI_API_KEY")
 openai_model = os.getenv("OPENAI_MODEL")
 
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
 from llama_index.llms.openai import OpenAI
 
 llm = OpenAI(
     model=openai_model
 )
 
-# Load documents
-from llama_index.core import (
-    StorageContext,
-    load_index_from_storage,
+# Define query_engine for years 2021 and 2022.
+# Indexes are not loaded here: LazyQueryEngine loads its index from ./storage the first time the agent
+# uses the tool (if the index is missing or outdated, it is (re)created from the report).
+# IndexPool keeps at most max_resident indexes in memory, so with many yearly reports only
+# the years that are actually asked about are loaded.
+from utils.lazy_tools import IndexPool, LazyQueryEngine
+pool = IndexPool(max_resident=2)
+twentyone_lazy_engine = LazyQueryEngine(
+    pool,
+    "./storage/2021",
+    input_files=["./godisnje-izvjesce-2021-CA.pdf"],
+    similarity_top_k=3,
+    llm=llm
+)
+twentytwo_lazy_engine = LazyQueryEngine(
+    pool,
+    "./storage/2022",
+    input_files=["./godisnje-izvjesce-2022-CA.pdf"],
+    similarity_top_k=3,
+    llm=llm
 )
 
-# Load first index for year 2021
-try:
-    storage_context = StorageContext.from_defaults(
-        persist_dir="./storage/2021"
-    )
-    twentyone_index = load_index_from_storage(storage_context)
-
-    index_one_loaded = True
-except:
-    index_one_loaded = False
-
-if not index_one_loaded:
-    twentyone_docs = SimpleDirectoryReader(
-        input_files=["./godisnje-izvjesce-2021-CA.pdf"]
-    ).load_data()
-
-    twentyone_index = VectorStoreIndex.from_documents(twentyone_docs)
-
-    twentyone_index.storage_context.persist(persist_dir="./storage/2021")
-
-# Load second index for year 2022
-try:
-    storage_context = StorageContext.from_defaults(
-        persist_dir="./storage/2022"
-    )
-    twentytwo_index = load_index_from_storage(storage_context)
-
-    index_two_loaded = True
-except:
-    index_two_loaded = False
-
-if not index_two_loaded:
-    twentytwo_docs = SimpleDirectoryReader(
-        input_files=["./godisnje-izvjesce-2022-CA.pdf"]
-    ).load_data()
-
-    twentytwo_index = VectorStoreIndex.from_documents(twentytwo_docs)
-
-    twentytwo_index.storage_context.persist(persist_dir="./storage/2022")
+# Optionally, an index that will most likely be needed can be loaded in the background
+# while the agent is waiting for the first answer of the LLM.
+# pool.prefetch("./storage/2022", input_files=["./godisnje-izvjesce-2022-CA.pdf"])
 
-# Define query_engine
-twentyone_engine = twentyone_index.as_query_engine(similarity_top_k=3, llm=llm)
-twentytwo_engine = twentytwo_index.as_query_engine(similarity_top_k=3, llm=llm)
+# The agent often sends the same or very similar questions to the tools. CachedQueryEngine answers them
+# from memory (exact or semantically similar question), and the cache is cleared when the index is rebuilt.
+from utils.query_cache import CachedQueryEngine
+twentyone_engine = CachedQueryEngine(
+    twentyone_lazy_engine,
+    version_fn=twentyone_lazy_engine.version
+)
+twentytwo_engine = CachedQueryEngine(
+    twentytwo_lazy_engine,
+    version_fn=twentytwo_lazy_engine.version
+)
 
 # Define query_engine tools for agent usage
 from llama_index.core.tools import QueryEngineTool, ToolMetadata
@@ -88,13 +75,18 @@ query_engine_tools = [
 ]
 
 # Define agent and pass the tools 
-from llama_index.agent.openai import OpenAIAgent
-agent = OpenAIAgent.from_tools(
+# For a comparison between years, the LLM asks for both tools in the same step. ParallelOpenAIAgent
+# is an OpenAIAgent that runs those tool calls at the same time (at most max_concurrency at once),
+# so the comparison takes about as long as a single tool call.
+from utils.parallel_agent import ParallelOpenAIAgent
+agent = ParallelOpenAIAgent.from_tools(
     query_engine_tools, 
+    max_concurrency=4,
     verbose=True,
     system_prompt="""
         - The questions are for Croatia Airlines report for years 2021 and 2022. 
         - Remember to always use available tools
+        - When a question compares years, call the tools for all the years in the same step
         - explain how did you get the final answer 
     """
 )
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.embedding_batcher import MicroBatchEmbedding
+from utils.mocks import HashEmbedding
+
+# Query embeddings under concurrent load, sent one by one (direct) or through MicroBatchEmbedding (batched).
+# The embedding endpoint is the offline HashEmbedding with a latency of --latency ms per request plus
+# --per-text-latency ms per text, and it serves at most --provider-concurrency requests at a time
+# (further requests wait, like at a rate-limited provider). --callers threads (or asyncio tasks with --async)
+# each embed --queries questions; --repeat is the share of questions asked before by someone else.
+#
+#   python benchmarks/bench_embedding_batch.py
+#   python benchmarks/bench_embedding_batch.py --callers 128 --async --max-wait-ms 2
+
+
+class ProviderEmbedding(HashEmbedding):
+    """HashEmbedding that counts requests and serves a limited number at a time."""
+
+    per_text_latency: float = 0.0
+
+    def __init__(self, concurrency: int, **kwargs):
+        super().__init__(**kwargs)
+        self._limit = threading.Semaphore(concurrency)
+        self._requests = 0
+
+    def _call(self, texts):
+        with self._limit:
+            self._requests += 1
+            time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self._embed(text) for text in texts]
+
+    def _get_query_embedding(self, query):
+        return self._call([query])[0]
+
+    def _get_text_embeddings(self, texts):
+        return self._call(texts)
+
+    async def _aget_query_embedding(self, query):
+        return (await asyncio.to_thread(self._call, [query]))[0]
+
+    async def _aget_text_embeddings(self, texts):
+        return await asyncio.to_thread(self._call, texts)
+
+
+def questions(caller, count, repeat):
+    rng = np.random.default_rng(caller)
+    return [
+        f"Where is branch office number {rng.integers(50) if rng.random() < repeat else caller * count + i}?"
+        for i in range(count)
+    ]
+
+
+def run_threads(embed_model, args):
+    def caller(number):
+        times = []
+        for question in questions(number, args.queries, args.repeat):
+            start = time.perf_counter()
+            embed_model.get_query_embedding(question)
+            times.append((time.perf_counter() - start) * 1000)
+        return times
+
+    with ThreadPoolExecutor(args.callers) as pool:
+        return [t for times in pool.map(caller, range(args.callers)) for t in times]
+
+
+def run_async(embed_model, args):
+    async def caller(number):
+        times = []
+        for question in questions(number, args.queries, args.repeat):
+            start = time.perf_counter()
+            await embed_model.aget_query_embedding(question)
+            times.append((time.perf_counter() - start) * 1000)
+        return times
+
+    async def main():
+        results = await asyncio.gather(*(caller(i) for i in range(args.callers)))
+        return [t for times in results for t in times]
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--callers", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--repeat", type=float, default=0.1)
+    parser.add_argument("--latency", type=float, default=50, help="ms per request")
+    parser.add_argument("--per-text-latency", type=float, default=0.2, help="ms per text in a request")
+    parser.add_argument("--provider-concurrency", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--async", dest="use_async", action="store_true")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("direct", "batched"):
+        provider = ProviderEmbedding(
+            args.provider_concurrency,
+            embed_dim=256,
+            latency=args.latency / 1000,
+            embed_batch_size=args.max_batch_size,
+        )
+        provider.per_text_latency = args.per_text_latency / 1000
+        embed_model = provider
+        if mode == "batched":
+            embed_model = MicroBatchEmbedding(provider, max_wait_ms=args.max_wait_ms)
+        start = time.perf_counter()
+        times = run_async(embed_model, args) if args.use_async else run_threads(embed_model, args)
+        wall = time.perf_counter() - start
+        results[mode] = {
+            "queries": len(times),
+            "requests": provider._requests,
+            "queries_per_s": len(times) / wall,
+            "p50_ms": float(np.percentile(times, 50)),
+            "p99_ms": float(np.percentile(times, 99)),
+        }
+        if mode == "batched":
+            results[mode]["batching"] = embed_model.metrics.summary()
+            embed_model.close()
+        print(f"{mode}: {json.dumps(results[mode])}", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from llama_index.llms.openai import OpenAI
+
+from stub_llm_server import start_stub_server
+from utils.llm_gateway import LLMGateway
+
+# Interactive chat requests sent while a batch job floods the same model, against two local OpenAI-compatible
+# stub servers (benchmarks/stub_llm_server.py): the primary answers in --latency s, is slow (--slow-latency s)
+# for --slow-rate of the requests, fails with 429 for --error-rate of them and allows --rpm requests per minute;
+# the fallback provider is slower but reliable.
+#
+#   direct  - every call creates its own OpenAI(...) with the SDK's retries, like the numbered scripts
+#   gateway - LLMGateway with pooled connections, the primary's limits, batch and interactive lanes,
+#             retries with jitter and hedging to the fallback after --hedge-after s
+#
+# Reported per lane: p50/p99 latency and failures, and the number of requests and TCP connections at the servers.
+#
+#   python benchmarks/bench_llm_gateway.py
+#   python benchmarks/bench_llm_gateway.py --batch 400 --interactive 60 --rpm 900
+
+
+def percentiles(times):
+    if not times:
+        return {"p50_s": None, "p99_s": None}
+    return {"p50_s": float(np.percentile(times, 50)), "p99_s": float(np.percentile(times, 99))}
+
+
+def run(make_llm, args):
+    """Run the batch job and the interactive requests at the same time, return latencies per lane."""
+    results = {lane: {"times": [], "failed": 0} for lane in ("batch", "interactive")}
+    lock = threading.Lock()
+
+    def request(lane, i):
+        llm = make_llm(lane)
+        start = time.perf_counter()
+        try:
+            llm.complete(f"{lane} request number {i}: summarize the annual report")
+        except Exception:
+            with lock:
+                results[lane]["failed"] += 1
+            return
+        with lock:
+            results[lane]["times"].append(time.perf_counter() - start)
+
+    def interactive():
+        # Users arrive while the batch job is running.
+        time.sleep(0.5)
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda i: request("interactive", i), range(args.interactive)))
+
+    start = time.perf_counter()
+    users = threading.Thread(target=interactive)
+    users.start()
+    with ThreadPoolExecutor(args.batch_workers) as pool:
+        list(pool.map(lambda i: request("batch", i), range(args.batch)))
+    users.join()
+    wall = time.perf_counter() - start
+    return {
+        lane: {"requests": len(r["times"]) + r["failed"], "failed": r["failed"], **percentiles(r["times"])}
+        for lane, r in results.items()
+    } | {"wall_s": wall}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--batch-workers", type=int, default=32)
+    parser.add_argument("--interactive", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=3.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--rpm", type=int, default=1200)
+    parser.add_argument("--fallback-latency", type=float, default=0.4)
+    parser.add_argument("--hedge-after", type=float, default=1.0)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("direct", "gateway"):
+        primary, primary_url, primary_state = start_stub_server(
+            latency=args.latency,
+            slow_rate=args.slow_rate,
+            slow_latency=args.slow_latency,
+            error_rate=args.error_rate,
+            rpm=args.rpm,
+        )
+        fallback, fallback_url, fallback_state = start_stub_server(latency=args.fallback_latency)
+
+        if mode == "direct":
+
+            def make_llm(lane):
+                return OpenAI(model="gpt-4o-mini", api_base=primary_url, api_key="stub", max_tokens=16)
+
+        else:
+            gateway = LLMGateway(backoff_base=0.2)
+            gateway.add_provider(
+                "primary",
+                gateway.openai(model="gpt-4o-mini", api_base=primary_url, api_key="stub", max_tokens=16),
+                max_concurrency=args.max_concurrency,
+                requests_per_minute=args.rpm,
+            )
+            gateway.add_provider(
+                "fallback",
+                gateway.openai(model="gpt-4o-mini", api_base=fallback_url, api_key="stub", max_tokens=16),
+                max_concurrency=args.max_concurrency,
+            )
+            lanes = {
+                "interactive": gateway.llm("interactive", hedge_after=args.hedge_after),
+                "batch": gateway.llm("batch", providers=["primary"]),
+            }
+
+            def make_llm(lane):
+                return lanes[lane]
+
+        results[mode] = run(make_llm, args)
+        results[mode]["primary_server"] = dict(primary_state.stats)
+        results[mode]["fallback_server"] = dict(fallback_state.stats)
+        if mode == "gateway":
+            results[mode]["gateway"] = gateway.metrics.summary()
+            gateway.close()
+        primary.shutdown()
+        fallback.shutdown()
+        print(f"{mode}: {json.dumps(results[mode])}", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from importlib import metadata as importlib_metadata
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# End-to-end benchmark of the stages used by the numbered scripts, over the PDFs in the repo:
+#   load_simple_directory_reader, load_pypdf, load_pymupdf  - PDF text extraction (pages/s)
+#   split              - TokenTextSplitter as in script 5 (nodes/s)
+#   ingestion          - IngestionPipeline with the splitter and the embedding model (nodes/s)
+#   index_build        - VectorStoreIndex from documents (nodes/s)
+#   load_storage       - StorageContext + load_index_from_storage of ./storage/2021 (loads/s)
+#   query, chat        - query engine and condense_plus_context chat engine (requests/s)
+#
+# Runs offline: the LLM and the embedding model are the deterministic stand-ins from utils/mocks.py, with
+# latency set by --llm-latency, --token-latency and --embed-latency (0 measures only the local work).
+# Every stage runs in its own process, so the peak RSS of one stage is not hidden by an earlier one.
+# The result is JSON with throughput, p50/p95/p99 latency and peak RSS per stage. Compare two runs with
+# --compare: stages whose p50, p99 or peak RSS got worse by more than --threshold are listed and the exit code is 1.
+#
+#   python benchmarks/bench_pipeline.py --output bench.json
+#   python benchmarks/bench_pipeline.py --stages query chat --llm-latency 0.3 --token-latency 0.01
+#   python benchmarks/bench_pipeline.py --output new.json --compare bench.json
+#
+# The benchmark works on a copy of the storage in --work-dir, the checked-in storage is never modified.
+
+STAGES = [
+    "load_simple_directory_reader",
+    "load_pypdf",
+    "load_pymupdf",
+    "split",
+    "ingestion",
+    "index_build",
+    "load_storage",
+    "query",
+    "chat",
+]
+
+QUESTIONS = [
+    "Branch offices abroad",
+    "How many employees did the bank have?",
+    "What was the net profit of the year?",
+    "Who are the members of the management board?",
+    "What are the main risks described in the report?",
+]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def latency_stats(times_ms, items, unit):
+    total_s = sum(times_ms) / 1000
+    return {
+        "iterations": len(times_ms),
+        "unit": unit,
+        "items": items,
+        "throughput": items / total_s if total_s else None,
+        "p50_ms": float(np.percentile(times_ms, 50)),
+        "p95_ms": float(np.percentile(times_ms, 95)),
+        "p99_ms": float(np.percentile(times_ms, 99)),
+    }
+
+
+def timed(fn, repeat):
+    """Call fn() `repeat` times; fn returns the number of items it processed."""
+    times, items = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items += fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return times, items
+
+
+def configure(args):
+    from llama_index.core import Settings
+
+    from utils.mocks import HashEmbedding, MockLatencyLLM
+
+    Settings.embed_model = HashEmbedding(embed_dim=args.embed_dim, latency=args.embed_latency)
+    Settings.llm = MockLatencyLLM(
+        max_tokens=args.answer_tokens, latency=args.llm_latency, token_latency=args.token_latency
+    )
+
+
+def load_documents(args):
+    from llama_index.core import SimpleDirectoryReader
+
+    return SimpleDirectoryReader(input_files=args.files).load_data()
+
+
+def splitter():
+    from llama_index.core.node_parser import TokenTextSplitter
+
+    return TokenTextSplitter(separator=" ", chunk_size=512, chunk_overlap=64)
+
+
+def prepare_storage(args):
+    """Copy --persist-dir to the work dir and make sure it has a vector store (the repo does not ship one)."""
+    from llama_index.core import Settings
+
+    from utils.index_loader import load_index
+
+    persist_dir = os.path.join(args.work_dir, "storage")
+    if not os.path.exists(persist_dir):
+        shutil.copytree(args.persist_dir, persist_dir)
+        load_index(persist_dir, input_files=[args.source], embed_model=Settings.embed_model)
+    return persist_dir
+
+
+def run_stage(stage, args):
+    configure(args)
+    repeat = args.repeat
+
+    if stage == "load_simple_directory_reader":
+        from llama_index.core import SimpleDirectoryReader
+
+        return timed(lambda: len(SimpleDirectoryReader(input_files=args.files).load_data()), repeat), "pages"
+
+    if stage == "load_pypdf":
+        from pypdf import PdfReader
+
+        def load():
+            pages = 0
+            for path in args.files:
+                for page in PdfReader(path).pages:
+                    page.extract_text()
+                    pages += 1
+            return pages
+
+        return timed(load, repeat), "pages"
+
+    if stage == "load_pymupdf":
+        from pathlib import Path
+
+        from llama_index.readers.file import PyMuPDFReader
+
+        reader = PyMuPDFReader()
+        return (
+            timed(lambda: sum(len(reader.load_data(Path(path))) for path in args.files), repeat),
+            "pages",
+        )
+
+    if stage == "split":
+        documents = load_documents(args)
+        node_parser = splitter()
+        return timed(lambda: len(node_parser.get_nodes_from_documents(documents)), repeat), "nodes"
+
+    if stage == "ingestion":
+        from llama_index.core import Settings
+        from llama_index.core.ingestion import IngestionPipeline
+
+        documents = load_documents(args)
+
+        def ingest():
+            pipeline = IngestionPipeline(transformations=[splitter(), Settings.embed_model])
+            return len(pipeline.run(documents=documents))
+
+        return timed(ingest, repeat), "nodes"
+
+    if stage == "index_build":
+        from llama_index.core import VectorStoreIndex
+
+        documents = load_documents(args)
+
+        def build():
+            index = VectorStoreIndex.from_documents(documents, transformations=[splitter()])
+            return len(index.index_struct.nodes_dict)
+
+        return timed(build, repeat), "nodes"
+
+    if stage == "load_storage":
+        from llama_index.core import StorageContext, load_index_from_storage
+
+        persist_dir = prepare_storage(args)
+
+        def load():
+            load_index_from_storage(StorageContext.from_defaults(persist_dir=persist_dir))
+            return 1
+
+        return timed(load, repeat), "loads"
+
+    if stage in ("query", "chat"):
+        from llama_index.core import StorageContext, load_index_from_storage
+
+        index = load_index_from_storage(StorageContext.from_defaults(persist_dir=prepare_storage(args)))
+        questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.requests)]
+
+        if stage == "query":
+            query_engine = index.as_query_engine(similarity_top_k=2)
+
+            def query():
+                query_engine.query(questions.pop())
+                return 1
+
+            return timed(query, args.requests), "requests"
+
+        chat_engine = index.as_chat_engine(chat_mode="condense_plus_context", similarity_top_k=2)
+
+        def chat():
+            # Conversations of 5 turns, so condensing sees a growing history.
+            if len(questions) % 5 == 0:
+                chat_engine.reset()
+            chat_engine.chat(questions.pop())
+            return 1
+
+        return timed(chat, args.requests), "requests"
+
+    raise ValueError(f"Unknown stage {stage}")
+
+
+def child(args):
+    stage = args.child
+    rss_at_start = peak_rss_mb()
+    (times, items), unit = run_stage(stage, args)
+    result = latency_stats(times, items, unit)
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["rss_at_start_mb"] = rss_at_start
+    print(json.dumps(result))
+
+
+def package_version(name):
+    try:
+        return importlib_metadata.version(name)
+    except importlib_metadata.PackageNotFoundError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for stage, result in results["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or "error" in result or "error" in old:
+            continue
+        for metric in ("p50_ms", "p99_ms", "peak_rss_mb"):
+            if result.get(metric) and old.get(metric):
+                change = result[metric] / old[metric] - 1
+                if change > threshold:
+                    regressions.append(f"{stage}.{metric}: {old[metric]:.1f} -> {result[metric]:.1f} (+{change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--files", nargs="+", default=["./godisnje-izvjesce-2021-CA.pdf"])
+    parser.add_argument("--persist-dir", default="./storage/2021")
+    parser.add_argument("--source", default="./godisnje-izvjesce-2021-CA.pdf")
+    parser.add_argument("--work-dir", default="./storage/cache/bench_pipeline")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--embed-dim", type=int, default=1536)
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--answer-tokens", type=int, default=64)
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    shutil.rmtree(args.work_dir, ignore_errors=True)
+    os.makedirs(args.work_dir)
+    child_args = sys.argv[1:]
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "llama_index_core": package_version("llama-index-core"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("child", "output", "compare")},
+        "stages": {},
+    }
+    for stage in args.stages:
+        process = subprocess.run(
+            [sys.executable, __file__, *child_args, "--child", stage],
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            results["stages"][stage] = {"error": process.stderr.strip().splitlines()[-1:]}
+            print(f"{stage}: failed\n{process.stderr}", file=sys.stderr)
+            continue
+        results["stages"][stage] = json.loads(process.stdout.strip().splitlines()[-1])
+        print(f"{stage}: {process.stdout.strip().splitlines()[-1]}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
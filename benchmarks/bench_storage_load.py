@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from llama_index.core import StorageContext, load_index_from_storage
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.vector_stores import VectorStoreQuery
+
+from utils.index_loader import load_index
+from utils.mmap_store import DEFAULT_MMAP_DIRNAME, MmapVectorStore, convert_json_storage
+
+# Compares how long it takes to load ./storage/<year> from the JSON files (load_index_from_storage)
+# and from the memory-mapped binary format (MmapVectorStore), including the first query.
+#
+# Runs offline: missing embeddings are created with MockEmbedding, so the numbers only measure loading.
+#   python benchmarks/bench_storage_load.py --persist-dir ./storage/2021 --source ./godisnje-izvjesce-2021-CA.pdf
+#
+# The benchmark works on a copy in --work-dir, the checked-in storage is never modified.
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        "min_ms": min(times),
+        "p50_ms": statistics.median(times),
+        "max_ms": max(times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--persist-dir", default="./storage/2021")
+    parser.add_argument("--source", default="./godisnje-izvjesce-2021-CA.pdf")
+    parser.add_argument("--work-dir", default="./storage/cache/bench_storage_load")
+    parser.add_argument("--embed-dim", type=int, default=1536)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    json_dir = os.path.join(args.work_dir, "json")
+    shutil.rmtree(args.work_dir, ignore_errors=True)
+    shutil.copytree(args.persist_dir, json_dir)
+
+    embed_model = MockEmbedding(embed_dim=args.embed_dim)
+    # Makes sure the JSON stores are complete (creates the default vector store if it is missing).
+    load_index(json_dir, input_files=[args.source], embed_model=embed_model)
+    mmap_dir = convert_json_storage(
+        json_dir, os.path.join(args.work_dir, DEFAULT_MMAP_DIRNAME), embed_model=embed_model
+    )
+    query = VectorStoreQuery(
+        query_embedding=embed_model.get_query_embedding("Branch offices abroad"),
+        similarity_top_k=2,
+    )
+
+    def load_json():
+        storage_context = StorageContext.from_defaults(persist_dir=json_dir)
+        index = load_index_from_storage(storage_context, embed_model=embed_model)
+        index.as_retriever(similarity_top_k=2).retrieve("Branch offices abroad")
+
+    def load_mmap():
+        MmapVectorStore.from_persist_dir(mmap_dir).query(query)
+
+    results = {
+        "json": timed(load_json, args.repeat),
+        "mmap": timed(load_mmap, args.repeat),
+    }
+    results["speedup_p50"] = results["json"]["p50_ms"] / results["mmap"]["p50_ms"]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
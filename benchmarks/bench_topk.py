@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from llama_index.core.indices.query.embedding_utils import get_top_k_embeddings
+from llama_index.core.vector_stores import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+)
+
+from utils.numpy_store import NumpyVectorStore
+
+# Per-query retrieval latency of NumpyVectorStore on synthetic embeddings (10k, 100k and 1M nodes by default).
+# For comparison, the per-node loop and full sort used by SimpleVectorStore (get_top_k_embeddings)
+# is measured up to --baseline-max nodes, above that it takes seconds per query.
+# Filtered queries use a "shard" metadata key with 100 values: "==" keeps 1% of the nodes, "in" with 10 values keeps 10%.
+#
+#   python benchmarks/bench_topk.py
+#   python benchmarks/bench_topk.py --sizes 10000 100000 --dim 1536 --top-k 4
+#
+# 1M nodes with --dim 256 need ~1 GB of memory.
+
+
+def percentiles(times_ms):
+    return {
+        "p50_ms": float(np.percentile(times_ms, 50)),
+        "p99_ms": float(np.percentile(times_ms, 99)),
+    }
+
+
+def timed_queries(fn, queries):
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        times.append((time.perf_counter() - start) * 1000)
+    return percentiles(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--baseline-max", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    results = {"dim": args.dim, "top_k": args.top_k, "sizes": {}}
+
+    for size in args.sizes:
+        embeddings = rng.standard_normal((size, args.dim), dtype=np.float32)
+        ids = [str(i) for i in range(size)]
+        metadata = [{"shard": i % 100} for i in range(size)]
+        store = NumpyVectorStore.from_embeddings(ids, embeddings, metadata=metadata)
+        del embeddings
+
+        result = {
+            "numpy": timed_queries(
+                lambda q: store.query(
+                    VectorStoreQuery(query_embedding=q.tolist(), similarity_top_k=args.top_k)
+                ),
+                queries,
+            )
+        }
+
+        for name, metadata_filter in (
+            ("numpy_filter_1pct", MetadataFilter(key="shard", value=7)),
+            (
+                "numpy_filter_10pct",
+                MetadataFilter(key="shard", value=list(range(10)), operator=FilterOperator.IN),
+            ),
+        ):
+            filters = MetadataFilters(filters=[metadata_filter])
+            result[name] = timed_queries(
+                lambda q: store.query(
+                    VectorStoreQuery(
+                        query_embedding=q.tolist(), similarity_top_k=args.top_k, filters=filters
+                    )
+                ),
+                queries,
+            )
+
+        batches = [
+            queries[i : i + args.batch_size] for i in range(0, len(queries), args.batch_size)
+        ]
+        batch = timed_queries(lambda b: store.query_batch(b, args.top_k), batches)
+        result[f"numpy_batch_{args.batch_size}_per_query"] = {
+            name: value / args.batch_size for name, value in batch.items()
+        }
+
+        if size <= args.baseline_max:
+            embedding_list = store.embeddings.tolist()
+            baseline_queries = queries[: max(1, args.queries // 10)]
+            result["per_node_loop"] = timed_queries(
+                lambda q: get_top_k_embeddings(
+                    q.tolist(), embedding_list, similarity_top_k=args.top_k, embedding_ids=ids
+                ),
+                baseline_queries,
+            )
+            result["speedup_p50"] = result["per_node_loop"]["p50_ms"] / result["numpy"]["p50_ms"]
+            del embedding_list
+
+        results["sizes"][str(size)] = result
+        print(f"{size} nodes: {json.dumps(result)}", file=sys.stderr)
+        del store, metadata
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from llama_index.core import Document, Settings, VectorStoreIndex
+
+from utils.local_tracing import (
+    BatchExporter,
+    JsonlSink,
+    LocalTraceHandler,
+    OtlpHttpSink,
+    SyncExporter,
+)
+from utils.mocks import HashEmbedding, MockLatencyLLM
+
+# Per-query overhead of tracing, measured on an offline query engine (utils/mocks.py, no injected latency,
+# so the numbers only contain local work):
+#   off                  - no handler
+#   sample_0             - LocalTraceHandler with sample_rate=0
+#   sample_10pct         - sample_rate=0.1, batched JSONL export
+#   sample_all_batched   - every request, batched JSONL export
+#   sample_all_otlp_batched / sample_all_otlp_sync - every request exported to a local OTLP stand-in that
+#                          answers after --export-latency ms, in the background or on the request path
+#                          (like Traceloop.init(disable_batch=True)).
+#
+#   python benchmarks/bench_tracing.py
+#   python benchmarks/bench_tracing.py --queries 2000 --export-latency 50
+
+
+class _SlowCollector(BaseHTTPRequestHandler):
+    latency = 0.02
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def percentiles(times_ms):
+    return {
+        "p50_ms": float(np.percentile(times_ms, 50)),
+        "p99_ms": float(np.percentile(times_ms, 99)),
+        "mean_ms": float(np.mean(times_ms)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--nodes", type=int, default=500)
+    parser.add_argument("--export-latency", type=float, default=20, help="ms per request to the collector")
+    args = parser.parse_args()
+
+    Settings.embed_model = HashEmbedding(embed_dim=256)
+    Settings.llm = MockLatencyLLM(max_tokens=32)
+    index = VectorStoreIndex.from_documents(
+        [Document(text=f"Branch office number {i} is located in city {i % 37}.") for i in range(args.nodes)]
+    )
+    query_engine = index.as_query_engine(similarity_top_k=2)
+    questions = [f"Where is branch office number {i}?" for i in range(args.queries)]
+    for question in questions[:20]:
+        query_engine.query(question)
+
+    _SlowCollector.latency = args.export_latency / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowCollector)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_port}/v1/traces"
+    trace_dir = tempfile.mkdtemp()
+
+    modes = {
+        "off": None,
+        "sample_0": lambda: LocalTraceHandler(sample_rate=0),
+        "sample_10pct": lambda: LocalTraceHandler(
+            BatchExporter(JsonlSink(os.path.join(trace_dir, "10pct.jsonl"))), sample_rate=0.1
+        ),
+        "sample_all_batched": lambda: LocalTraceHandler(
+            BatchExporter(JsonlSink(os.path.join(trace_dir, "all.jsonl")))
+        ),
+        "sample_all_otlp_batched": lambda: LocalTraceHandler(BatchExporter(OtlpHttpSink(endpoint))),
+        "sample_all_otlp_sync": lambda: LocalTraceHandler(SyncExporter(OtlpHttpSink(endpoint))),
+    }
+    results = {}
+    for name, make_handler in modes.items():
+        handler = make_handler() if make_handler else None
+        if handler is not None:
+            Settings.callback_manager.add_handler(handler)
+        times = []
+        for question in questions:
+            start = time.perf_counter()
+            query_engine.query(question)
+            times.append((time.perf_counter() - start) * 1000)
+        if handler is not None:
+            Settings.callback_manager.remove_handler(handler)
+            if handler.exporter is not None:
+                handler.exporter.shutdown()
+        results[name] = percentiles(times)
+        if handler is not None and handler.exporter is not None:
+            results[name]["exported"] = handler.exporter.exported
+            results[name]["dropped"] = handler.exporter.dropped
+        print(f"{name}: {json.dumps(results[name])}", file=sys.stderr)
+
+    base = results["off"]
+    for name, result in results.items():
+        result["overhead_p50_ms"] = result["p50_ms"] - base["p50_ms"]
+        result["overhead_p99_ms"] = result["p99_ms"] - base["p99_ms"]
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
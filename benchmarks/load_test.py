@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import aiohttp
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# Load test for the chat server (14_chat_server.py, utils/chat_server.py): --sessions concurrent users each
+# send --turns chat messages (or queries with --endpoint query), one after another, and read the streamed answer.
+# Reported: throughput (answers/s), time to the first token and to the full answer (p50/p95/p99),
+# and the number of requests refused with 503 (backpressure) or failed.
+#
+# Without --url, the server is started in this process with the offline mocks from utils/mocks.py
+# (--llm-latency, --token-latency and --embed-latency imitate the APIs), over the nodes in ./storage/<year>.
+# --micro-batch sends concurrent query embeddings in batches (utils/embedding_batcher.py).
+#
+#   python benchmarks/load_test.py --sessions 50 --turns 4
+#   python benchmarks/load_test.py --sessions 200 --max-concurrent 16 --max-waiting 32
+#   MOCK_LLM=1 python 14_chat_server.py & python benchmarks/load_test.py --url http://127.0.0.1:8000
+
+MESSAGES = [
+    "How many branch offices does the bank have?",
+    "Can you tell me more about it?",
+    "What was the net profit of the year?",
+    "And how does that compare to the year before?",
+]
+
+
+def percentiles(values):
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    return {f"p{p}_ms": float(np.percentile(values, p)) for p in (50, 95, 99)}
+
+
+async def read_events(response):
+    """Yield (event, data) pairs of a server-sent event stream."""
+    event, data = None, None
+    async for raw_line in response.content:
+        line = raw_line.decode("utf-8").rstrip("\n")
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            data = json.loads(line[len("data: "):])
+        elif not line and event is not None:
+            yield event, data
+            event, data = None, None
+
+
+async def run_session(http, url, endpoint, session_number, turns, year, results):
+    session_id = f"load-{session_number}"
+    for turn in range(turns):
+        text = MESSAGES[(session_number + turn) % len(MESSAGES)]
+        body = {"year": year}
+        body.update({"message": text, "session_id": session_id} if endpoint == "chat" else {"question": text})
+        start = time.perf_counter()
+        first_token = None
+        try:
+            async with http.post(f"{url}/{endpoint}", json=body) as response:
+                if response.status == 503:
+                    results["rejected"] += 1
+                    await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+                    continue
+                response.raise_for_status()
+                async for event, data in read_events(response):
+                    if event == "token" and first_token is None:
+                        first_token = time.perf_counter()
+                    elif event == "error":
+                        raise RuntimeError(data["error"])
+        except Exception as e:
+            results["errors"] += 1
+            print(f"session {session_number}: {e!r}", file=sys.stderr)
+            continue
+        end = time.perf_counter()
+        results["ttft_ms"].append(((first_token or end) - start) * 1000)
+        results["total_ms"].append((end - start) * 1000)
+
+
+async def load_test(args, url):
+    results = {"ttft_ms": [], "total_ms": [], "rejected": 0, "errors": 0}
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                run_session(http, url, args.endpoint, i, args.turns, args.year, results)
+                for i in range(args.sessions)
+            )
+        )
+        wall = time.perf_counter() - start
+        async with http.get(f"{url}/health") as response:
+            health = await response.json()
+    return {
+        "sessions": args.sessions,
+        "turns": args.turns,
+        "answers": len(results["total_ms"]),
+        "rejected": results["rejected"],
+        "errors": results["errors"],
+        "wall_s": wall,
+        "answers_per_s": len(results["total_ms"]) / wall,
+        "ttft": percentiles(results["ttft_ms"]),
+        "total": percentiles(results["total_ms"]),
+        "server": health,
+    }
+
+
+async def with_local_server(args):
+    from aiohttp import web
+    from llama_index.core import Document, Settings, VectorStoreIndex
+    from llama_index.core.storage.docstore import SimpleDocumentStore
+
+    from utils.chat_server import create_app
+    from utils.embedding_batcher import MicroBatchEmbedding
+    from utils.mocks import HashEmbedding, MockLatencyLLM
+
+    Settings.embed_model = HashEmbedding(embed_dim=256, latency=args.embed_latency)
+    if args.micro_batch:
+        Settings.embed_model = MicroBatchEmbedding(Settings.embed_model)
+    Settings.llm = MockLatencyLLM(max_tokens=64, latency=args.llm_latency, token_latency=args.token_latency)
+    persist_dir = f"./storage/{args.year}"
+    if os.path.exists(os.path.join(persist_dir, "docstore.json")):
+        nodes = list(SimpleDocumentStore.from_persist_dir(persist_dir).docs.values())
+        index = VectorStoreIndex(nodes)
+    else:
+        index = VectorStoreIndex.from_documents(
+            [Document(text=f"Branch office number {i} is located in city {i % 37}.") for i in range(500)]
+        )
+    app = create_app({args.year: index}, max_concurrent=args.max_concurrent, max_waiting=args.max_waiting)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        result = await load_test(args, f"http://127.0.0.1:{port}")
+        if args.micro_batch:
+            result["embedding_batching"] = Settings.embed_model.metrics.summary()
+        return result
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="Server to test, by default one is started in this process")
+    parser.add_argument("--endpoint", choices=["chat", "query"], default="chat")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--year", default="2021")
+    parser.add_argument("--max-concurrent", type=int, default=16)
+    parser.add_argument("--max-waiting", type=int, default=64)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds to the first token")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Seconds between tokens")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per embedding request")
+    parser.add_argument("--micro-batch", action="store_true", help="Batch query embeddings (MicroBatchEmbedding)")
+    args = parser.parse_args()
+
+    if args.url:
+        result = asyncio.run(load_test(args, args.url.rstrip("/")))
+    else:
+        result = asyncio.run(with_local_server(args))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for an OpenAI-compatible chat completions API (POST /v1/chat/completions, streaming or not),
+# used to test utils/llm_gateway.py without network access or costs. The answer repeats the last words of
+# the prompt. Every response waits --latency seconds; a share of requests (--slow-rate) waits --slow-latency
+# instead, and a share (--error-rate) fails with 429. With --rpm, requests over that many per minute are refused
+# with 429 and a Retry-After header, like a provider's rate limit. GET /stats returns the counts, including the
+# number of TCP connections (keep-alive connections are reused by pooled clients).
+#
+#   python benchmarks/stub_llm_server.py --port 8100 --latency 0.2 --slow-rate 0.1 --rpm 600
+#   OpenAI(model="gpt-4o-mini", api_base="http://127.0.0.1:8100/v1", api_key="stub")
+
+
+class StubState:
+    def __init__(self, latency=0.2, slow_rate=0.0, slow_latency=3.0, error_rate=0.0, rpm=None, seed=0):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "slow": 0, "connections": 0}
+
+    def admit(self):
+        """None if the request is served, or the Retry-After seconds of a 429."""
+        with self.lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            while self.recent and self.recent[0] < now - 60:
+                self.recent.popleft()
+            if self.rpm is not None and len(self.recent) >= self.rpm:
+                self.stats["rate_limited"] += 1
+                return max(1.0, 60 - (now - self.recent[0]))
+            if self.random.random() < self.error_rate:
+                self.stats["rate_limited"] += 1
+                return 1.0
+            self.recent.append(now)
+            slow = self.random.random() < self.slow_rate
+            self.stats["slow"] += slow
+            return None if not slow else -1.0
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: StubState = None
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.stats["connections"] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.state.lock:
+                self._json(200, dict(self.state.stats))
+        else:
+            self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+        admitted = self.state.admit()
+        if admitted is not None and admitted > 0:
+            self._json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                {"Retry-After": f"{admitted:.0f}"},
+            )
+            return
+        time.sleep(self.state.slow_latency if admitted == -1.0 else self.state.latency)
+
+        prompt = " ".join(str(m.get("content") or "") for m in body.get("messages", []))
+        words = (prompt.split() or ["ok"])[-min(body.get("max_tokens") or 16, 16):]
+        model = body.get("model", "stub")
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(words)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        with self.state.lock:
+            self.state.stats["ok"] += 1
+
+        if not body.get("stream"):
+            self._json(
+                200,
+                {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": " ".join(words)},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                },
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(data):
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(payload):X}\r\n".encode() + payload + b"\r\n")
+
+        for i, word in enumerate(words):
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": (" " if i else "") + word},
+                        "finish_reason": None,
+                    }
+                ],
+            }
+            send(json.dumps(chunk))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_stub_server(port=0, **state_kwargs):
+    """Start a stub server in a background thread. Returns (server, base_url, state)."""
+    state = StubState(**state_kwargs)
+    handler = type("Handler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/v1", state
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency", type=float, default=3.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--rpm", type=int, default=None)
+    args = parser.parse_args()
+    server, url, _ = start_stub_server(
+        args.port,
+        latency=args.latency,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        error_rate=args.error_rate,
+        rpm=args.rpm,
+    )
+    print(f"Serving {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from utils.disk_cache import DiskCache
+from utils.manifest import file_sha256
+from utils.rate_limit import TokenBucket
+
+# Script 10 extracts one DataFrame row per CV with an LLM program, file after file, and keeps all rows
+# in a list until the end, so one failed call loses the whole run.
+#
+# BatchExtractor runs `extract_fn(path) -> row` for many files concurrently, within a requests per minute
+# limit. Every extracted row is saved in a checkpoint (SQLite, ./storage/cache) keyed by the hash of the file
+# content and by `job` (e.g. the prompt and model), so a second run only extracts new or changed files,
+# and files that failed are tried again. A failed file is logged and skipped, the other files continue.
+#
+# Rows are written in batches to a Parquet file (or Arrow IPC for a .arrow/.feather path) instead of
+# being kept in memory. The file is written under a temporary name and renamed at the end, so it always
+# contains every completed row, including the ones read from the checkpoint.
+#
+# Usage:
+#   extractor = BatchExtractor(extract_row, columns, job=prompt, file_column="File", max_workers=8, requests_per_minute=500)
+#   metrics = extractor.run(Path("./resumes/").glob("*.pdf"), "./storage/resumes.parquet")
+#   df = pd.read_parquet("./storage/resumes.parquet")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_PATH = "./storage/cache/batch_extraction.sqlite"
+
+
+@dataclass
+class BatchMetrics:
+    extracted: int = 0
+    from_checkpoint: int = 0
+    retries: int = 0
+    failed: List[str] = field(default_factory=list)
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        rate = self.extracted / self.elapsed if self.elapsed else 0.0
+        return (
+            f"{self.extracted} files extracted ({rate:.2f} files/s), {self.from_checkpoint} from checkpoint, "
+            f"{len(self.failed)} failed, {self.retries} retries in {self.elapsed:.1f}s"
+        )
+
+
+class _RowWriter:
+    """Writes rows of string columns to a Parquet or Arrow IPC file in batches."""
+
+    def __init__(self, path: str, columns: Sequence[str], batch_size: int) -> None:
+        import pyarrow as pa
+
+        self._pa = pa
+        self.path = path
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.schema = pa.schema([(name, pa.string()) for name in self.columns])
+        self._rows: List[Sequence[Any]] = []
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._tmp_path = path + ".tmp"
+        if Path(path).suffix in (".arrow", ".feather", ".ipc"):
+            self._writer = pa.ipc.new_file(self._tmp_path, self.schema)
+        else:
+            import pyarrow.parquet as pq
+
+            self._writer = pq.ParquetWriter(self._tmp_path, self.schema, compression="zstd")
+
+    def write(self, row: Sequence[Any]) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        # LLM output is not typed reliably (a year can come back as 5 or "5+"), so every value is a string.
+        arrays = [
+            self._pa.array([None if row[i] is None else str(row[i]) for row in self._rows], self._pa.string())
+            for i in range(len(self.columns))
+        ]
+        self._writer.write_batch(self._pa.record_batch(arrays, schema=self.schema))
+        self._rows = []
+
+    def close(self) -> None:
+        self.flush()
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._writer.close()
+        os.remove(self._tmp_path)
+
+
+class BatchExtractor:
+    """Runs a per-file extraction function concurrently, with a checkpoint and columnar output."""
+
+    def __init__(
+        self,
+        extract_fn: Callable[[Path], Sequence[Any]],
+        columns: Sequence[str],
+        job: str = "",
+        file_column: Optional[str] = None,
+        max_workers: int = 8,
+        requests_per_minute: Optional[int] = None,
+        max_retries: int = 2,
+        retry_delay: float = 2.0,
+        batch_size: int = 1000,
+        checkpoint_path: str = DEFAULT_CHECKPOINT_PATH,
+    ) -> None:
+        self.extract_fn = extract_fn
+        self.columns = list(columns)
+        self.job = job
+        # The file name is not part of the checkpoint, a renamed file with the same content is not extracted again.
+        self.file_column = file_column
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.batch_size = batch_size
+        self._bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._checkpoint = DiskCache(checkpoint_path, max_entries=1_000_000)
+        self._job_hash = hashlib.sha256(job.encode("utf-8")).hexdigest()[:16]
+
+    def _key(self, path: Path) -> str:
+        return f"{self._job_hash}:{file_sha256(str(path))}"
+
+    def _extract(self, path: Path, metrics: BatchMetrics) -> List[Any]:
+        for attempt in range(self.max_retries + 1):
+            if self._bucket is not None:
+                self._bucket.acquire(1)
+            try:
+                row = list(self.extract_fn(path))
+                break
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                metrics.retries += 1
+                time.sleep(self.retry_delay * 2**attempt)
+        expected = len(self.columns) - (self.file_column is not None)
+        if len(row) != expected:
+            raise ValueError(f"expected {expected} values, got {len(row)}")
+        return row
+
+    def _output_row(self, row: List[Any], path: Path) -> List[Any]:
+        if self.file_column is None:
+            return row
+        row = list(row)
+        row.insert(self.columns.index(self.file_column), path.name)
+        return row
+
+    def run(self, files: Iterable[Union[str, Path]], output_path: str) -> BatchMetrics:
+        """Extract a row from every file and write all rows to `output_path`."""
+        metrics = BatchMetrics()
+        writer = _RowWriter(output_path, self.columns, self.batch_size)
+        # Files are hashed and submitted as workers free up, so a large folder is never held in memory.
+        max_pending = 2 * self.max_workers
+        paths = iter(Path(f) for f in files)
+        # Keyed by future, the same file can be listed more than once.
+        pending: Dict[Future, Tuple[Path, str]] = {}
+
+        def submit_next(executor: ThreadPoolExecutor) -> bool:
+            for path in paths:
+                key = self._key(path)
+                cached = self._checkpoint.get(key)
+                if cached is not None:
+                    writer.write(self._output_row(json.loads(cached), path))
+                    metrics.from_checkpoint += 1
+                    continue
+                pending[executor.submit(self._extract, path, metrics)] = (path, key)
+                return True
+            return False
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while len(pending) < max_pending and submit_next(executor):
+                    pass
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        path, key = pending.pop(future)
+                        try:
+                            row = future.result()
+                        except Exception as e:
+                            logger.warning(f"{path}: extraction failed: {e!r}")
+                            metrics.failed.append(str(path))
+                        else:
+                            self._checkpoint.put(key, json.dumps(row, default=str).encode("utf-8"))
+                            writer.write(self._output_row(row, path))
+                            metrics.extracted += 1
+                        submit_next(executor)
+                    done_count = metrics.extracted + len(metrics.failed)
+                    if done_count and done_count % 100 == 0:
+                        logger.info(metrics.summary())
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        logger.info(metrics.summary())
+        return metrics
@@ -0,0 +1,264 @@
+import logging
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core import QueryBundle, VectorStoreIndex
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore
+
+from utils.numpy_store import top_k
+
+# Dense retrieval often misses exact names, figures and inflected Croatian words ("Poslovnice u inozemstvu").
+# BM25Index is a keyword (sparse) index over the nodes of an index, and HybridRetriever combines its results
+# with the vector retriever using reciprocal rank fusion (RRF): every node gets 1 / (rrf_k + rank) from each
+# result list it appears in, so nodes found by both rank first.
+#
+# The index is saved as bm25_index.npz next to the other stores in ./storage/<year>. The postings are stored
+# in compressed sparse row form (term -> nodes) together with the precomputed BM25 weight of every posting,
+# so a query only adds up a few slices of numbers. load_bm25_index keeps it in sync with the docstore:
+# only nodes added since the last run are tokenized, removed nodes are dropped.
+#
+# Usage:
+#   index = load_index("./storage/2021", input_files=[...])
+#   retriever = HybridRetriever(index, load_bm25_index("./storage/2021", index), similarity_top_k=2)
+#   query_engine = RetrieverQueryEngine.from_args(retriever, streaming=True)
+
+logger = logging.getLogger(__name__)
+
+BM25_FNAME = "bm25_index.npz"
+# Stored in the index file, a different tokenizer means the index has to be built again.
+TOKENIZER_VERSION = "hr-light-1"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_FOLD = str.maketrans({"đ": "dj", "ß": "ss"})
+# Common Croatian inflectional endings, longest first. Only stripped when at least 3 characters remain.
+_SUFFIXES = sorted(
+    [
+        "ijega", "ijemu", "ijima", "ovima", "evima", "anjem", "enjem",
+        "skih", "skim", "skoj", "skog", "skom", "ega", "emu", "omu", "ama", "ima",
+        "iji", "ija", "iju", "ije", "ski", "ska", "sko", "ske", "sku",
+        "om", "em", "og", "oj", "ih", "im",
+        "a", "e", "i", "o", "u",
+    ],
+    key=len,
+    reverse=True,
+)
+_MIN_STEM = 3
+
+
+def fold(text: str) -> str:
+    """Lowercase and remove diacritics (č, ć -> c, š -> s, ž -> z, đ -> dj)."""
+    text = unicodedata.normalize("NFKD", text.lower().translate(_FOLD))
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def stem(token: str) -> str:
+    if token.isdigit():
+        return token
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= _MIN_STEM:
+            return token[: -len(suffix)]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(token) for token in _TOKEN_RE.findall(fold(text))]
+
+
+class BM25Index:
+    """Compact BM25 inverted index over node texts."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.node_ids: List[str] = []
+        self.doc_len = np.zeros(0, dtype=np.int32)
+        # Postings sorted by term: rows of term t are post_docs[offsets[t]:offsets[t + 1]].
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.post_docs = np.zeros(0, dtype=np.int32)
+        self.post_tfs = np.zeros(0, dtype=np.float32)
+        self.post_weights = np.zeros(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def _postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Postings as (term, doc, tf) triples."""
+        terms = np.repeat(np.arange(len(self.offsets) - 1, dtype=np.int32), np.diff(self.offsets))
+        return terms, self.post_docs, self.post_tfs
+
+    def update(self, add: Sequence[Tuple[str, str]] = (), remove: Sequence[str] = ()) -> None:
+        """Add (node_id, text) pairs and remove node ids, then rebuild the postings and weights."""
+        terms, docs, tfs = self._postings()
+        node_ids = list(self.node_ids)
+        doc_len = self.doc_len
+
+        if remove:
+            removed = set(remove)
+            keep = np.asarray([node_id not in removed for node_id in node_ids], dtype=bool)
+            # Old row -> new row, existing postings are kept and renumbered instead of re-tokenized.
+            new_rows = np.cumsum(keep) - 1
+            live = keep[docs]
+            terms, docs, tfs = terms[live], new_rows[docs[live]].astype(np.int32), tfs[live]
+            node_ids = [node_id for node_id, k in zip(node_ids, keep) if k]
+            doc_len = doc_len[keep]
+
+        new_terms, new_docs, new_tfs, new_len = [], [], [], []
+        for node_id, text in add:
+            tokens = tokenize(text)
+            row = len(node_ids)
+            node_ids.append(node_id)
+            new_len.append(len(tokens))
+            for token, tf in Counter(tokens).items():
+                new_terms.append(self.vocab.setdefault(token, len(self.vocab)))
+                new_docs.append(row)
+                new_tfs.append(tf)
+
+        terms = np.concatenate([terms, np.asarray(new_terms, dtype=np.int32)])
+        docs = np.concatenate([docs, np.asarray(new_docs, dtype=np.int32)])
+        tfs = np.concatenate([tfs, np.asarray(new_tfs, dtype=np.float32)])
+        self.node_ids = node_ids
+        self.doc_len = np.concatenate([doc_len, np.asarray(new_len, dtype=np.int32)])
+
+        order = np.argsort(terms, kind="stable")
+        terms, self.post_docs, self.post_tfs = terms[order], docs[order], tfs[order]
+        counts = np.bincount(terms, minlength=len(self.vocab))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self._compute_weights(terms, counts)
+
+    def _compute_weights(self, terms: np.ndarray, df: np.ndarray) -> None:
+        n = len(self.node_ids)
+        if n == 0:
+            self.post_weights = np.zeros(0, dtype=np.float32)
+            return
+        avgdl = max(float(self.doc_len.mean()), 1.0)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        tf = self.post_tfs
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[self.post_docs] / avgdl)
+        self.post_weights = (idf[terms] * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32)
+
+    def query(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Return up to `k` (node_id, score) pairs with a positive score, best first."""
+        term_ids = [self.vocab[t] for t in tokenize(query) if t in self.vocab]
+        if not term_ids or not self.node_ids:
+            return []
+        slices = [slice(self.offsets[t], self.offsets[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.post_docs[s] for s in slices])
+        weights = np.concatenate([self.post_weights[s] for s in slices])
+        scores = np.bincount(docs, weights=weights, minlength=len(self.node_ids))
+        top = top_k(scores, k)
+        return [(self.node_ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def persist(self, path: str) -> None:
+        vocab = sorted(self.vocab, key=self.vocab.get)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            version=np.asarray(TOKENIZER_VERSION),
+            params=np.asarray([self.k1, self.b], dtype=np.float64),
+            vocab=np.asarray(vocab, dtype=str),
+            node_ids=np.asarray(self.node_ids, dtype=str),
+            doc_len=self.doc_len,
+            offsets=self.offsets,
+            post_docs=self.post_docs,
+            post_tfs=self.post_tfs,
+            post_weights=self.post_weights,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        """Load the index from `path`, or return None if it was written by another tokenizer version."""
+        with np.load(path, allow_pickle=False) as data:
+            if str(data["version"]) != TOKENIZER_VERSION:
+                return None
+            k1, b = data["params"].tolist()
+            index = cls(k1=k1, b=b)
+            index.vocab = {term: i for i, term in enumerate(data["vocab"].tolist())}
+            index.node_ids = data["node_ids"].tolist()
+            index.doc_len = data["doc_len"]
+            index.offsets = data["offsets"]
+            index.post_docs = data["post_docs"]
+            index.post_tfs = data["post_tfs"]
+            index.post_weights = data["post_weights"]
+        return index
+
+
+def _index_node_ids(index: VectorStoreIndex) -> List[str]:
+    nodes_dict = getattr(index.index_struct, "nodes_dict", None)
+    if nodes_dict:
+        return list(nodes_dict.values())
+    return list(index.docstore.docs)
+
+
+def load_bm25_index(persist_dir: str, index: VectorStoreIndex) -> BM25Index:
+    """Load the BM25 index saved in `persist_dir` and bring it in line with the nodes of `index`."""
+    path = os.path.join(persist_dir, BM25_FNAME)
+    bm25 = BM25Index.load(path) if os.path.exists(path) else None
+    if bm25 is None:
+        logger.info(f"Building {path}")
+        bm25 = BM25Index()
+
+    node_ids = _index_node_ids(index)
+    current, indexed = set(node_ids), set(bm25.node_ids)
+    added = [node_id for node_id in node_ids if node_id not in indexed]
+    removed = [node_id for node_id in bm25.node_ids if node_id not in current]
+    if added or removed or not os.path.exists(path):
+        nodes = index.docstore.get_nodes(added)
+        bm25.update(
+            add=[(node.node_id, node.get_content(metadata_mode=MetadataMode.NONE)) for node in nodes],
+            remove=removed,
+        )
+        os.makedirs(persist_dir, exist_ok=True)
+        bm25.persist(path)
+        logger.info(f"{path}: {len(added)} nodes added, {len(removed)} removed")
+    return bm25
+
+
+class HybridRetriever(BaseRetriever):
+    """Combines the vector retriever of `index` with a BM25Index using reciprocal rank fusion."""
+
+    def __init__(
+        self,
+        index: VectorStoreIndex,
+        bm25: BM25Index,
+        similarity_top_k: int = 2,
+        candidate_top_k: int = 10,
+        rrf_k: int = 60,
+        **kwargs,
+    ) -> None:
+        self._index = index
+        self._bm25 = bm25
+        self._similarity_top_k = similarity_top_k
+        self._candidate_top_k = candidate_top_k
+        self._rrf_k = rrf_k
+        self._vector_retriever = index.as_retriever(similarity_top_k=candidate_top_k)
+        super().__init__(**kwargs)
+
+    def _fuse(self, dense: List[NodeWithScore], sparse: List[Tuple[str, float]]) -> List[NodeWithScore]:
+        scores: Dict[str, float] = {}
+        for ranked_ids in ([n.node.node_id for n in dense], [node_id for node_id, _ in sparse]):
+            for rank, node_id in enumerate(ranked_ids):
+                scores[node_id] = scores.get(node_id, 0.0) + 1.0 / (self._rrf_k + rank + 1)
+        best = sorted(scores, key=scores.get, reverse=True)[: self._similarity_top_k]
+
+        nodes: Dict[str, BaseNode] = {n.node.node_id: n.node for n in dense}
+        missing = [node_id for node_id in best if node_id not in nodes]
+        if missing:
+            nodes.update({node.node_id: node for node in self._index.docstore.get_nodes(missing)})
+        return [NodeWithScore(node=nodes[node_id], score=scores[node_id]) for node_id in best]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        dense = self._vector_retriever.retrieve(query_bundle)
+        sparse = self._bm25.query(query_bundle.query_str, self._candidate_top_k)
+        return self._fuse(dense, sparse)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        dense = await self._vector_retriever.aretrieve(query_bundle)
+        sparse = self._bm25.query(query_bundle.query_str, self._candidate_top_k)
+        return self._fuse(dense, sparse)
@@ -0,0 +1,211 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, List, Optional
+
+from llama_index.core.base.llms.generic_utils import messages_to_history_str
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms.llm import LLM
+from llama_index.core.memory.types import BaseMemory
+from llama_index.core.utils import get_tokenizer
+
+# ChatMemoryBuffer counts the tokens of the whole history again on every get(), dropping one message
+# at a time until it fits, and condense_plus_context calls get() on every turn. Long conversations get slower
+# with every message, and all old turns are either sent again or dropped without a trace.
+#
+# TokenBudgetMemory counts the tokens of every message once, when it is added, and keeps a running total.
+# When the total goes over token_limit, the oldest messages are removed right away (a constant amount of work
+# per turn) and, if an LLM is given, folded into a rolling summary by a background thread, so the answer
+# does not wait for it. get() returns the summary (as a system message) followed by the recent messages.
+#
+# Turns that are being summarized are missing from the history until the summary is ready (one LLM call).
+#
+# Usage:
+#   memory = TokenBudgetMemory.from_defaults(llm=llm, token_limit=1500)
+#   chat_engine = index.as_chat_engine(chat_mode="condense_plus_context", memory=memory)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_LIMIT = 2000
+# Approximate tokens used by the role and separators of every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+DEFAULT_SUMMARY_PROMPT = (
+    "Progressively summarize the conversation below, adding onto the previous summary and returning a new summary.\n"
+    "Keep names, numbers and facts the user may refer to later. Use at most {max_words} words.\n\n"
+    "Previous summary:\n{summary}\n\n"
+    "New lines of conversation:\n{new_lines}\n\n"
+    "New summary:"
+)
+
+
+class TokenBudgetMemory(BaseMemory):
+    """Chat memory with running token counts, a token budget and an asynchronous rolling summary."""
+
+    token_limit: int = Field(default=DEFAULT_TOKEN_LIMIT, gt=0)
+    summary_max_words: int = Field(default=150, description="Length of the rolling summary.")
+    summary_prompt: str = Field(default=DEFAULT_SUMMARY_PROMPT)
+    tokenizer_fn: Callable[[str], List] = Field(default_factory=get_tokenizer, exclude=True)
+
+    _llm: Optional[LLM] = PrivateAttr(default=None)
+    _messages: Deque[ChatMessage] = PrivateAttr(default_factory=deque)
+    _token_counts: Deque[int] = PrivateAttr(default_factory=deque)
+    _total_tokens: int = PrivateAttr(default=0)
+    _summary: str = PrivateAttr(default="")
+    _summary_tokens: int = PrivateAttr(default=0)
+    _pending: List[ChatMessage] = PrivateAttr(default_factory=list)
+    _summary_future: Optional[Future] = PrivateAttr(default=None)
+    _generation: int = PrivateAttr(default=0)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _executor: Optional[ThreadPoolExecutor] = PrivateAttr(default=None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TokenBudgetMemory"
+
+    @classmethod
+    def from_defaults(
+        cls,
+        chat_history: Optional[List[ChatMessage]] = None,
+        llm: Optional[LLM] = None,
+        token_limit: int = DEFAULT_TOKEN_LIMIT,
+        tokenizer_fn: Optional[Callable[[str], List]] = None,
+        **kwargs: Any,
+    ) -> "TokenBudgetMemory":
+        """Without `llm`, old messages are dropped instead of summarized."""
+        memory = cls(token_limit=token_limit, tokenizer_fn=tokenizer_fn or get_tokenizer(), **kwargs)
+        memory._llm = llm
+        if chat_history:
+            memory.set(chat_history)
+        return memory
+
+    @property
+    def summary(self) -> str:
+        return self._summary
+
+    @property
+    def token_count(self) -> int:
+        """Tokens of the history returned by get(), including the summary."""
+        return self._total_tokens + self._summary_tokens
+
+    def _count(self, text: str) -> int:
+        return len(self.tokenizer_fn(text)) + MESSAGE_OVERHEAD_TOKENS
+
+    def _summary_message(self) -> List[ChatMessage]:
+        if not self._summary:
+            return []
+        return [
+            ChatMessage(
+                role=MessageRole.SYSTEM,
+                content=f"Summary of the earlier conversation: {self._summary}",
+            )
+        ]
+
+    def get(self, input: Optional[str] = None, initial_token_count: int = 0, **kwargs: Any) -> List[ChatMessage]:
+        with self._lock:
+            budget = self.token_limit - initial_token_count - self._summary_tokens
+            # Usually nothing is skipped, the history was trimmed to token_limit in put().
+            skip, total = 0, self._total_tokens
+            while total > budget and skip < len(self._messages):
+                total -= self._token_counts[skip]
+                skip += 1
+            messages = list(self._messages)[skip:]
+            # The history should not start with an answer.
+            while messages and messages[0].role in (MessageRole.ASSISTANT, MessageRole.TOOL):
+                messages.pop(0)
+            return self._summary_message() + messages
+
+    def get_all(self) -> List[ChatMessage]:
+        with self._lock:
+            return self._summary_message() + list(self._messages)
+
+    def put(self, message: ChatMessage) -> None:
+        count = self._count(str(message.content or ""))
+        with self._lock:
+            self._messages.append(message)
+            self._token_counts.append(count)
+            self._total_tokens += count
+            evicted = self._trim()
+            if evicted and self._llm is not None:
+                self._pending.extend(evicted)
+                self._schedule_summary()
+
+    def _trim(self) -> List[ChatMessage]:
+        """Remove the oldest messages until the history (with the summary) fits in token_limit."""
+        evicted = []
+        # The latest message is always kept.
+        while self._total_tokens + self._summary_tokens > self.token_limit and len(self._messages) > 1:
+            evicted.append(self._messages.popleft())
+            self._total_tokens -= self._token_counts.popleft()
+        # Answers and tool outputs go together with the message before them.
+        while len(self._messages) > 1 and self._messages[0].role in (MessageRole.ASSISTANT, MessageRole.TOOL):
+            evicted.append(self._messages.popleft())
+            self._total_tokens -= self._token_counts.popleft()
+        return evicted
+
+    def _schedule_summary(self) -> None:
+        # Called with the lock held. One summary runs at a time, messages evicted meanwhile wait for the next one.
+        if self._summary_future is not None and not self._summary_future.done():
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+        new_lines, self._pending = self._pending, []
+        self._summary_future = self._executor.submit(
+            self._summarize, self._summary, new_lines, self._generation
+        )
+
+    def _summarize(self, summary: str, new_lines: List[ChatMessage], generation: int) -> None:
+        prompt = self.summary_prompt.format(
+            max_words=self.summary_max_words,
+            summary=summary or "(none)",
+            new_lines=messages_to_history_str(new_lines),
+        )
+        try:
+            new_summary = self._llm.complete(prompt).text.strip()
+        except Exception as e:
+            logger.warning(f"Summarizing the chat history failed: {e!r}")
+            new_summary = None
+        summary_tokens = self._count(new_summary) if new_summary else 0
+        with self._lock:
+            if generation != self._generation:
+                # reset() or set() was called meanwhile.
+                return
+            if new_summary is None:
+                # Tried again together with the next evicted messages.
+                self._pending = new_lines + self._pending
+                return
+            self._summary, self._summary_tokens = new_summary, summary_tokens
+            # A longer summary can push the history over the budget.
+            self._pending.extend(self._trim())
+            if self._pending:
+                # This thread is the running summary, so the next one is submitted directly.
+                new_lines, self._pending = self._pending, []
+                self._summary_future = self._executor.submit(
+                    self._summarize, self._summary, new_lines, generation
+                )
+
+    def wait_for_summary(self, timeout: Optional[float] = None) -> None:
+        """Block until the background summary is up to date (for scripts and tests)."""
+        while True:
+            future = self._summary_future
+            if future is None:
+                return
+            future.result(timeout=timeout)
+            if future is self._summary_future:
+                return
+
+    def set(self, messages: List[ChatMessage]) -> None:
+        self.reset()
+        for message in messages:
+            self.put(message)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._messages.clear()
+            self._token_counts.clear()
+            self._total_tokens = 0
+            self._summary, self._summary_tokens = "", 0
+            self._pending = []
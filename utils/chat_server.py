@@ -0,0 +1,324 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+from aiohttp import web
+from llama_index.core.base.response.schema import AsyncStreamingResponse, StreamingResponse
+from llama_index.core.indices.base import BaseIndex
+from llama_index.core.memory import BaseMemory, ChatMemoryBuffer
+from llama_index.core.schema import NodeWithScore
+
+from utils.speculative_chat import SpeculativeCondensePlusContextChatEngine
+
+# The numbered scripts load an index and answer one question per process. create_app() builds a long-running
+# asyncio web service (aiohttp, already installed with llama-index) around indexes that are loaded once:
+#
+#   POST   /query               {"question": ..., "year": "2021"}                   -> answer as server-sent events
+#   POST   /chat                {"message": ..., "year": "2021", "session_id": ...}  -> answer as server-sent events
+#   DELETE /sessions/{id}       forget a conversation
+#   GET    /health              sessions, requests in flight and rejected
+#
+# Answers are streamed as server-sent events: a "start" event (with the session id), one "token" event per
+# token, and a "done" event with the source nodes (or an "error" event).
+#
+# Every chat session has its own memory (ChatMemoryBuffer by default) and chat engine. Sessions that were
+# not used for idle_timeout seconds are removed by a background task, and when there are max_sessions,
+# the least recently used idle session is removed to make room for a new one.
+#
+# Backpressure: at most max_concurrent requests use the LLM at a time, at most max_waiting more wait for
+# a free slot, and any further request is refused right away with 503 and a Retry-After header instead of
+# piling up in memory while the LLM backend is saturated.
+#
+# Usage:
+#   app = create_app({"2021": index_2021, "2022": index_2022}, max_concurrent=16)
+#   web.run_app(app, port=8000)
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """All LLM slots are busy and the waiting queue is full."""
+
+
+@dataclass
+class ServerMetrics:
+    requests: int = 0
+    rejected: int = 0
+    errors: int = 0
+    sessions_created: int = 0
+    sessions_evicted: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def summary(self) -> str:
+        return (
+            f"{self.requests} requests in {time.monotonic() - self.started:.0f}s, {self.rejected} rejected, "
+            f"{self.errors} errors; {self.sessions_created} sessions created, {self.sessions_evicted} evicted"
+        )
+
+
+class LLMGate:
+    """Limits concurrent LLM requests and refuses new ones when too many are already waiting."""
+
+    def __init__(self, max_concurrent: int = 16, max_waiting: int = 64) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def acquire(self) -> None:
+        if self._semaphore is None:
+            # Created in the server's event loop.
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+@dataclass
+class Session:
+    session_id: str
+    year: str
+    memory: BaseMemory
+    chat_engine: Any
+    last_used: float = field(default_factory=time.monotonic)
+    # Messages of one session are answered one after another, so the memory sees whole turns.
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+def default_chat_engine(index: BaseIndex, memory: BaseMemory) -> Any:
+    retriever = index.as_retriever(similarity_top_k=2)
+    return SpeculativeCondensePlusContextChatEngine.from_defaults(retriever=retriever, memory=memory)
+
+
+class SessionStore:
+    """Chat sessions by id, with idle eviction and a maximum number of sessions."""
+
+    def __init__(
+        self,
+        indexes: Dict[str, BaseIndex],
+        metrics: ServerMetrics,
+        max_sessions: int = 1000,
+        idle_timeout: float = 1800,
+        memory_factory: Optional[Callable[[], BaseMemory]] = None,
+        chat_engine_factory: Callable[[BaseIndex, BaseMemory], Any] = default_chat_engine,
+    ) -> None:
+        self.indexes = indexes
+        self.metrics = metrics
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.memory_factory = memory_factory or (lambda: ChatMemoryBuffer.from_defaults(token_limit=3000))
+        self.chat_engine_factory = chat_engine_factory
+        self._sessions: Dict[str, Session] = {}
+
+    @property
+    def count(self) -> int:
+        return len(self._sessions)
+
+    def get_or_create(self, session_id: Optional[str], year: str) -> Session:
+        session = self._sessions.get(session_id) if session_id else None
+        if session is not None and session.year == year:
+            session.last_used = time.monotonic()
+            return session
+        if session is None and len(self._sessions) >= self.max_sessions:
+            self._evict_oldest()
+        memory = self.memory_factory()
+        session = Session(
+            session_id=session_id or uuid.uuid4().hex,
+            year=year,
+            memory=memory,
+            chat_engine=self.chat_engine_factory(self.indexes[year], memory),
+        )
+        self._sessions[session.session_id] = session
+        self.metrics.sessions_created += 1
+        return session
+
+    def _evict_oldest(self) -> None:
+        idle = [s for s in self._sessions.values() if not s.lock.locked()]
+        if not idle:
+            raise Overloaded()
+        oldest = min(idle, key=lambda s: s.last_used)
+        del self._sessions[oldest.session_id]
+        self.metrics.sessions_evicted += 1
+
+    def remove(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def evict_idle(self) -> int:
+        deadline = time.monotonic() - self.idle_timeout
+        expired = [
+            s.session_id for s in self._sessions.values() if s.last_used < deadline and not s.lock.locked()
+        ]
+        for session_id in expired:
+            del self._sessions[session_id]
+        self.metrics.sessions_evicted += len(expired)
+        return len(expired)
+
+
+def _sources(nodes: List[NodeWithScore]) -> List[Dict[str, Any]]:
+    return [
+        {"node_id": n.node.node_id, "score": n.score, "page": n.node.metadata.get("page_label")} for n in nodes
+    ]
+
+
+def _event(name: str, data: Dict[str, Any]) -> bytes:
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def _tokens(response: Any) -> AsyncGenerator[str, None]:
+    if isinstance(response, AsyncStreamingResponse) or hasattr(response, "async_response_gen"):
+        async for token in response.async_response_gen():
+            yield token
+    elif isinstance(response, StreamingResponse):
+        # Synchronous LLM stream, every token is read in a thread so the event loop is not blocked.
+        generator = response.response_gen
+        done = object()
+        while True:
+            token = await asyncio.to_thread(next, generator, done)
+            if token is done:
+                break
+            yield token
+    else:
+        yield str(response)
+
+
+def create_app(
+    indexes: Dict[str, BaseIndex],
+    max_concurrent: int = 16,
+    max_waiting: int = 64,
+    max_sessions: int = 1000,
+    idle_timeout: float = 1800,
+    memory_factory: Optional[Callable[[], BaseMemory]] = None,
+    chat_engine_factory: Callable[[BaseIndex, BaseMemory], Any] = default_chat_engine,
+    similarity_top_k: int = 2,
+) -> web.Application:
+    """aiohttp application that answers queries and chat messages over the given indexes (by year)."""
+    metrics = ServerMetrics()
+    gate = LLMGate(max_concurrent, max_waiting)
+    sessions = SessionStore(
+        indexes, metrics, max_sessions, idle_timeout, memory_factory, chat_engine_factory
+    )
+    query_engines = {
+        year: index.as_query_engine(similarity_top_k=similarity_top_k, streaming=True)
+        for year, index in indexes.items()
+    }
+    default_year = sorted(indexes)[-1]
+
+    async def read_request(request: web.Request, text_field: str) -> Dict[str, Any]:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError as e:
+            raise web.HTTPBadRequest(text="Body must be JSON") from e
+        if not isinstance(body.get(text_field), str) or not body[text_field].strip():
+            raise web.HTTPBadRequest(text=f"'{text_field}' is required")
+        body.setdefault("year", default_year)
+        if body["year"] not in indexes:
+            raise web.HTTPNotFound(text=f"No index for year {body['year']!r}, available: {sorted(indexes)}")
+        return body
+
+    async def stream(request: web.Request, start: Dict[str, Any], answer: Callable[[], Any]) -> web.StreamResponse:
+        metrics.requests += 1
+        try:
+            await gate.acquire()
+        except Overloaded:
+            metrics.rejected += 1
+            raise web.HTTPServiceUnavailable(text="LLM backend is saturated", headers={"Retry-After": "1"}) from None
+        try:
+            response = web.StreamResponse(
+                headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+            )
+            await response.prepare(request)
+            await response.write(_event("start", start))
+            try:
+                result = await answer()
+                async for token in _tokens(result):
+                    await response.write(_event("token", {"delta": token}))
+                await response.write(_event("done", {"sources": _sources(result.source_nodes)}))
+            except (ConnectionResetError, asyncio.CancelledError):
+                # The client went away, the slot is released below.
+                raise
+            except Exception as e:
+                metrics.errors += 1
+                logger.exception("Request failed")
+                await response.write(_event("error", {"error": repr(e)}))
+            await response.write_eof()
+            return response
+        finally:
+            gate.release()
+
+    async def query(request: web.Request) -> web.StreamResponse:
+        body = await read_request(request, "question")
+        query_engine = query_engines[body["year"]]
+        return await stream(request, {"year": body["year"]}, lambda: query_engine.aquery(body["question"]))
+
+    async def chat(request: web.Request) -> web.StreamResponse:
+        body = await read_request(request, "message")
+        try:
+            session = sessions.get_or_create(body.get("session_id"), body["year"])
+        except Overloaded:
+            metrics.rejected += 1
+            raise web.HTTPServiceUnavailable(text="Too many active sessions", headers={"Retry-After": "1"}) from None
+        async with session.lock:
+            session.last_used = time.monotonic()
+            return await stream(
+                request,
+                {"year": body["year"], "session_id": session.session_id},
+                lambda: session.chat_engine.astream_chat(body["message"]),
+            )
+
+    async def delete_session(request: web.Request) -> web.Response:
+        if not sessions.remove(request.match_info["session_id"]):
+            raise web.HTTPNotFound()
+        return web.json_response({"deleted": request.match_info["session_id"]})
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "indexes": sorted(indexes),
+                "sessions": sessions.count,
+                "in_flight": gate.in_flight,
+                "waiting": gate.waiting,
+                "requests": metrics.requests,
+                "rejected": metrics.rejected,
+                "errors": metrics.errors,
+                "sessions_evicted": metrics.sessions_evicted,
+            }
+        )
+
+    async def evict_idle_sessions(app: web.Application) -> AsyncGenerator[None, None]:
+        async def loop() -> None:
+            while True:
+                await asyncio.sleep(max(1.0, idle_timeout / 4))
+                evicted = sessions.evict_idle()
+                if evicted:
+                    logger.info(f"Evicted {evicted} idle sessions, {sessions.count} left")
+
+        task = asyncio.create_task(loop())
+        yield
+        task.cancel()
+        logger.info(metrics.summary())
+
+    app = web.Application()
+    app.add_routes(
+        [
+            web.post("/query", query),
+            web.post("/chat", chat),
+            web.delete("/sessions/{session_id}", delete_session),
+            web.get("/health", health),
+        ]
+    )
+    app.cleanup_ctx.append(evict_idle_sessions)
+    return app
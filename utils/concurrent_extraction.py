@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from copy import deepcopy
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from llama_index.core import Settings
+from llama_index.core.async_utils import asyncio_run
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.extractors import (
+    KeywordExtractor,
+    QuestionsAnsweredExtractor,
+    SummaryExtractor,
+)
+from llama_index.core.extractors.interface import BaseExtractor
+from llama_index.core.schema import BaseNode, TextNode, TransformComponent
+
+from utils.disk_cache import DiskCache
+from utils.rate_limit import TokenBucket
+
+# Metadata extractors (QuestionsAnsweredExtractor, SummaryExtractor, ...) make one LLM call per node,
+# which makes them the slowest and most expensive part of ingestion.
+# ExtractionEngine runs those calls concurrently, stays under a tokens-per-minute and requests-per-minute
+# budget, and keeps every result in a persistent cache keyed by the exact input of the call
+# (node content as the extractor sees it) and the extractor configuration (type, prompt, LLM settings).
+# Identical work in another pipeline or in the next run is read from the cache instead of calling the LLM.
+#
+# Usage:
+#   engine = ExtractionEngine(max_concurrency=8, tokens_per_minute=200_000)
+#   pipeline = IngestionPipeline(transformations=[node_parser, *engine.wrap(extractors)])
+#   print(engine.metrics.summary())
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = "./storage/cache/extraction.sqlite"
+
+
+def is_node_local(extractor: BaseExtractor) -> bool:
+    """True if the output for a node depends only on that node, so it can be cached per node."""
+    if isinstance(extractor, SummaryExtractor):
+        return list(extractor.summaries) == ["self"]
+    return isinstance(extractor, (QuestionsAnsweredExtractor, KeywordExtractor))
+
+
+def extractor_config(extractor: BaseExtractor) -> str:
+    try:
+        config = extractor.to_dict()
+    except Exception:
+        config = {"repr": repr(extractor)}
+    for key in ("show_progress", "num_workers", "in_place"):
+        config.pop(key, None)
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+@dataclass
+class ExtractionMetrics:
+    nodes: int = 0
+    llm_calls: int = 0
+    cache_hits: int = 0
+    estimated_tokens: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def tokens_per_minute(self) -> float:
+        return self.estimated_tokens * 60 / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.nodes} nodes in {self.elapsed:.1f}s ({self.nodes_per_second:.2f} nodes/s), "
+            f"{self.llm_calls} LLM calls, {self.cache_hits} cache hits, "
+            f"~{self.tokens_per_minute:.0f} tokens/min"
+        )
+
+
+class ExtractionEngine:
+    """Shared concurrency limit, rate limits, cache and metrics for metadata extractors."""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        tokens_per_minute: Optional[int] = None,
+        requests_per_minute: Optional[int] = None,
+        completion_tokens: int = 256,
+        cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+        show_progress: bool = True,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.completion_tokens = completion_tokens
+        self.show_progress = show_progress
+        self.metrics = ExtractionMetrics()
+        self._token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._cache = DiskCache(cache_path, max_entries=500_000) if cache_path else None
+
+    def wrap(self, extractors: Sequence[BaseExtractor]) -> List["ConcurrentExtractor"]:
+        return [ConcurrentExtractor(extractor, self) for extractor in extractors]
+
+    def _estimate_tokens(self, text: str) -> int:
+        return len(Settings.tokenizer(text)) + self.completion_tokens
+
+    async def _call(self, extractor: BaseExtractor, nodes: List[BaseNode], text: str) -> List[Dict]:
+        tokens = self._estimate_tokens(text)
+        if self._request_bucket is not None:
+            await self._request_bucket.aacquire(1)
+        if self._token_bucket is not None:
+            await self._token_bucket.aacquire(tokens)
+        self.metrics.llm_calls += 1
+        self.metrics.estimated_tokens += tokens
+        return await extractor.aextract(nodes)
+
+    async def aextract(self, extractor: BaseExtractor, nodes: Sequence[BaseNode]) -> List[Dict]:
+        """Return the metadata of `extractor` for every node, in the same order as `nodes`."""
+        config = extractor_config(extractor)
+        texts = [node.get_content(metadata_mode=extractor.metadata_mode) for node in nodes]
+
+        if not is_node_local(extractor):
+            # Outputs depend on neighbouring nodes (e.g. prev/next summaries), so the whole batch is one unit.
+            key = hashlib.sha256((config + "".join(texts)).encode("utf-8")).hexdigest()
+            cached = self._cache.get(key) if self._cache is not None else None
+            if cached is not None:
+                self.metrics.cache_hits += len(nodes)
+                self.metrics.nodes += len(nodes)
+                return json.loads(cached)
+            results = await self._call(extractor, list(nodes), "".join(texts))
+            if self._cache is not None:
+                self._cache.put(key, json.dumps(results).encode("utf-8"))
+            self.metrics.nodes += len(nodes)
+            return results
+
+        keys = [hashlib.sha256((config + text).encode("utf-8")).hexdigest() for text in texts]
+        cached = self._cache.get_many(keys) if self._cache is not None else {}
+        results: List[Optional[Dict]] = [
+            json.loads(cached[key]) if key in cached else None for key in keys
+        ]
+        self.metrics.cache_hits += sum(result is not None for result in results)
+        self.metrics.nodes += sum(result is not None for result in results)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        progress = None
+        missing = [i for i, result in enumerate(results) if result is None]
+        if self.show_progress and missing:
+            from tqdm.auto import tqdm
+
+            progress = tqdm(total=len(missing), desc=type(extractor).__name__)
+
+        async def run(i: int) -> None:
+            async with semaphore:
+                results[i] = (await self._call(extractor, [nodes[i]], texts[i]))[0]
+            if self._cache is not None:
+                self._cache.put(keys[i], json.dumps(results[i]).encode("utf-8"))
+            self.metrics.nodes += 1
+            if progress is not None:
+                progress.update(1)
+
+        try:
+            await asyncio.gather(*(run(i) for i in missing))
+        finally:
+            if progress is not None:
+                progress.close()
+        logger.info(f"{type(extractor).__name__}: {self.metrics.summary()}")
+        return results  # type: ignore[return-value]
+
+
+class ConcurrentExtractor(TransformComponent):
+    """Transformation that runs an extractor through an ExtractionEngine."""
+
+    # IngestionPipeline's cache hashes transformations by their fields, so the wrapped extractor's
+    # configuration is a field: two different extractors do not share cached pipeline results.
+    extractor_config: str = Field(default="", description="Configuration of the wrapped extractor.")
+    _extractor: BaseExtractor = PrivateAttr()
+    _engine: ExtractionEngine = PrivateAttr()
+
+    def __init__(self, extractor: BaseExtractor, engine: ExtractionEngine, **kwargs: Any) -> None:
+        super().__init__(extractor_config=extractor_config(extractor), **kwargs)
+        # The engine shows one progress bar per extractor instead of one per LLM call.
+        extractor.show_progress = False
+        self._extractor = extractor
+        self._engine = engine
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ConcurrentExtractor"
+
+    async def acall(self, nodes: Sequence[BaseNode], **kwargs: Any) -> Sequence[BaseNode]:
+        extractor = self._extractor
+        if not extractor.in_place:
+            nodes = [deepcopy(node) for node in nodes]
+        metadata_list = await self._engine.aextract(extractor, nodes)
+        # Same post-processing as BaseExtractor.aprocess_nodes.
+        for node, metadata in zip(nodes, metadata_list):
+            node.metadata.update(metadata)
+            if not extractor.disable_template_rewrite and isinstance(node, TextNode):
+                node.text_template = extractor.node_text_template
+        return nodes
+
+    def __call__(self, nodes: Sequence[BaseNode], **kwargs: Any) -> Sequence[BaseNode]:
+        return asyncio_run(self.acall(nodes, **kwargs))
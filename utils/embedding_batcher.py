@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+# Every query_engine.query and chat_engine.stream_chat call embeds its query with its own request to the embedding
+# model. A server with many concurrent users (see utils/chat_server.py) sends hundreds of requests with one short text
+# each, and under load they queue behind each other at the provider.
+#
+# MicroBatchEmbedding wraps the embedding model and collects the query embeddings requested by concurrent callers
+# (threads or asyncio tasks) for at most max_wait_ms or until max_batch_size texts are waiting, sends them as one
+# batch request, and hands every caller its own vector. At most max_in_flight batches are sent at a time; while
+# they are running, new queries wait and form the next, larger batch. The same query requested twice (also while
+# it is being embedded) is embedded once, and the vectors of the last cache_size queries are kept in an LRU.
+#
+# Queries are embedded with the text embedding endpoint of the wrapped model, which is the same as the query
+# embedding for OpenAI models. Models that embed queries differently (e.g. with an instruction prefix) should not
+# be wrapped. Text embeddings (indexing) go straight to the wrapped model, they are already batched.
+# max_batch_size defaults to the embed_batch_size of the wrapped model (100 for OpenAI), larger batches
+# would be split into several requests anyway.
+#
+# Usage:
+#   Settings.embed_model = MicroBatchEmbedding(CachedEmbedding(OpenAIEmbedding()), max_wait_ms=5)
+#   print(Settings.embed_model.metrics.summary())
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+@dataclass
+class BatchingMetrics:
+    queries: int = 0
+    cache_hits: int = 0
+    coalesced: int = 0
+    batches: int = 0
+    embedded: int = 0
+    max_batch: int = 0
+    # Time from the request to the start of its batch request, for the last 10000 queries.
+    queue_delays_ms: Deque[float] = field(default_factory=lambda: deque(maxlen=10_000))
+
+    @property
+    def mean_batch(self) -> float:
+        return self.embedded / self.batches if self.batches else 0.0
+
+    def summary(self) -> str:
+        delays = np.array(self.queue_delays_ms) if self.queue_delays_ms else np.zeros(1)
+        return (
+            f"{self.queries} queries: {self.cache_hits} cached, {self.coalesced} coalesced, "
+            f"{self.embedded} embedded in {self.batches} requests (mean batch {self.mean_batch:.1f}, "
+            f"max {self.max_batch}); queue delay p50 {np.percentile(delays, 50):.1f} ms, "
+            f"p99 {np.percentile(delays, 99):.1f} ms"
+        )
+
+
+class MicroBatchEmbedding(BaseEmbedding):
+    """Embedding model wrapper that batches concurrent query embeddings and caches recent query vectors."""
+
+    max_batch_size: int = Field(default=64, gt=0, description="Most queries sent in one request.")
+    max_wait_ms: float = Field(default=5.0, ge=0, description="Longest time a query waits for others.")
+    max_in_flight: int = Field(default=4, gt=0, description="Batch requests sent at the same time.")
+    cache_size: int = Field(default=10_000, ge=0, description="Query vectors kept in the LRU.")
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _metrics: BatchingMetrics = PrivateAttr(default_factory=BatchingMetrics)
+    _lru: "OrderedDict[str, Embedding]" = PrivateAttr(default_factory=OrderedDict)
+    _pending: Dict[str, Future] = PrivateAttr(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _queue: "queue.Queue[Any]" = PrivateAttr(default_factory=queue.Queue)
+    _slots: threading.Semaphore = PrivateAttr()
+    _collector: Optional[threading.Thread] = PrivateAttr(default=None)
+    _executor: Optional[ThreadPoolExecutor] = PrivateAttr(default=None)
+
+    def __init__(self, embed_model: BaseEmbedding, **kwargs: Any) -> None:
+        kwargs.setdefault("model_name", embed_model.model_name)
+        kwargs.setdefault("embed_batch_size", embed_model.embed_batch_size)
+        kwargs.setdefault("max_batch_size", embed_model.embed_batch_size)
+        super().__init__(**kwargs)
+        self._embed_model = embed_model
+        self._slots = threading.Semaphore(self.max_in_flight)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MicroBatchEmbedding"
+
+    @property
+    def metrics(self) -> BatchingMetrics:
+        return self._metrics
+
+    def _submit(self, query: str) -> Tuple[Optional[Embedding], Optional[Future]]:
+        """The cached vector, or a future that receives it."""
+        with self._lock:
+            self._metrics.queries += 1
+            vector = self._lru.get(query)
+            if vector is not None:
+                self._lru.move_to_end(query)
+                self._metrics.cache_hits += 1
+                return vector, None
+            future = self._pending.get(query)
+            if future is not None:
+                self._metrics.coalesced += 1
+                return None, future
+            future = Future()
+            self._pending[query] = future
+            if self._collector is None:
+                self._executor = ThreadPoolExecutor(self.max_in_flight, thread_name_prefix="embedding-batch")
+                self._collector = threading.Thread(target=self._collect, name="embedding-collector", daemon=True)
+                self._collector.start()
+        self._queue.put((query, time.perf_counter()))
+        return None, future
+
+    def _collect(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait_ms / 1000
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            # While all slots are busy, new queries stay in the queue and go into the next batch.
+            self._slots.acquire()
+            while len(batch) < self.max_batch_size and not stop:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._executor.submit(self._embed_batch, batch)
+            if stop:
+                return
+
+    def _embed_batch(self, batch: List[Tuple[str, float]]) -> None:
+        start = time.perf_counter()
+        texts = [text for text, _ in batch]
+        try:
+            embeddings = self._embed_model.get_text_embedding_batch(texts)
+        except Exception as e:
+            with self._lock:
+                futures = [self._pending.pop(text) for text in texts]
+            for future in futures:
+                future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        with self._lock:
+            metrics = self._metrics
+            metrics.batches += 1
+            metrics.embedded += len(texts)
+            metrics.max_batch = max(metrics.max_batch, len(texts))
+            metrics.queue_delays_ms.extend((start - queued) * 1000 for _, queued in batch)
+            futures = [self._pending.pop(text) for text in texts]
+            if self.cache_size:
+                for text, embedding in zip(texts, embeddings):
+                    self._lru[text] = embedding
+                    self._lru.move_to_end(text)
+                while len(self._lru) > self.cache_size:
+                    self._lru.popitem(last=False)
+        for future, embedding in zip(futures, embeddings):
+            future.set_result(embedding)
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        vector, future = self._submit(query)
+        return vector if future is None else future.result()
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        vector, future = self._submit(query)
+        return vector if future is None else await asyncio.wrap_future(future)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed_model.get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await self._embed_model.aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._embed_model.get_text_embedding_batch(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await self._embed_model.aget_text_embedding_batch(texts)
+
+    def close(self) -> None:
+        """Send the waiting queries and stop the background threads."""
+        with self._lock:
+            collector, executor = self._collector, self._executor
+            self._collector = self._executor = None
+        if collector is not None:
+            self._queue.put(_STOP)
+            collector.join()
+            executor.shutdown(wait=True)
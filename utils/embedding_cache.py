@@ -0,0 +1,112 @@
+import hashlib
+from array import array
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from utils.disk_cache import DiskCache
+
+# Every script builds its index with VectorStoreIndex.from_documents, which sends every node to the embedding model.
+# CachedEmbedding wraps any embedding model and stores the resulting vectors on disk,
+# so chunks whose text has not changed are never sent to the embedding endpoint again.
+#
+# Usage:
+#   Settings.embed_model = CachedEmbedding(OpenAIEmbedding())
+
+DEFAULT_CACHE_PATH = "./storage/cache/embeddings.sqlite"
+
+
+def embedding_cache_key(text: str, model_name: str, dimensions: Optional[int]) -> str:
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model_name}:{dimensions or 0}:{text_hash}"
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that keeps text embeddings in a persistent cache."""
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: DiskCache = PrivateAttr()
+    _dimensions: Optional[int] = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        cache_path: str = DEFAULT_CACHE_PATH,
+        max_entries: int = 200_000,
+        **kwargs: Any,
+    ) -> None:
+        kwargs.setdefault("model_name", embed_model.model_name)
+        kwargs.setdefault("embed_batch_size", embed_model.embed_batch_size)
+        super().__init__(**kwargs)
+        self._embed_model = embed_model
+        self._cache = DiskCache(cache_path, max_entries=max_entries)
+        # OpenAI text-embedding-3 models can return shortened vectors, so the dimension is part of the key.
+        self._dimensions = getattr(embed_model, "dimensions", None)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> DiskCache:
+        return self._cache
+
+    @property
+    def hits(self) -> int:
+        return self._cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    def stats(self) -> Dict[str, float]:
+        return self._cache.stats()
+
+    def _key(self, text: str) -> str:
+        return embedding_cache_key(text, self.model_name, self._dimensions)
+
+    def _lookup(self, texts: List[str]) -> Dict[str, Embedding]:
+        found = self._cache.get_many(self._key(text) for text in texts)
+        return {key: array("f", value).tolist() for key, value in found.items()}
+
+    def _store(self, texts: List[str], embeddings: List[Embedding]) -> None:
+        self._cache.put_many(
+            [
+                (self._key(text), array("f", embedding).tobytes())
+                for text, embedding in zip(texts, embeddings)
+            ]
+        )
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(texts)
+        missing = list(dict.fromkeys(t for t, k in zip(texts, keys) if k not in cached))
+        if missing:
+            embeddings = self._embed_model.get_text_embedding_batch(missing)
+            self._store(missing, embeddings)
+            cached.update(zip((self._key(t) for t in missing), embeddings))
+        return [cached[key] for key in keys]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(texts)
+        missing = list(dict.fromkeys(t for t, k in zip(texts, keys) if k not in cached))
+        if missing:
+            embeddings = await self._embed_model.aget_text_embedding_batch(missing)
+            self._store(missing, embeddings)
+            cached.update(zip((self._key(t) for t in missing), embeddings))
+        return [cached[key] for key in keys]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    # Queries are different on every call, so they go straight to the wrapped model.
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed_model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._embed_model.aget_query_embedding(query)
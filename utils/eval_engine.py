@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Sequence
+
+from llama_index.core.async_utils import asyncio_run
+from llama_index.core.base.response.schema import RESPONSE_TYPE
+from llama_index.core.evaluation import BaseEvaluator, EvaluationResult
+
+from utils.disk_cache import DiskCache
+
+# Script 12 evaluates a response and then every source node one after another, and every evaluation
+# is a blocking LLM call. EvaluationEngine runs the evaluations of many responses and their sources
+# concurrently (at most max_concurrency LLM calls at a time) and caches every verdict keyed by
+# the evaluator configuration (type, prompts, LLM), the query, the response text and the hash of every context.
+# Running the same evaluation again, e.g. a nightly suite after an unrelated change, reads unchanged pairs
+# from the cache instead of calling the LLM.
+#
+# Usage:
+#   engine = EvaluationEngine(FaithfulnessEvaluator(), max_concurrency=8)
+#   evaluations = engine.evaluate_responses(responses, per_source=True)
+#   print(engine.metrics.summary())
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = "./storage/cache/evaluation.sqlite"
+
+_RESULT_FIELDS = ("passing", "feedback", "score", "pairwise_source", "invalid_result", "invalid_reason")
+
+
+def evaluator_config(evaluator: BaseEvaluator) -> str:
+    config = {"type": type(evaluator).__name__}
+    config["prompts"] = {
+        name: prompt.get_template() for name, prompt in sorted(evaluator.get_prompts().items())
+    }
+    llm = getattr(evaluator, "_llm", None)
+    if llm is not None:
+        config["llm"] = {"type": type(llm).__name__, "model": llm.metadata.model_name}
+        config["llm"].update(
+            {k: getattr(llm, k) for k in ("temperature", "system_prompt") if hasattr(llm, k)}
+        )
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+@dataclass
+class EvaluationMetrics:
+    evaluations: int = 0
+    llm_evaluations: int = 0
+    cache_hits: int = 0
+    passing: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        rate = self.passing / self.evaluations if self.evaluations else 0.0
+        return (
+            f"{self.evaluations} evaluations in {self.elapsed:.1f}s ({self.llm_evaluations} LLM, "
+            f"{self.cache_hits} cached), {rate:.0%} passing"
+        )
+
+
+@dataclass
+class ResponseEvaluation:
+    """Evaluation of a response with all its sources, and optionally of every source on its own."""
+
+    result: EvaluationResult
+    source_results: List[EvaluationResult] = field(default_factory=list)
+
+
+class EvaluationEngine:
+    """Runs evaluations concurrently and caches their results."""
+
+    def __init__(
+        self,
+        evaluator: BaseEvaluator,
+        max_concurrency: int = 8,
+        cache_path: Optional[str] = DEFAULT_CACHE_PATH,
+    ) -> None:
+        self.evaluator = evaluator
+        self.max_concurrency = max_concurrency
+        self.metrics = EvaluationMetrics()
+        self._config = evaluator_config(evaluator)
+        self._cache = DiskCache(cache_path, max_entries=500_000) if cache_path else None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _key(self, query: Optional[str], response: Optional[str], contexts: Sequence[str]) -> str:
+        context_hashes = [hashlib.sha256(c.encode("utf-8")).hexdigest() for c in contexts]
+        payload = json.dumps([self._config, query, response, context_hashes])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, result: EvaluationResult) -> EvaluationResult:
+        self.metrics.evaluations += 1
+        self.metrics.passing += bool(result.passing)
+        return result
+
+    async def aevaluate(
+        self,
+        query: Optional[str] = None,
+        response: Optional[str] = None,
+        contexts: Sequence[str] = (),
+    ) -> EvaluationResult:
+        contexts = list(contexts)
+        key = self._key(query, response, contexts)
+        cached = self._cache.get(key) if self._cache is not None else None
+        if cached is not None:
+            self.metrics.cache_hits += 1
+            return self._count(
+                EvaluationResult(query=query, response=response, contexts=contexts, **json.loads(cached))
+            )
+
+        # A semaphore belongs to one event loop, and every asyncio_run call starts a new one.
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        async with self._semaphore:
+            result = await self.evaluator.aevaluate(query=query, response=response, contexts=contexts)
+        self.metrics.llm_evaluations += 1
+        # Invalid results (e.g. a failed LLM call) are not cached, they are tried again next time.
+        if self._cache is not None and not result.invalid_result:
+            value = {name: getattr(result, name) for name in _RESULT_FIELDS}
+            self._cache.put(key, json.dumps(value).encode("utf-8"))
+        return self._count(result)
+
+    async def aevaluate_response(
+        self, response: RESPONSE_TYPE, query: Optional[str] = None, per_source: bool = False
+    ) -> ResponseEvaluation:
+        """Evaluate `response` against all its source nodes and, with per_source, against each of them."""
+        response_str = str(response.response) if response.response is not None else None
+        contexts = [node.get_content() for node in response.source_nodes]
+        jobs = [self.aevaluate(query, response_str, contexts)]
+        if per_source:
+            jobs += [self.aevaluate(query, response_str, [context]) for context in contexts]
+        results = await asyncio.gather(*jobs)
+        return ResponseEvaluation(result=results[0], source_results=list(results[1:]))
+
+    async def aevaluate_responses(
+        self,
+        responses: Sequence[RESPONSE_TYPE],
+        queries: Optional[Sequence[Optional[str]]] = None,
+        per_source: bool = False,
+    ) -> List[ResponseEvaluation]:
+        queries = queries or [None] * len(responses)
+        evaluations = await asyncio.gather(
+            *(
+                self.aevaluate_response(response, query, per_source=per_source)
+                for response, query in zip(responses, queries)
+            )
+        )
+        logger.info(self.metrics.summary())
+        return list(evaluations)
+
+    def evaluate_response(
+        self, response: RESPONSE_TYPE, query: Optional[str] = None, per_source: bool = False
+    ) -> ResponseEvaluation:
+        return self.evaluate_responses([response], [query], per_source=per_source)[0]
+
+    def evaluate_responses(
+        self,
+        responses: Sequence[RESPONSE_TYPE],
+        queries: Optional[Sequence[Optional[str]]] = None,
+        per_source: bool = False,
+    ) -> List[ResponseEvaluation]:
+        return asyncio_run(self.aevaluate_responses(responses, queries, per_source=per_source))
+
+    def evaluate_many(self, jobs: Sequence[Any]) -> List[EvaluationResult]:
+        """Evaluate (query, response, contexts) tuples concurrently."""
+
+        async def run() -> List[EvaluationResult]:
+            return list(await asyncio.gather(*(self.aevaluate(*job) for job in jobs)))
+
+        return asyncio_run(run())
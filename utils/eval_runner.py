@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.async_utils import asyncio_run
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.evaluation import generate_question_context_pairs
+from llama_index.core.indices.base import BaseIndex
+
+from utils.eval_engine import EvaluationEngine
+from utils.local_tracing import LocalTraceHandler, capture_traces
+
+# Script 12 evaluates one hard-coded query. EvaluationRunner runs a whole file of queries through a query engine
+# or chat engine configuration, several at a time, and records for every query:
+# - whether the answer is faithful to its sources (EvaluationEngine, cached),
+# - retrieval, synthesis and total latency (from the LlamaIndex callback events, see utils/local_tracing.py),
+# - prompt and completion tokens of the LLM calls.
+#
+# Every run is appended as one JSON line to a run history with its configuration, a summary and the per-query
+# values in columns. compare_runs() puts two runs next to each other, e.g. similarity_top_k=2 against 4,
+# so the cost and the quality of a configuration can be compared.
+#
+# Queries are read from a text file (one per line) or generated from the nodes of an index with
+# generate_queries().
+#
+# Usage:
+#   queries = load_queries("./eval/queries.txt")
+#   runner = EvaluationRunner(EvaluationEngine(FaithfulnessEvaluator()), max_concurrency=4)
+#   run = runner.run("top_k=2", lambda: index.as_query_engine(similarity_top_k=2), queries, {"similarity_top_k": 2})
+#   print(format_comparison(compare_runs(run_a, run_b)))
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_PATH = "./eval/runs.jsonl"
+
+# Per-query values stored for every run, in this order.
+COLUMNS = ["passing", "retrieve_ms", "synthesize_ms", "total_ms", "prompt_tokens", "completion_tokens"]
+
+
+def load_queries(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def save_queries(queries: Sequence[str], path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(query.replace("\n", " ") + "\n" for query in queries)
+
+
+def generate_queries(
+    index: BaseIndex,
+    num_nodes: int = 20,
+    questions_per_node: int = 1,
+    llm: Optional[Any] = None,
+    seed: int = 0,
+) -> List[str]:
+    """Ask the LLM for questions about `num_nodes` randomly chosen nodes of the index."""
+    node_ids = sorted(index.docstore.docs)
+    random.Random(seed).shuffle(node_ids)
+    nodes = index.docstore.get_nodes(node_ids[:num_nodes])
+    dataset = generate_question_context_pairs(
+        nodes, llm=llm or Settings.llm, num_questions_per_chunk=questions_per_node
+    )
+    return list(dataset.queries.values())
+
+
+def _query_id(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()[:12]
+
+
+def _stats(values: Sequence[Optional[float]]) -> Dict[str, Optional[float]]:
+    values = [v for v in values if v is not None]
+    if not values:
+        return {"mean": None, "p50": None, "p95": None}
+    return {
+        "mean": float(np.mean(values)),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+    }
+
+
+def summarize(columns: Dict[str, List[Any]]) -> Dict[str, Any]:
+    passing = [p for p in columns["passing"] if p is not None]
+    return {
+        "queries": len(columns["passing"]),
+        "errors": sum(p is None for p in columns["passing"]),
+        "pass_rate": sum(passing) / len(passing) if passing else None,
+        **{name: _stats(columns[name]) for name in COLUMNS[1:]},
+    }
+
+
+class EvaluationRunner:
+    """Runs a set of queries through an engine configuration and records quality, latency and tokens."""
+
+    def __init__(
+        self,
+        evaluation_engine: EvaluationEngine,
+        max_concurrency: int = 4,
+        history_path: Optional[str] = DEFAULT_HISTORY_PATH,
+    ) -> None:
+        self.evaluation_engine = evaluation_engine
+        self.max_concurrency = max_concurrency
+        self.history_path = history_path
+
+    async def _run_query(
+        self, make_engine: Callable[[], Any], query: str, handler: LocalTraceHandler
+    ) -> Dict[str, Any]:
+        engine = make_engine()
+        with capture_traces(handler) as records:
+            if isinstance(engine, BaseQueryEngine):
+                response = await engine.aquery(query)
+            else:
+                response = await engine.achat(query)
+        evaluation = await self.evaluation_engine.aevaluate_response(response, query)
+        stages: Dict[str, float] = {}
+        prompt_tokens = completion_tokens = 0
+        for record in records:
+            for name, ms in record["stages_ms"].items():
+                stages[name] = stages.get(name, 0.0) + ms
+            prompt_tokens += record["prompt_tokens"]
+            completion_tokens += record["completion_tokens"]
+        return {
+            "passing": evaluation.result.passing,
+            "retrieve_ms": stages.get("retrieve"),
+            # Chat engines answer with a plain LLM call, without a synthesize step.
+            "synthesize_ms": stages.get("synthesize", stages.get("llm")),
+            "total_ms": sum(record["duration_ms"] for record in records),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        }
+
+    async def arun(
+        self,
+        name: str,
+        make_engine: Callable[[], Any],
+        queries: Sequence[str],
+        config: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Run `queries` through engines created by `make_engine` (one per query, so chat histories are separate)."""
+        # Reuse a handler that records every request (e.g. from enable_local_tracing), or add one for this run.
+        handler = next(
+            (
+                h
+                for h in Settings.callback_manager.handlers
+                if isinstance(h, LocalTraceHandler) and h.sample_rate >= 1.0
+            ),
+            None,
+        )
+        added = handler is None
+        if added:
+            handler = LocalTraceHandler(buffer_size=1)
+            Settings.callback_manager.add_handler(handler)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_one(query: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    return await self._run_query(make_engine, query, handler)
+                except Exception as e:
+                    logger.warning(f"{query!r} failed: {e!r}")
+                    return {column: None for column in COLUMNS}
+
+        start = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(run_one(query) for query in queries))
+        finally:
+            if added:
+                Settings.callback_manager.remove_handler(handler)
+
+        columns = {column: [result[column] for result in results] for column in COLUMNS}
+        run = {
+            "run_id": uuid.uuid4().hex[:8],
+            "name": name,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": config or {},
+            "wall_s": time.perf_counter() - start,
+            "summary": summarize(columns),
+            "query_ids": [_query_id(query) for query in queries],
+            "columns": columns,
+        }
+        if self.history_path:
+            directory = os.path.dirname(self.history_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.history_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(run, default=str) + "\n")
+        return run
+
+    def run(
+        self,
+        name: str,
+        make_engine: Callable[[], Any],
+        queries: Sequence[str],
+        config: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        return asyncio_run(self.arun(name, make_engine, queries, config))
+
+
+def load_runs(history_path: str = DEFAULT_HISTORY_PATH) -> List[Dict[str, Any]]:
+    with open(history_path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_run(runs: Sequence[Dict[str, Any]], name_or_id: str) -> Dict[str, Any]:
+    """The latest run with this run_id or name."""
+    for run in reversed(runs):
+        if name_or_id in (run["run_id"], run["name"]):
+            return run
+    raise KeyError(name_or_id)
+
+
+def compare_runs(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    """Summary metrics of two runs and their difference, over the queries both runs contain."""
+    common = set(a["query_ids"]) & set(b["query_ids"])
+
+    def restricted(run: Dict[str, Any]) -> Dict[str, Any]:
+        keep = [i for i, query_id in enumerate(run["query_ids"]) if query_id in common]
+        return summarize({column: [run["columns"][column][i] for i in keep] for column in COLUMNS})
+
+    summary_a, summary_b = restricted(a), restricted(b)
+    rows = {}
+    for metric in ["pass_rate"] + [f"{name}.{stat}" for name in COLUMNS[1:] for stat in ("mean", "p95")]:
+        if "." in metric:
+            name, stat = metric.split(".")
+            value_a, value_b = summary_a[name][stat], summary_b[name][stat]
+        else:
+            value_a, value_b = summary_a[metric], summary_b[metric]
+        delta = value_b - value_a if value_a is not None and value_b is not None else None
+        rows[metric] = {"a": value_a, "b": value_b, "delta": delta}
+    return {"a": a["name"], "b": b["name"], "queries": len(common), "metrics": rows}
+
+
+def format_comparison(comparison: Dict[str, Any]) -> str:
+    lines = [f"{'':28}{comparison['a']:>14}{comparison['b']:>14}{'delta':>12}   ({comparison['queries']} queries)"]
+    for metric, row in comparison["metrics"].items():
+        cells = [
+            "-" if value is None else f"{value:.2f}" if isinstance(value, float) else str(value)
+            for value in (row["a"], row["b"], row["delta"])
+        ]
+        lines.append(f"{metric:28}{cells[0]:>14}{cells[1]:>14}{cells[2]:>12}")
+    return "\n".join(lines)
@@ -0,0 +1,160 @@
+import logging
+import mimetypes
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from llama_index.core import Settings, SimpleDirectoryReader, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import Document
+
+from utils.manifest import file_sha256, read_manifest, write_manifest
+from utils.reader_cache import cached_file_extractor
+
+# Incremental re-ingestion. Instead of throwing the index away when a report is re-issued,
+# only the pages that changed are processed again:
+#
+# 1. Every page gets a stable id (<file path>_part_<page>) and the docstore keeps its doc_hash.
+# 2. index.refresh_ref_docs compares the hashes: new pages are inserted, changed pages are split and embedded again.
+#    With CachedEmbedding (utils/embedding_cache.py) as the embedding model, nodes of a changed page
+#    whose text did not change are still served from the cache.
+# 3. Pages that no longer exist are deleted from the docstore and the vector store.
+#
+# The default file metadata contains access and modification dates, which would change the hash
+# of every page on every run, so documents are loaded with metadata that depends only on the file.
+#
+# Usage:
+#   stats = refresh_index(index, load_documents(["./godisnje-izvjesce-2021-CA.pdf"]), ["./godisnje-izvjesce-2021-CA.pdf"])
+#   watch_directory(index, "./whitepapers", "./storage/whitepapers")
+
+logger = logging.getLogger(__name__)
+
+
+def stable_file_metadata(file_path: str) -> Dict[str, str]:
+    return {
+        "file_path": file_path,
+        "file_name": os.path.basename(file_path),
+        "file_type": mimetypes.guess_type(file_path)[0] or "",
+    }
+
+
+def load_documents(input_files: List[str]) -> List[Document]:
+    return SimpleDirectoryReader(
+        input_files=input_files,
+        filename_as_id=True,
+        file_metadata=stable_file_metadata,
+        file_extractor=cached_file_extractor(),
+    ).load_data()
+
+
+@dataclass
+class RefreshStats:
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+    unchanged: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserted or self.updated or self.deleted)
+
+
+def _same_file(a: str, b: str) -> bool:
+    return os.path.normpath(os.path.abspath(a)) == os.path.normpath(os.path.abspath(b))
+
+
+def delete_stale_documents(
+    index: VectorStoreIndex, source_files: Iterable[str], keep_ids: Iterable[str]
+) -> int:
+    """Delete documents of `source_files` from the index whose id is not in `keep_ids`."""
+    source_files = list(source_files)
+    keep_ids = set(keep_ids)
+    deleted = 0
+    for ref_doc_id, info in index.ref_doc_info.items():
+        file_path = (info.metadata or {}).get("file_path")
+        if ref_doc_id in keep_ids or file_path is None:
+            continue
+        if any(_same_file(file_path, source) for source in source_files):
+            index.delete_ref_doc(ref_doc_id, delete_from_docstore=True)
+            deleted += 1
+    return deleted
+
+
+def refresh_index(
+    index: VectorStoreIndex, documents: Sequence[Document], source_files: Iterable[str]
+) -> RefreshStats:
+    """Apply new versions of `source_files` to the index, processing only new and changed pages."""
+    stats = RefreshStats()
+    for document in documents:
+        existing_hash = index.docstore.get_document_hash(document.doc_id)
+        if existing_hash is None:
+            stats.inserted += 1
+        elif existing_hash != document.hash:
+            stats.updated += 1
+        else:
+            stats.unchanged += 1
+    index.refresh_ref_docs(documents)
+    stats.deleted = delete_stale_documents(
+        index, source_files, keep_ids=[document.doc_id for document in documents]
+    )
+    logger.info(
+        f"Refreshed index: {stats.inserted} inserted, {stats.updated} updated, "
+        f"{stats.deleted} deleted, {stats.unchanged} unchanged pages"
+    )
+    return stats
+
+
+def _list_files(
+    input_dir: str, required_exts: Optional[List[str]], recursive: bool
+) -> List[str]:
+    reader = SimpleDirectoryReader(
+        input_dir=input_dir, required_exts=required_exts, recursive=recursive
+    )
+    return [str(path) for path in reader.input_files]
+
+
+def watch_directory(
+    index: VectorStoreIndex,
+    input_dir: str,
+    persist_dir: str,
+    required_exts: Optional[List[str]] = None,
+    recursive: bool = True,
+    interval: float = 2.0,
+    max_iterations: Optional[int] = None,
+    embed_model: Optional[BaseEmbedding] = None,
+) -> None:
+    """Poll `input_dir` and apply added, edited and removed files to the index.
+
+    The index and its manifest are persisted to `persist_dir` after every change.
+    """
+    embed_model = embed_model or Settings.embed_model
+    # Files recorded in the manifest are already in the index and are not parsed again.
+    manifest = read_manifest(persist_dir) or {}
+    known: Dict[str, str] = dict(manifest.get("sources", {}))
+    iteration = 0
+    while max_iterations is None or iteration < max_iterations:
+        iteration += 1
+        try:
+            files = _list_files(input_dir, required_exts, recursive)
+        except ValueError:
+            # SimpleDirectoryReader raises when the directory is empty.
+            files = []
+        hashes = {os.path.normpath(path): file_sha256(path) for path in files}
+
+        changed = [path for path, sha in hashes.items() if known.get(path) != sha]
+        removed = [path for path in known if path not in hashes]
+
+        if changed or removed:
+            if changed:
+                documents = load_documents(changed)
+                refresh_index(index, documents, changed)
+            if removed:
+                delete_stale_documents(index, removed, keep_ids=[])
+            index.storage_context.persist(persist_dir=persist_dir)
+            write_manifest(persist_dir, files, embed_model)
+            logger.info(f"Applied {len(changed)} changed and {len(removed)} removed files")
+
+        known = hashes
+        if max_iterations is None or iteration < max_iterations:
+            time.sleep(interval)
@@ -0,0 +1,226 @@
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from llama_index.core import (
+    Settings,
+    StorageContext,
+    VectorStoreIndex,
+    load_index_from_storage,
+)
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.index_store import SimpleIndexStore
+from llama_index.core.storage.kvstore import SimpleKVStore
+
+from utils.incremental import load_documents, refresh_index
+from utils.manifest import MANIFEST_FNAME, embed_model_id, file_sha256, read_manifest, write_manifest
+from utils.numpy_store import NumpyVectorStore
+
+# Scripts 2, 9, 11 and 12 used to repeat the same block: load the index from ./storage/<year>,
+# and on any exception rebuild everything from the PDF. load_index replaces that block.
+#
+# Next to the stores, a manifest.json records the hash of every source file and the embedding model.
+# Before loading, the persist dir is checked against the manifest, the reason for every rebuild is logged,
+# and only the missing part is rebuilt:
+# - missing docstore or index store -> parse the PDF and build the index again,
+# - changed source file -> apply only the changed pages (see utils/incremental.py),
+# - missing vector store or a different embedding model -> embed the nodes already in the docstore again.
+#
+# Embeddings are kept in a NumpyVectorStore (see utils/numpy_store.py), which reads and writes
+# the same default__vector_store.json as SimpleVectorStore.
+#
+# Usage:
+#   index = load_index("./storage/2021", input_files=["./godisnje-izvjesce-2021-CA.pdf"])
+
+logger = logging.getLogger(__name__)
+
+DOCSTORE_FNAME = "docstore.json"
+INDEX_STORE_FNAME = "index_store.json"
+VECTOR_STORE_FNAME = "default__vector_store.json"
+
+
+class LazySimpleKVStore(SimpleKVStore):
+    """SimpleKVStore that reads its JSON file on first access instead of at construction.
+
+    Every method is passed to a SimpleKVStore loaded with the public from_persist_path, so the class does not
+    depend on how SimpleKVStore keeps its data (a private attribute that differs between llama-index versions).
+    """
+
+    def __init__(self, persist_path: str) -> None:
+        super().__init__()
+        self._persist_path = persist_path
+        self._store: Optional[SimpleKVStore] = None
+
+    @property
+    def store(self) -> SimpleKVStore:
+        if self._store is None:
+            logger.debug(f"Loading {self._persist_path}")
+            self._store = SimpleKVStore.from_persist_path(self._persist_path)
+        return self._store
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._store is not None
+
+    def put(self, *args: Any, **kwargs: Any) -> None:
+        self.store.put(*args, **kwargs)
+
+    async def aput(self, *args: Any, **kwargs: Any) -> None:
+        await self.store.aput(*args, **kwargs)
+
+    def put_all(self, *args: Any, **kwargs: Any) -> None:
+        self.store.put_all(*args, **kwargs)
+
+    async def aput_all(self, *args: Any, **kwargs: Any) -> None:
+        await self.store.aput_all(*args, **kwargs)
+
+    def get(self, *args: Any, **kwargs: Any) -> Optional[dict]:
+        return self.store.get(*args, **kwargs)
+
+    async def aget(self, *args: Any, **kwargs: Any) -> Optional[dict]:
+        return await self.store.aget(*args, **kwargs)
+
+    def get_all(self, *args: Any, **kwargs: Any) -> Dict[str, dict]:
+        return self.store.get_all(*args, **kwargs)
+
+    async def aget_all(self, *args: Any, **kwargs: Any) -> Dict[str, dict]:
+        return await self.store.aget_all(*args, **kwargs)
+
+    def delete(self, *args: Any, **kwargs: Any) -> bool:
+        return self.store.delete(*args, **kwargs)
+
+    async def adelete(self, *args: Any, **kwargs: Any) -> bool:
+        return await self.store.adelete(*args, **kwargs)
+
+    def persist(self, *args: Any, **kwargs: Any) -> None:
+        self.store.persist(*args, **kwargs)
+
+    def to_dict(self) -> dict:
+        return self.store.to_dict()
+
+
+def lazy_docstore(persist_dir: str) -> SimpleDocumentStore:
+    return SimpleDocumentStore(
+        simple_kvstore=LazySimpleKVStore(os.path.join(persist_dir, DOCSTORE_FNAME))
+    )
+
+
+@dataclass
+class PersistDirCheck:
+    """Result of comparing a persist dir with its manifest and the current source files."""
+
+    missing_files: List[str] = field(default_factory=list)
+    changed_sources: List[str] = field(default_factory=list)
+    embed_model_changed: bool = False
+    has_manifest: bool = True
+
+    @property
+    def has_stores(self) -> bool:
+        return (
+            DOCSTORE_FNAME not in self.missing_files
+            and INDEX_STORE_FNAME not in self.missing_files
+        )
+
+    @property
+    def needs_embed(self) -> bool:
+        return VECTOR_STORE_FNAME in self.missing_files or self.embed_model_changed
+
+    @property
+    def reasons(self) -> List[str]:
+        reasons = [f"{name} is missing" for name in self.missing_files]
+        reasons += [f"{path} changed since the index was built" for path in self.changed_sources]
+        if self.embed_model_changed:
+            reasons.append("index was built with a different embedding model")
+        return reasons
+
+
+def check_persist_dir(
+    persist_dir: str, input_files: List[str], embed_model: BaseEmbedding
+) -> PersistDirCheck:
+    check = PersistDirCheck()
+    for fname in (DOCSTORE_FNAME, INDEX_STORE_FNAME, VECTOR_STORE_FNAME):
+        if not os.path.exists(os.path.join(persist_dir, fname)):
+            check.missing_files.append(fname)
+
+    manifest = read_manifest(persist_dir)
+    if manifest is None:
+        check.has_manifest = False
+        return check
+
+    sources = manifest.get("sources", {})
+    for path in input_files:
+        if sources.get(os.path.normpath(path)) != file_sha256(path):
+            check.changed_sources.append(path)
+    check.embed_model_changed = manifest.get("embed_model") != embed_model_id(embed_model)
+    return check
+
+
+def _build_from_files(input_files: List[str], embed_model: BaseEmbedding) -> VectorStoreIndex:
+    # Pages get stable ids, so later versions of the files can be applied incrementally.
+    storage_context = StorageContext.from_defaults(vector_store=NumpyVectorStore())
+    return VectorStoreIndex.from_documents(
+        load_documents(input_files), storage_context=storage_context, embed_model=embed_model
+    )
+
+
+def _build_from_docstore(persist_dir: str, embed_model: BaseEmbedding) -> VectorStoreIndex:
+    # The nodes are already parsed and split, only their embeddings are created again.
+    docstore = SimpleDocumentStore.from_persist_dir(persist_dir)
+    index_structs = SimpleIndexStore.from_persist_dir(persist_dir).index_structs()
+    if index_structs and getattr(index_structs[0], "nodes_dict", None):
+        nodes = docstore.get_nodes(list(index_structs[0].nodes_dict.values()))
+    else:
+        nodes = list(docstore.docs.values())
+    storage_context = StorageContext.from_defaults(docstore=docstore, vector_store=NumpyVectorStore())
+    return VectorStoreIndex(nodes, storage_context=storage_context, embed_model=embed_model)
+
+
+def _load(persist_dir: str, embed_model: BaseEmbedding) -> VectorStoreIndex:
+    storage_context = StorageContext.from_defaults(
+        docstore=lazy_docstore(persist_dir),
+        index_store=SimpleIndexStore.from_persist_dir(persist_dir),
+        vector_store=NumpyVectorStore.from_persist_dir(persist_dir),
+    )
+    return load_index_from_storage(storage_context, embed_model=embed_model)
+
+
+def load_index(
+    persist_dir: str,
+    input_files: List[str],
+    embed_model: Optional[BaseEmbedding] = None,
+) -> VectorStoreIndex:
+    """Load the index persisted in `persist_dir`, rebuilding only what is missing or outdated."""
+    embed_model = embed_model or Settings.embed_model
+    check = check_persist_dir(persist_dir, input_files, embed_model)
+
+    if not check.has_manifest and os.path.isdir(persist_dir):
+        logger.warning(
+            f"{persist_dir} has no {MANIFEST_FNAME}, source files cannot be verified. "
+            "A manifest will be written for the current files."
+        )
+
+    if not check.has_stores:
+        logger.warning(f"Rebuilding {persist_dir} from source files: {'; '.join(check.reasons)}")
+        index = _build_from_files(input_files, embed_model)
+    else:
+        if check.needs_embed:
+            logger.warning(f"Re-embedding nodes in {persist_dir}: {'; '.join(check.reasons)}")
+            index = _build_from_docstore(persist_dir, embed_model)
+        else:
+            index = _load(persist_dir, embed_model)
+
+        if check.changed_sources:
+            logger.warning(
+                f"Refreshing {persist_dir} incrementally: {'; '.join(check.reasons)}"
+            )
+            refresh_index(index, load_documents(check.changed_sources), check.changed_sources)
+        elif not check.needs_embed:
+            if not check.has_manifest:
+                write_manifest(persist_dir, input_files, embed_model)
+            return index
+
+    index.storage_context.persist(persist_dir=persist_dir)
+    write_manifest(persist_dir, input_files, embed_model)
+    return index
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from llama_index.core import QueryBundle, Settings, VectorStoreIndex
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.response.schema import RESPONSE_TYPE
+
+from utils.index_loader import load_index
+from utils.manifest import MANIFEST_FNAME, read_manifest, write_manifest
+
+# Script 9 used to load (or rebuild) the index of every yearly report before the agent could answer,
+# even when a question is about a single year. With ~15 reports, start-up time and memory grow with
+# the number of configured years.
+#
+# A QueryEngineTool with a LazyQueryEngine only holds its name and description at start-up.
+# The index in persist_dir is loaded with load_index the first time the agent calls the tool.
+# Loaded indexes are kept in an IndexPool, which holds at most max_resident indexes and drops the least
+# recently used one when another is needed. pool.prefetch() loads an index in a background thread,
+# e.g. for the report that is asked about most often.
+#
+# Usage:
+#   pool = IndexPool(max_resident=3)
+#   engine = LazyQueryEngine(pool, "./storage/2021", ["./godisnje-izvjesce-2021-CA.pdf"], similarity_top_k=3)
+#   tool = QueryEngineTool(query_engine=engine, metadata=ToolMetadata(name=..., description=...))
+#   pool.prefetch("./storage/2022", ["./godisnje-izvjesce-2022-CA.pdf"])   # optional
+
+logger = logging.getLogger(__name__)
+
+
+class IndexPool:
+    """Loads indexes on demand and keeps at most `max_resident` of them in memory (LRU)."""
+
+    def __init__(
+        self,
+        max_resident: int = 3,
+        embed_model: Optional[BaseEmbedding] = None,
+        prefetch_workers: int = 1,
+    ) -> None:
+        self.max_resident = max_resident
+        self.embed_model = embed_model
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._indexes: "OrderedDict[str, VectorStoreIndex]" = OrderedDict()
+        self._loading: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=prefetch_workers, thread_name_prefix="index-prefetch"
+        )
+
+    @property
+    def resident(self) -> List[str]:
+        with self._lock:
+            return list(self._indexes)
+
+    def get(self, persist_dir: str, input_files: List[str]) -> VectorStoreIndex:
+        key = os.path.normpath(persist_dir)
+        with self._lock:
+            if key in self._indexes:
+                self._indexes.move_to_end(key)
+                self.hits += 1
+                return self._indexes[key]
+            # If the same index is already being loaded (e.g. by prefetch), wait for it.
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._loading[key] = future
+        if not owner:
+            return future.result()
+
+        try:
+            start = time.perf_counter()
+            index = load_index(persist_dir, input_files=input_files, embed_model=self.embed_model)
+            logger.info(f"Loaded {persist_dir} in {time.perf_counter() - start:.1f}s")
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self.loads += 1
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_resident:
+                evicted, _ = self._indexes.popitem(last=False)
+                self.evictions += 1
+                logger.info(f"Evicted {evicted} from the index pool")
+            del self._loading[key]
+        future.set_result(index)
+        return index
+
+    def prefetch(self, persist_dir: str, input_files: List[str]) -> Future:
+        """Load an index in the background.
+
+        A failed load is reported through the returned future, and the next get() tries to load the index again.
+        """
+        return self._executor.submit(self.get, persist_dir, input_files)
+
+    def evict(self, persist_dir: str) -> None:
+        with self._lock:
+            self._indexes.pop(os.path.normpath(persist_dir), None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "resident": self.resident,
+            "loads": self.loads,
+            "hits": self.hits,
+            "evictions": self.evictions,
+        }
+
+
+class LazyQueryEngine(BaseQueryEngine):
+    """Query engine over the index in `persist_dir`, loaded through an IndexPool on the first query."""
+
+    def __init__(
+        self,
+        pool: IndexPool,
+        persist_dir: str,
+        input_files: List[str],
+        **query_engine_kwargs: Any,
+    ) -> None:
+        self._pool = pool
+        self.persist_dir = persist_dir
+        self.input_files = input_files
+        self._query_engine_kwargs = query_engine_kwargs
+        self._version_stat: Optional[Tuple[int, int]] = None
+        self._version: Any = None
+        super().__init__(callback_manager=None)
+
+    def _get_prompt_modules(self) -> Dict[str, Any]:
+        return {}
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        """The model the index is loaded with, so a CachedQueryEngine can embed the query once for both."""
+        return self._pool.embed_model or Settings.embed_model
+
+    def version(self) -> Any:
+        """Changes when load_index rebuilds the index from other source files or another embedding model.
+
+        Read from manifest.json (parsed again only when the file changes), does not load the index,
+        so it can be used as version_fn of a CachedQueryEngine.
+        """
+        manifest_path = os.path.join(self.persist_dir, MANIFEST_FNAME)
+        if not os.path.exists(manifest_path):
+            # A persisted index without a manifest (e.g. the checked-in ./storage) gets one for the current files,
+            # as load_index would write it on the first load, so the version is the same before and after that load.
+            # Done on the first call, not when the tool is created.
+            if not os.path.isdir(self.persist_dir) or not all(os.path.exists(p) for p in self.input_files):
+                return None
+            write_manifest(self.persist_dir, self.input_files, self._pool.embed_model or Settings.embed_model)
+        stat = os.stat(manifest_path)
+        if (stat.st_mtime_ns, stat.st_size) != self._version_stat:
+            manifest = read_manifest(self.persist_dir) or {}
+            # Only the inputs of the index: rewriting the manifest after a load with the same files keeps the version.
+            self._version = (tuple(sorted(manifest.get("sources", {}).items())), manifest.get("embed_model"))
+            self._version_stat = (stat.st_mtime_ns, stat.st_size)
+        return self._version
+
+    def _engine(self, index: VectorStoreIndex) -> BaseQueryEngine:
+        # Built for every query, so an evicted index is not kept alive by this engine.
+        return index.as_query_engine(**self._query_engine_kwargs)
+
+    def _query(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        index = self._pool.get(self.persist_dir, self.input_files)
+        return self._engine(index).query(query_bundle)
+
+    async def _aquery(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        index = await asyncio.to_thread(self._pool.get, self.persist_dir, self.input_files)
+        return await self._engine(index).aquery(query_bundle)
+
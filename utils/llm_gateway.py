@@ -0,0 +1,719 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Deque, Dict, Generator, List, Optional, Sequence
+
+import httpx
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms.llm import LLM
+
+from utils.rate_limit import TokenBucket
+
+# Every script creates its own OpenAI(...) (or Groq(...) in script 6) and calls it with no limit on concurrent
+# requests and no coordination against the provider's rate limits: under load, requests fail with 429 or wait
+# behind a batch job, and one slow provider slows every answer down.
+#
+# LLMGateway is shared by all LLM calls of a process:
+# - connection pooling: OpenAI-compatible LLMs created with gateway.openai() / gateway.groq() share one httpx
+#   client with keep-alive connections, instead of opening new connections per LLM instance,
+# - a scheduler per model with a concurrency limit and token buckets for requests/min and tokens/min (the prompt
+#   tokens plus max_tokens are reserved, the unused part is given back when the response reports its usage),
+# - priority lanes: a free slot always goes to an "interactive" request (chat) before a "batch" request
+#   (extraction, evaluation), even if the batch request has been waiting longer,
+# - retries with jittered exponential backoff on 429, 5xx, timeouts and connection errors; a 429 with Retry-After
+#   pauses the whole model, so the other callers do not hit the limit as well,
+# - fallback to the next provider when one fails after its retries, or when its recent latency is above
+#   slow_threshold_ms (it is moved to the end of the list for `cooldown` seconds), and optional hedged requests:
+#   with hedge_after, a request that has not been answered in that many seconds is also sent to the next
+#   provider, and the first answer wins (this costs the tokens of both requests).
+#
+# Streaming calls are retried and fall back only until the first token arrives, and are not hedged.
+#
+# Usage:
+#   gateway = LLMGateway()
+#   gateway.add_provider("gpt-4o-mini", gateway.openai(model="gpt-4o-mini"), requests_per_minute=500,
+#                        tokens_per_minute=200_000)
+#   gateway.add_provider("groq", gateway.groq(model="llama3-70b-8192"), requests_per_minute=30)
+#   Settings.llm = gateway.llm(priority="interactive", hedge_after=5.0)
+#   extraction_llm = gateway.llm(priority="batch", providers=["gpt-4o-mini"])
+#   print(gateway.metrics.summary())
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+# Approximate tokens used by the role and separators of every message.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    code = getattr(error, "status_code", None)
+    if code is None and isinstance(getattr(error, "response", None), httpx.Response):
+        code = error.response.status_code
+    return code
+
+
+def is_retryable(error: BaseException) -> bool:
+    code = status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS_CODES
+    # openai.APITimeoutError and APIConnectionError have no status code, the same holds for other SDKs.
+    name = type(error).__name__
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError)) or (
+        "Timeout" in name or "Connection" in name
+    )
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if isinstance(response, httpx.Response) else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def used_tokens(response: Any) -> Optional[int]:
+    """Total tokens reported by the provider, if the raw response has them."""
+    raw = getattr(response, "raw", None)
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if usage is None:
+        return None
+    total = usage.get("total_tokens") if isinstance(usage, dict) else getattr(usage, "total_tokens", None)
+    return total if isinstance(total, int) else None
+
+
+@dataclass
+class GatewayMetrics:
+    requests: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    failures: int = 0
+    fallbacks: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    # Seconds requests waited for the scheduler, per lane, for the last 10000 requests.
+    queue_s: Dict[str, Deque[float]] = field(
+        default_factory=lambda: {lane: deque(maxlen=10_000) for lane in PRIORITIES}
+    )
+
+    def summary(self) -> str:
+        waits = []
+        for lane, values in self.queue_s.items():
+            if values:
+                p50, p99 = np.percentile(np.array(values) * 1000, [50, 99])
+                waits.append(f"{lane} queue p50 {p50:.0f} ms, p99 {p99:.0f} ms")
+        return (
+            f"{self.requests} requests, {self.retries} retries ({self.rate_limited} rate limited), "
+            f"{self.failures} failed, {self.fallbacks} fallbacks, {self.hedges} hedged ({self.hedge_wins} won)"
+            + (f"; {'; '.join(waits)}" if waits else "")
+        )
+
+
+class _Waiter:
+    __slots__ = ("tokens", "event", "loop", "future", "granted", "cancelled")
+
+    def __init__(self, tokens: float) -> None:
+        self.tokens = tokens
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+        self.granted = False
+        self.cancelled = False
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class ModelScheduler:
+    """Concurrency slots and rate limits of one model, handed out in priority order."""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 16,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ) -> None:
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.active = 0
+        self._heap: List[Any] = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._timer_due = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._heap)
+
+    def _take(self, tokens: float) -> float:
+        """Take one request and `tokens` from the buckets, or return how long to wait for them."""
+        if self.requests is not None:
+            wait = self.requests.try_acquire(1)
+            if wait > 0:
+                return wait
+        if self.tokens is not None and tokens:
+            wait = self.tokens.try_acquire(tokens)
+            if wait > 0:
+                if self.requests is not None:
+                    self.requests.refund(1)
+                return wait
+        return 0.0
+
+    def _dispatch(self) -> None:
+        # Called with the lock held.
+        while self._heap and self.active < self.max_concurrency:
+            waiter = self._heap[0][2]
+            if waiter.cancelled:
+                heapq.heappop(self._heap)
+                continue
+            wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                wait = self._take(waiter.tokens)
+            if wait > 0:
+                # Nobody else may overtake the first waiter, otherwise batch requests would starve
+                # an interactive request that needs more tokens.
+                self._wake_later(wait)
+                return
+            heapq.heappop(self._heap)
+            self.active += 1
+            waiter.granted = True
+            waiter.wake()
+
+    def _wake_later(self, wait: float) -> None:
+        due = time.monotonic() + wait
+        if self._timer is not None and self._timer_due <= due:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(wait, self._on_timer)
+        self._timer.daemon = True
+        self._timer_due = due
+        self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _enqueue(self, waiter: _Waiter, priority: int) -> None:
+        with self._lock:
+            heapq.heappush(self._heap, (priority, next(self._sequence), waiter))
+            self._dispatch()
+
+    def acquire(self, priority: int = 0, tokens: float = 0) -> None:
+        waiter = _Waiter(tokens)
+        waiter.event = threading.Event()
+        self._enqueue(waiter, priority)
+        waiter.event.wait()
+
+    async def aacquire(self, priority: int = 0, tokens: float = 0) -> None:
+        waiter = _Waiter(tokens)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        self._enqueue(waiter, priority)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self.active -= 1
+                    self._dispatch()
+                else:
+                    waiter.cancelled = True
+            raise
+
+    def release(self, reserved_tokens: float = 0, used: Optional[int] = None) -> None:
+        if self.tokens is not None and used is not None and used < reserved_tokens:
+            self.tokens.refund(reserved_tokens - used)
+        with self._lock:
+            self.active -= 1
+            self._dispatch()
+
+    def pause(self, seconds: float) -> None:
+        """Hold all requests of this model, e.g. after a 429 with Retry-After."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._dispatch()
+
+
+@dataclass
+class Provider:
+    name: str
+    llm: LLM
+    scheduler: ModelScheduler
+    # Exponentially weighted latency of successful calls.
+    latency_ms: Optional[float] = None
+    demoted_until: float = 0.0
+
+
+class LLMGateway:
+    """Shared connection pool, per-model schedulers, retries and fallback for all LLM calls of a process."""
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 60.0,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        slow_threshold_ms: Optional[float] = None,
+        cooldown: float = 30.0,
+        completion_tokens: int = 512,
+    ) -> None:
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.slow_threshold_ms = slow_threshold_ms
+        self.cooldown = cooldown
+        self.completion_tokens = completion_tokens
+        self.metrics = GatewayMetrics()
+        self.providers: Dict[str, Provider] = {}
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http_client = httpx.Client(limits=limits, timeout=timeout)
+        # The async client keeps its connections in the event loop that used it first (e.g. a server's loop).
+        self.async_http_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+
+    def _pooled_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        kwargs.setdefault("http_client", self.http_client)
+        kwargs.setdefault("async_http_client", self.async_http_client)
+        # Retries are done by the gateway, so they are coordinated with the scheduler.
+        kwargs.setdefault("max_retries", 0)
+        return kwargs
+
+    def openai(self, **kwargs: Any) -> LLM:
+        """OpenAI LLM that uses the gateway's connection pool."""
+        from llama_index.llms.openai import OpenAI
+
+        return OpenAI(**self._pooled_kwargs(kwargs))
+
+    def groq(self, **kwargs: Any) -> LLM:
+        """Groq LLM (OpenAI-compatible API) that uses the gateway's connection pool."""
+        from llama_index.llms.groq import Groq
+
+        return Groq(**self._pooled_kwargs(kwargs))
+
+    def add_provider(
+        self,
+        name: str,
+        llm: LLM,
+        max_concurrency: int = 16,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ) -> Provider:
+        """Register an LLM. Providers are tried in the order they were added."""
+        provider = Provider(
+            name, llm, ModelScheduler(name, max_concurrency, requests_per_minute, tokens_per_minute)
+        )
+        self.providers[name] = provider
+        return provider
+
+    def llm(
+        self,
+        priority: str = "interactive",
+        providers: Optional[Sequence[str]] = None,
+        hedge_after: Optional[float] = None,
+    ) -> "GatewayLLM":
+        """LLM that sends its calls through the gateway, usable as Settings.llm or in any engine."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {list(PRIORITIES)}")
+        names = list(providers or self.providers)
+        unknown = [name for name in names if name not in self.providers]
+        if unknown or not names:
+            raise ValueError(f"Unknown or no providers: {unknown or names}, registered: {list(self.providers)}")
+        # Providers receive the formatted messages, LLM.predict/stream only add the system prompt of the lane,
+        # so the lane takes it (and the prompt formatting) from its providers.
+        system_prompts = {self.providers[name].llm.system_prompt for name in names}
+        if len(system_prompts) > 1:
+            raise ValueError(f"Providers {names} have different system prompts: {system_prompts}")
+        first = self.providers[names[0]].llm
+        llm = GatewayLLM(
+            priority=priority,
+            providers=names,
+            hedge_after=hedge_after,
+            system_prompt=first.system_prompt,
+            messages_to_prompt=first.messages_to_prompt,
+            completion_to_prompt=first.completion_to_prompt,
+        )
+        llm._gateway = self
+        return llm
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self.http_client.close()
+
+    # Provider selection and retries.
+
+    def _order(self, names: Sequence[str]) -> List[Provider]:
+        now = time.monotonic()
+        providers = [self.providers[name] for name in names]
+        # Demoted providers are tried last, in their configured order.
+        return sorted(providers, key=lambda p: p.demoted_until > now)
+
+    def _observe(self, provider: Provider, elapsed_ms: float) -> None:
+        provider.latency_ms = (
+            elapsed_ms if provider.latency_ms is None else 0.8 * provider.latency_ms + 0.2 * elapsed_ms
+        )
+        if self.slow_threshold_ms is not None and provider.latency_ms > self.slow_threshold_ms:
+            logger.warning(f"{provider.name} is slow ({provider.latency_ms:.0f} ms), trying others first")
+            provider.demoted_until = time.monotonic() + self.cooldown
+            provider.latency_ms = None
+
+    def _retry_delay(self, provider: Provider, error: Exception, attempt: int) -> Optional[float]:
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        self.metrics.retries += 1
+        if status_code(error) == 429:
+            self.metrics.rate_limited += 1
+            seconds = retry_after(error)
+            if seconds:
+                provider.scheduler.pause(seconds)
+        # Full jitter, so callers that failed together do not retry together.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def _failed(self, provider: Provider, error: Exception) -> None:
+        logger.warning(f"{provider.name} failed: {error!r}")
+        self.metrics.failures += 1
+        provider.demoted_until = time.monotonic() + self.cooldown
+
+    def _estimate(self, provider: Provider, prompt_tokens: int) -> int:
+        max_tokens = getattr(provider.llm, "max_tokens", None)
+        return prompt_tokens + (max_tokens or self.completion_tokens)
+
+    # Synchronous calls.
+
+    def _attempt(
+        self,
+        provider: Provider,
+        method: str,
+        args: Sequence[Any],
+        kwargs: Dict[str, Any],
+        priority: str,
+        prompt_tokens: int,
+    ) -> Any:
+        tokens = self._estimate(provider, prompt_tokens)
+        for attempt in itertools.count():
+            queued = time.perf_counter()
+            provider.scheduler.acquire(PRIORITIES[priority], tokens)
+            self.metrics.queue_s[priority].append(time.perf_counter() - queued)
+            start = time.perf_counter()
+            try:
+                response = getattr(provider.llm, method)(*args, **kwargs)
+            except Exception as e:
+                provider.scheduler.release()
+                delay = self._retry_delay(provider, e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            provider.scheduler.release(tokens, used_tokens(response))
+            self._observe(provider, (time.perf_counter() - start) * 1000)
+            return response
+
+    def _with_fallback(self, providers: Sequence[Provider], *call: Any) -> Any:
+        for i, provider in enumerate(providers):
+            try:
+                return self._attempt(provider, *call)
+            except Exception as e:
+                self._failed(provider, e)
+                if i == len(providers) - 1:
+                    raise
+                self.metrics.fallbacks += 1
+
+    def call(self, names: Sequence[str], hedge_after: Optional[float], *call: Any) -> Any:
+        self.metrics.requests += 1
+        providers = self._order(names)
+        if hedge_after is None or len(providers) < 2:
+            return self._with_fallback(providers, *call)
+
+        primary = self._executor.submit(self._with_fallback, providers[:1], *call)
+        done, _ = wait_futures([primary], timeout=hedge_after)
+        if done and primary.exception() is None:
+            return primary.result()
+        if done:
+            self.metrics.fallbacks += 1
+            return self._with_fallback(providers[1:], *call)
+        self.metrics.hedges += 1
+        hedge = self._executor.submit(self._with_fallback, providers[1:], *call)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The slower request runs to the end in the background, its answer is dropped.
+                    self.metrics.hedge_wins += future is hedge
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stream(
+        self,
+        names: Sequence[str],
+        method: str,
+        args: Sequence[Any],
+        kwargs: Dict[str, Any],
+        priority: str,
+        prompt_tokens: int,
+    ) -> Generator[Any, None, None]:
+        self.metrics.requests += 1
+        providers = self._order(names)
+        for i, provider in enumerate(providers):
+            tokens = self._estimate(provider, prompt_tokens)
+            for attempt in itertools.count():
+                queued = time.perf_counter()
+                provider.scheduler.acquire(PRIORITIES[priority], tokens)
+                self.metrics.queue_s[priority].append(time.perf_counter() - queued)
+                start = time.perf_counter()
+                try:
+                    generator = getattr(provider.llm, method)(*args, **kwargs)
+                    first = next(generator, None)
+                except Exception as e:
+                    provider.scheduler.release()
+                    delay = self._retry_delay(provider, e, attempt)
+                    if delay is None:
+                        self._failed(provider, e)
+                        error = e
+                        break
+                    time.sleep(delay)
+                    continue
+                try:
+                    self._observe(provider, (time.perf_counter() - start) * 1000)
+                    if first is not None:
+                        yield first
+                        yield from generator
+                finally:
+                    provider.scheduler.release()
+                return
+            if i == len(providers) - 1:
+                raise error
+            self.metrics.fallbacks += 1
+
+    # Asynchronous calls.
+
+    async def _aattempt(
+        self,
+        provider: Provider,
+        method: str,
+        args: Sequence[Any],
+        kwargs: Dict[str, Any],
+        priority: str,
+        prompt_tokens: int,
+    ) -> Any:
+        tokens = self._estimate(provider, prompt_tokens)
+        for attempt in itertools.count():
+            queued = time.perf_counter()
+            await provider.scheduler.aacquire(PRIORITIES[priority], tokens)
+            self.metrics.queue_s[priority].append(time.perf_counter() - queued)
+            start = time.perf_counter()
+            try:
+                response = await getattr(provider.llm, method)(*args, **kwargs)
+            except Exception as e:
+                provider.scheduler.release()
+                delay = self._retry_delay(provider, e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            except asyncio.CancelledError:
+                provider.scheduler.release()
+                raise
+            provider.scheduler.release(tokens, used_tokens(response))
+            self._observe(provider, (time.perf_counter() - start) * 1000)
+            return response
+
+    async def _awith_fallback(self, providers: Sequence[Provider], *call: Any) -> Any:
+        for i, provider in enumerate(providers):
+            try:
+                return await self._aattempt(provider, *call)
+            except Exception as e:
+                self._failed(provider, e)
+                if i == len(providers) - 1:
+                    raise
+                self.metrics.fallbacks += 1
+
+    async def acall(self, names: Sequence[str], hedge_after: Optional[float], *call: Any) -> Any:
+        self.metrics.requests += 1
+        providers = self._order(names)
+        if hedge_after is None or len(providers) < 2:
+            return await self._awith_fallback(providers, *call)
+
+        primary = asyncio.ensure_future(self._awith_fallback(providers[:1], *call))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done and primary.exception() is None:
+            return primary.result()
+        if done:
+            self.metrics.fallbacks += 1
+            return await self._awith_fallback(providers[1:], *call)
+        self.metrics.hedges += 1
+        hedge = asyncio.ensure_future(self._awith_fallback(providers[1:], *call))
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.metrics.hedge_wins += task is hedge
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def astream(
+        self,
+        names: Sequence[str],
+        method: str,
+        args: Sequence[Any],
+        kwargs: Dict[str, Any],
+        priority: str,
+        prompt_tokens: int,
+    ) -> AsyncGenerator[Any, None]:
+        self.metrics.requests += 1
+        providers = self._order(names)
+        for i, provider in enumerate(providers):
+            tokens = self._estimate(provider, prompt_tokens)
+            for attempt in itertools.count():
+                queued = time.perf_counter()
+                await provider.scheduler.aacquire(PRIORITIES[priority], tokens)
+                self.metrics.queue_s[priority].append(time.perf_counter() - queued)
+                start = time.perf_counter()
+                try:
+                    generator = await getattr(provider.llm, method)(*args, **kwargs)
+                    first = await generator.__anext__()
+                except StopAsyncIteration:
+                    provider.scheduler.release()
+                    return
+                except Exception as e:
+                    provider.scheduler.release()
+                    delay = self._retry_delay(provider, e, attempt)
+                    if delay is None:
+                        self._failed(provider, e)
+                        error = e
+                        break
+                    await asyncio.sleep(delay)
+                    continue
+                except asyncio.CancelledError:
+                    provider.scheduler.release()
+                    raise
+                try:
+                    self._observe(provider, (time.perf_counter() - start) * 1000)
+                    yield first
+                    async for item in generator:
+                        yield item
+                finally:
+                    provider.scheduler.release()
+                return
+            if i == len(providers) - 1:
+                raise error
+            self.metrics.fallbacks += 1
+
+
+def _message_tokens(messages: Sequence[ChatMessage]) -> int:
+    return sum(len(Settings.tokenizer(str(m.content or ""))) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+class GatewayLLM(LLM):
+    """LLM whose calls go through an LLMGateway lane (see LLMGateway.llm)."""
+
+    priority: str = Field(default="interactive")
+    providers: List[str] = Field(default_factory=list)
+    hedge_after: Optional[float] = Field(default=None, description="Seconds before a hedged request is sent.")
+
+    _gateway: LLMGateway = PrivateAttr()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "GatewayLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self._gateway.providers[self.providers[0]].llm.metadata
+
+    def _call(self, method: str, args: Sequence[Any], kwargs: Dict[str, Any], prompt_tokens: int) -> Any:
+        return self._gateway.call(
+            self.providers, self.hedge_after, method, args, kwargs, self.priority, prompt_tokens
+        )
+
+    async def _acall(self, method: str, args: Sequence[Any], kwargs: Dict[str, Any], prompt_tokens: int) -> Any:
+        return await self._gateway.acall(
+            self.providers, self.hedge_after, method, args, kwargs, self.priority, prompt_tokens
+        )
+
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self._call("chat", (messages,), kwargs, _message_tokens(messages))
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return self._call("complete", (prompt, formatted), kwargs, len(Settings.tokenizer(prompt)))
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        return self._gateway.stream(
+            self.providers, "stream_chat", (messages,), kwargs, self.priority, _message_tokens(messages)
+        )
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        return self._gateway.stream(
+            self.providers, "stream_complete", (prompt, formatted), kwargs, self.priority,
+            len(Settings.tokenizer(prompt)),
+        )
+
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return await self._acall("achat", (messages,), kwargs, _message_tokens(messages))
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        return await self._acall("acomplete", (prompt, formatted), kwargs, len(Settings.tokenizer(prompt)))
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        return self._gateway.astream(
+            self.providers, "astream_chat", (messages,), kwargs, self.priority, _message_tokens(messages)
+        )
+
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        return self._gateway.astream(
+            self.providers, "astream_complete", (prompt, formatted), kwargs, self.priority,
+            len(Settings.tokenizer(prompt)),
+        )
@@ -0,0 +1,441 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.schema import CBEventType, EventPayload
+from llama_index.core.callbacks.token_counting import get_llm_token_counts
+from llama_index.core.utilities.token_counting import TokenCounter
+
+# Script 11 sends every span to Traceloop synchronously (disable_batch=True), so each query waits for
+# network calls to a hosted service. LocalTraceHandler records the same LlamaIndex events (query, retrieve,
+# synthesize, LLM calls, embeddings) in memory and exports them without blocking the request:
+# - one record per request with its spans, the time spent in every stage and the LLM token counts,
+# - the latest records are kept in a ring buffer (handler.recent(), handler.stage_summary()),
+# - records are put on a queue and written in batches by a background thread, either to a JSONL file
+#   or as OTLP/HTTP JSON to a collector (e.g. http://localhost:4318/v1/traces).
+#
+# With sample_rate < 1 only that share of the requests is recorded; with sample_rate=0 the handler returns
+# right away on every event. If the queue is full, records are dropped (and counted) instead of waiting.
+# Overhead benchmark: python benchmarks/bench_tracing.py
+#
+# Usage (before the LLM, embedding model and indexes are created):
+#   handler = enable_local_tracing(path="./traces/traces.jsonl", sample_rate=0.1)
+#   ...
+#   print(handler.stage_summary())
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACE_PATH = "./traces/traces.jsonl"
+
+# List that collects the records of traces started in the current context, and the handler whose records
+# are collected (None: all handlers), see capture_traces().
+_captured: ContextVar[Optional[Tuple[List[Dict[str, Any]], Any]]] = ContextVar("local_trace_captured", default=None)
+
+
+@contextmanager
+def capture_traces(handler: Optional["LocalTraceHandler"] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Collect the records of the traces started inside this block (per thread / asyncio task).
+
+    Used to measure single requests while others run concurrently, e.g. in utils/eval_runner.py.
+    With several LocalTraceHandlers registered, pass `handler` to get every request once.
+    """
+    records: List[Dict[str, Any]] = []
+    token = _captured.set((records, handler))
+    try:
+        yield records
+    finally:
+        _captured.reset(token)
+
+
+class JsonlSink:
+    """Appends trace records to a JSON lines file."""
+
+    def __init__(self, path: str = DEFAULT_TRACE_PATH) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+
+    def write(self, records: Sequence[Dict[str, Any]]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, default=str) + "\n" for record in records)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(records: Sequence[Dict[str, Any]], service_name: str = "llama-index-starter") -> Dict[str, Any]:
+    """Convert trace records to an OTLP/HTTP JSON ExportTraceServiceRequest."""
+    spans = []
+    for record in records:
+        for span in record["spans"]:
+            start = span["start_ns"]
+            spans.append(
+                {
+                    "traceId": record["trace_id"],
+                    "spanId": span["span_id"],
+                    "parentSpanId": span["parent_id"] or "",
+                    "name": span["name"],
+                    "kind": 1,
+                    "startTimeUnixNano": str(start),
+                    "endTimeUnixNano": str(start + int(span["duration_ms"] * 1e6)),
+                    "attributes": [
+                        {"key": key, "value": _otlp_value(value)}
+                        for key, value in span["attributes"].items()
+                    ],
+                }
+            )
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]
+                },
+                "scopeSpans": [{"scope": {"name": "utils.local_tracing"}, "spans": spans}],
+            }
+        ]
+    }
+
+
+class OtlpHttpSink:
+    """Posts trace records as OTLP/HTTP JSON to a collector."""
+
+    def __init__(
+        self,
+        endpoint: str = "http://localhost:4318/v1/traces",
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 5.0,
+        service_name: str = "llama-index-starter",
+    ) -> None:
+        self.endpoint = endpoint
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.timeout = timeout
+        self.service_name = service_name
+
+    def write(self, records: Sequence[Dict[str, Any]]) -> None:
+        body = json.dumps(to_otlp(records, self.service_name)).encode("utf-8")
+        request = urllib.request.Request(self.endpoint, data=body, headers=self.headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class BatchExporter:
+    """Queues records and writes them to a sink in batches from a background thread."""
+
+    def __init__(
+        self,
+        sink: Any,
+        max_queue_size: int = 10_000,
+        max_batch_size: int = 512,
+        flush_interval: float = 2.0,
+    ) -> None:
+        self.sink = sink
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue_size)
+        self._flush_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def export(self, record: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> None:
+        while True:
+            batch = []
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                self.sink.write(batch)
+                self.exported += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.warning(f"Exporting {len(batch)} traces failed: {e!r}")
+            for _ in batch:
+                self._queue.task_done()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._flush_requested.wait(self.flush_interval)
+            self._flush_requested.clear()
+            self._drain()
+        self._drain()
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """Write everything queued so far (waits at most `timeout` seconds)."""
+        deadline = time.monotonic() + timeout
+        self._flush_requested.set()
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def shutdown(self) -> None:
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._flush_requested.set()
+        self._thread.join(timeout=10.0)
+
+
+class SyncExporter:
+    """Writes every record on the request path, as Traceloop does with disable_batch=True (for comparison)."""
+
+    def __init__(self, sink: Any) -> None:
+        self.sink = sink
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def export(self, record: Dict[str, Any]) -> None:
+        self.sink.write([record])
+        self.exported += 1
+
+    def flush(self, timeout: float = 10.0) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+
+class _Trace:
+    __slots__ = ("trace_id", "name", "start_ns", "start", "spans", "open", "ended", "captured")
+
+    def __init__(self, name: str, captured: Optional[List[Dict[str, Any]]] = None) -> None:
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter_ns()
+        self.spans: List[Dict[str, Any]] = []
+        self.open = 0
+        self.ended = False
+        self.captured = captured
+
+
+class LocalTraceHandler(BaseCallbackHandler):
+    """Callback handler that records per-request spans, timings and token counts locally."""
+
+    def __init__(
+        self,
+        exporter: Optional[Any] = None,
+        sample_rate: float = 1.0,
+        buffer_size: int = 1000,
+    ) -> None:
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.traces: "deque[Dict[str, Any]]" = deque(maxlen=buffer_size)
+        self._events: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._token_counter = TokenCounter()
+        # Trace of the current request, set in start_trace. None: no trace started, False: trace not sampled.
+        # One variable per handler, so handlers registered side by side keep their traces apart.
+        self._current_trace: ContextVar[Any] = ContextVar(f"local_trace_{id(self)}", default=None)
+
+    def _sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def _new_trace(self, name: str) -> _Trace:
+        captured = _captured.get()
+        if captured is not None and captured[1] not in (None, self):
+            captured = None
+        return _Trace(name, captured[0] if captured is not None else None)
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        if self.sample_rate <= 0:
+            return
+        self._current_trace.set(self._new_trace(trace_id or "trace") if self._sampled() else False)
+
+    def end_trace(
+        self,
+        trace_id: Optional[str] = None,
+        trace_map: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        trace = self._current_trace.get()
+        if not trace:
+            return
+        self._current_trace.set(None)
+        with self._lock:
+            trace.ended = True
+            # Streamed answers end after the trace, the record is finished by the last span.
+            done = trace.open == 0
+        if done:
+            self._finish(trace)
+
+    def on_event_start(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        parent_id: str = "",
+        **kwargs: Any,
+    ) -> str:
+        if self.sample_rate <= 0:
+            return event_id
+        parent = self._events.get(parent_id)
+        if parent is not None:
+            trace = parent[0]
+        else:
+            trace = self._current_trace.get()
+            if trace is False:
+                return event_id
+            if trace is None:
+                # Event outside of a trace (e.g. a bare llm.complete call): it is a trace of its own.
+                if not self._sampled():
+                    return event_id
+                trace = self._new_trace(event_type.value)
+                trace.ended = True
+        attributes: Dict[str, Any] = {}
+        if event_type == CBEventType.LLM and payload:
+            serialized = payload.get(EventPayload.SERIALIZED) or {}
+            if "model" in serialized:
+                attributes["model"] = serialized["model"]
+        with self._lock:
+            trace.open += 1
+            self._events[event_id] = (
+                trace,
+                parent_id if parent is not None else None,
+                time.time_ns(),
+                time.perf_counter_ns(),
+                attributes,
+            )
+        return event_id
+
+    def _end_attributes(self, event_type: CBEventType, payload: Dict[str, Any], attributes: Dict) -> None:
+        if event_type == CBEventType.LLM:
+            counts = get_llm_token_counts(self._token_counter, payload)
+            attributes["prompt_tokens"] = counts.prompt_token_count
+            attributes["completion_tokens"] = counts.completion_token_count
+        elif event_type == CBEventType.EMBEDDING:
+            attributes["chunks"] = len(payload.get(EventPayload.CHUNKS) or [])
+        elif event_type == CBEventType.RETRIEVE:
+            attributes["nodes"] = len(payload.get(EventPayload.NODES) or [])
+
+    def on_event_end(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        **kwargs: Any,
+    ) -> None:
+        if self.sample_rate <= 0:
+            return
+        end = time.perf_counter_ns()
+        with self._lock:
+            event = self._events.pop(event_id, None)
+        if event is None:
+            return
+        trace, parent_id, start_ns, start, attributes = event
+        if payload:
+            try:
+                self._end_attributes(event_type, payload, attributes)
+            except Exception as e:
+                logger.debug(f"Could not read the payload of {event_type.value}: {e!r}")
+        span = {
+            "span_id": event_id.replace("-", "")[:16],
+            "parent_id": parent_id.replace("-", "")[:16] if parent_id else None,
+            "name": event_type.value,
+            "start_ns": start_ns,
+            "duration_ms": (end - start) / 1e6,
+            "attributes": attributes,
+        }
+        with self._lock:
+            trace.spans.append(span)
+            trace.open -= 1
+            done = trace.ended and trace.open == 0
+        if done:
+            self._finish(trace)
+
+    def _finish(self, trace: _Trace) -> None:
+        stages: Dict[str, float] = {}
+        prompt_tokens = completion_tokens = 0
+        for span in trace.spans:
+            stages[span["name"]] = stages.get(span["name"], 0.0) + span["duration_ms"]
+            prompt_tokens += span["attributes"].get("prompt_tokens", 0)
+            completion_tokens += span["attributes"].get("completion_tokens", 0)
+        record = {
+            "trace_id": trace.trace_id,
+            "name": trace.name,
+            "start_ns": trace.start_ns,
+            # Called when the trace has ended and its last span has ended.
+            "duration_ms": (time.perf_counter_ns() - trace.start) / 1e6,
+            "stages_ms": stages,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "spans": trace.spans,
+        }
+        self.traces.append(record)
+        if trace.captured is not None:
+            trace.captured.append(record)
+        if self.exporter is not None:
+            self.exporter.export(record)
+
+    def recent(self, n: int = 10) -> List[Dict[str, Any]]:
+        return list(self.traces)[-n:]
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        """Latency percentiles of every stage over the requests in the ring buffer."""
+        stages: Dict[str, List[float]] = {"request": [t["duration_ms"] for t in self.traces]}
+        for trace in self.traces:
+            for name, ms in trace["stages_ms"].items():
+                stages.setdefault(name, []).append(ms)
+        return {
+            name: {
+                "count": len(times),
+                "p50_ms": float(np.percentile(times, 50)),
+                "p99_ms": float(np.percentile(times, 99)),
+            }
+            for name, times in stages.items()
+            if times
+        }
+
+
+def enable_local_tracing(
+    path: Optional[str] = DEFAULT_TRACE_PATH,
+    endpoint: Optional[str] = None,
+    sample_rate: float = 1.0,
+    buffer_size: int = 1000,
+    flush_interval: float = 2.0,
+) -> LocalTraceHandler:
+    """Add a LocalTraceHandler to Settings.callback_manager, exporting to `endpoint` (OTLP) or `path` (JSONL)."""
+    if endpoint:
+        exporter = BatchExporter(OtlpHttpSink(endpoint), flush_interval=flush_interval)
+    elif path:
+        exporter = BatchExporter(JsonlSink(path), flush_interval=flush_interval)
+    else:
+        exporter = None
+    handler = LocalTraceHandler(exporter=exporter, sample_rate=sample_rate, buffer_size=buffer_size)
+    Settings.callback_manager.add_handler(handler)
+    return handler
@@ -0,0 +1,45 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+# manifest.json is written next to the stores in ./storage/<year>.
+# It records the hash of every source file and the embedding model the index was built with,
+# so a loader can tell whether the persisted index still matches the files on disk.
+
+MANIFEST_FNAME = "manifest.json"
+
+
+def file_sha256(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def embed_model_id(embed_model: BaseEmbedding) -> str:
+    dimensions = getattr(embed_model, "dimensions", None)
+    return f"{embed_model.model_name}:{dimensions or 0}"
+
+
+def read_manifest(persist_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(persist_dir, MANIFEST_FNAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_manifest(
+    persist_dir: str, input_files: List[str], embed_model: BaseEmbedding
+) -> None:
+    manifest = {
+        "sources": {os.path.normpath(p): file_sha256(p) for p in input_files},
+        "embed_model": embed_model_id(embed_model),
+        "files": sorted(f for f in os.listdir(persist_dir) if f != MANIFEST_FNAME),
+    }
+    with open(os.path.join(persist_dir, MANIFEST_FNAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
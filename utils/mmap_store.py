@@ -0,0 +1,234 @@
+import json
+import os
+import shutil
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.index_store import SimpleIndexStore
+from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import (
+    metadata_dict_to_node,
+    node_to_metadata_dict,
+)
+
+from utils.numpy_store import normalize, top_k
+
+# Binary alternative to the JSON files in ./storage/<year>.
+# load_index_from_storage parses docstore.json (~1 MB) and the vector store JSON in full on every start.
+# Here the same index is written as a few flat files that are memory-mapped instead of parsed:
+#
+#   header.json      small header: format version, number of nodes, embedding dimension and model
+#   embeddings.f32   contiguous float32 matrix (count x dim) of L2-normalised embeddings
+#   text.bin         UTF-8 text of all nodes, one after another
+#   text.idx         int64 offsets into text.bin (count + 1 values)
+#   nodes.bin        JSON of every node without its text (id, metadata, relationships)
+#   nodes.idx        int64 offsets into nodes.bin (count + 1 values)
+#
+# Loading only opens the files, the operating system reads pages when a query touches them,
+# and every worker process that opens the same directory shares one page-cached copy.
+#
+# Usage:
+#   convert_json_storage("./storage/2021")                  # writes ./storage/2021/mmap
+#   index = load_mmap_index("./storage/2021/mmap")
+
+FORMAT_VERSION = 1
+HEADER_FNAME = "header.json"
+EMBEDDINGS_FNAME = "embeddings.f32"
+TEXT_FNAME = "text.bin"
+TEXT_INDEX_FNAME = "text.idx"
+NODES_FNAME = "nodes.bin"
+NODES_INDEX_FNAME = "nodes.idx"
+DEFAULT_MMAP_DIRNAME = "mmap"
+
+
+def _write_blob(path: str, index_path: str, items: List[bytes]) -> None:
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    with open(path, "wb") as f:
+        for i, item in enumerate(items):
+            f.write(item)
+            offsets[i + 1] = offsets[i] + len(item)
+    offsets.tofile(index_path)
+
+
+def _open_array(path: str, dtype: Any, shape: Optional[Tuple[int, ...]] = None) -> np.ndarray:
+    # np.memmap cannot map an empty file.
+    if os.path.getsize(path) == 0:
+        return np.zeros(shape or (0,), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+def write_mmap_store(
+    nodes: Sequence[BaseNode], out_dir: str, embed_model_name: str = "unknown"
+) -> str:
+    """Write nodes that already have embeddings into `out_dir` in the binary format."""
+    if any(node.embedding is None for node in nodes):
+        raise ValueError("Every node needs an embedding before it can be written.")
+    dim = len(nodes[0].embedding) if nodes else 0
+
+    # Write into a temporary directory first, so readers never see a half-written store.
+    tmp_dir = out_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    embeddings = np.asarray([node.embedding for node in nodes], dtype=np.float32).reshape(-1, dim)
+    normalize(embeddings).tofile(os.path.join(tmp_dir, EMBEDDINGS_FNAME))
+
+    _write_blob(
+        os.path.join(tmp_dir, TEXT_FNAME),
+        os.path.join(tmp_dir, TEXT_INDEX_FNAME),
+        [node.get_content(metadata_mode=MetadataMode.NONE).encode("utf-8") for node in nodes],
+    )
+    _write_blob(
+        os.path.join(tmp_dir, NODES_FNAME),
+        os.path.join(tmp_dir, NODES_INDEX_FNAME),
+        [json.dumps(node_to_metadata_dict(node, remove_text=True)).encode("utf-8") for node in nodes],
+    )
+
+    header = {
+        "version": FORMAT_VERSION,
+        "count": len(nodes),
+        "dim": dim,
+        "dtype": "float32",
+        "normalized": True,
+        "embed_model": embed_model_name,
+    }
+    with open(os.path.join(tmp_dir, HEADER_FNAME), "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return out_dir
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """Read-only vector store backed by the memory-mapped files written by write_mmap_store."""
+
+    stores_text: bool = True
+    persist_dir: str
+
+    _header: dict = PrivateAttr()
+    _embeddings: np.ndarray = PrivateAttr()
+    _text: np.ndarray = PrivateAttr()
+    _text_offsets: np.ndarray = PrivateAttr()
+    _nodes: np.ndarray = PrivateAttr()
+    _node_offsets: np.ndarray = PrivateAttr()
+
+    def __init__(self, persist_dir: str, **kwargs: Any) -> None:
+        super().__init__(persist_dir=persist_dir, **kwargs)
+        with open(os.path.join(persist_dir, HEADER_FNAME), "r", encoding="utf-8") as f:
+            self._header = json.load(f)
+        if self._header.get("version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported format version {self._header.get('version')} in {persist_dir}"
+            )
+        shape = (self._header["count"], self._header["dim"])
+        self._embeddings = _open_array(os.path.join(persist_dir, EMBEDDINGS_FNAME), np.float32, shape)
+        self._text = _open_array(os.path.join(persist_dir, TEXT_FNAME), np.uint8)
+        self._text_offsets = _open_array(os.path.join(persist_dir, TEXT_INDEX_FNAME), np.int64)
+        self._nodes = _open_array(os.path.join(persist_dir, NODES_FNAME), np.uint8)
+        self._node_offsets = _open_array(os.path.join(persist_dir, NODES_INDEX_FNAME), np.int64)
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> "MmapVectorStore":
+        return cls(persist_dir=persist_dir)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self._embeddings
+
+    def __len__(self) -> int:
+        return self._header["count"]
+
+    def _read(self, blob: np.ndarray, offsets: np.ndarray, i: int) -> str:
+        return blob[offsets[i] : offsets[i + 1]].tobytes().decode("utf-8")
+
+    def get_node(self, i: int) -> BaseNode:
+        metadata = json.loads(self._read(self._nodes, self._node_offsets, i))
+        return metadata_dict_to_node(metadata, text=self._read(self._text, self._text_offsets, i))
+
+    def add(self, nodes: Sequence[BaseNode], **kwargs: Any) -> List[str]:
+        raise NotImplementedError(
+            "MmapVectorStore is read-only, write a new store with write_mmap_store."
+        )
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        raise NotImplementedError(
+            "MmapVectorStore is read-only, write a new store with write_mmap_store."
+        )
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("Metadata filters are not supported by MmapVectorStore.")
+        if len(self) == 0 or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        scores = self._embeddings @ normalize(query.query_embedding)
+        top = top_k(scores, query.similarity_top_k)
+
+        nodes = [self.get_node(int(i)) for i in top]
+        return VectorStoreQueryResult(
+            nodes=nodes,
+            similarities=scores[top].tolist(),
+            ids=[node.node_id for node in nodes],
+        )
+
+
+def convert_json_storage(
+    persist_dir: str,
+    out_dir: Optional[str] = None,
+    embed_model: Optional[BaseEmbedding] = None,
+) -> str:
+    """Convert the JSON stores in `persist_dir` to the binary format (default: <persist_dir>/mmap).
+
+    Nodes without an embedding in default__vector_store.json are embedded with `embed_model`.
+    """
+    out_dir = out_dir or os.path.join(persist_dir, DEFAULT_MMAP_DIRNAME)
+    embed_model = embed_model or Settings.embed_model
+
+    docstore = SimpleDocumentStore.from_persist_dir(persist_dir)
+    index_structs = SimpleIndexStore.from_persist_dir(persist_dir).index_structs()
+    if index_structs and getattr(index_structs[0], "nodes_dict", None):
+        nodes = docstore.get_nodes(list(index_structs[0].nodes_dict.values()))
+    else:
+        nodes = list(docstore.docs.values())
+
+    # The checked-in ./storage/<year> has no vector store yet, then every node is embedded here.
+    embedding_dict = {}
+    if os.path.exists(os.path.join(persist_dir, "default__vector_store.json")):
+        embedding_dict = SimpleVectorStore.from_persist_dir(persist_dir).data.embedding_dict
+
+    missing = []
+    for node in nodes:
+        node.embedding = embedding_dict.get(node.node_id)
+        if node.embedding is None:
+            missing.append(node)
+    if missing:
+        embeddings = embed_model.get_text_embedding_batch(
+            [node.get_content(metadata_mode=MetadataMode.EMBED) for node in missing]
+        )
+        for node, embedding in zip(missing, embeddings):
+            node.embedding = embedding
+
+    return write_mmap_store(nodes, out_dir, embed_model_name=embed_model.model_name)
+
+
+def load_mmap_index(persist_dir: str, **kwargs: Any) -> VectorStoreIndex:
+    return VectorStoreIndex.from_vector_store(MmapVectorStore.from_persist_dir(persist_dir), **kwargs)
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import re
+import time
+from typing import Any, List, Sequence
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.types import (
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+
+# Offline stand-ins for the OpenAI LLM and embedding model, used by the benchmarks so they run
+# without API keys, network access or costs, and give the same results on every run.
+#
+# HashEmbedding hashes the words of a text into a vector (feature hashing), so texts that share words
+# are similar and retrieval still returns sensible nodes. MockLatencyLLM answers with words taken from
+# the prompt, one token at a time when streaming. Both can sleep to imitate the latency of the real API.
+#
+# Usage:
+#   Settings.embed_model = HashEmbedding(embed_dim=1536, latency=0.05)
+#   Settings.llm = MockLatencyLLM(latency=0.3, token_latency=0.01)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _stable_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HashEmbedding(BaseEmbedding):
+    """Deterministic bag-of-words embedding with optional latency per API call."""
+
+    embed_dim: int = Field(default=1536, description="Size of the embedding vectors.")
+    latency: float = Field(default=0.0, description="Seconds every (batch) call sleeps.")
+
+    def __init__(self, **kwargs: Any) -> None:
+        kwargs.setdefault("model_name", "hash-embedding")
+        super().__init__(**kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.embed_dim, dtype=np.float32)
+        for word in _WORD_RE.findall(text.lower()):
+            h = _stable_hash(word)
+            vector[h % self.embed_dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[_stable_hash(text) % self.embed_dim] = 1.0
+            norm = 1.0
+        return (vector / norm).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return self._embed(query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return self._embed(text)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+
+class MockLatencyLLM(CustomLLM):
+    """Deterministic LLM that answers with words from the prompt after a configurable delay."""
+
+    max_tokens: int = Field(default=64, description="Number of tokens in every answer.")
+    latency: float = Field(default=0.0, description="Seconds before the first token.")
+    token_latency: float = Field(default=0.0, description="Seconds between tokens.")
+    context_window: int = Field(default=128_000)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MockLatencyLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.max_tokens,
+            model_name="mock-latency-llm",
+        )
+
+    def _tokens(self, prompt: str) -> Sequence[str]:
+        words = _WORD_RE.findall(prompt) or ["ok"]
+        # The same prompt always gives the same answer.
+        rng = np.random.default_rng(_stable_hash(prompt))
+        return [words[i] + " " for i in rng.integers(0, len(words), self.max_tokens)]
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        tokens = self._tokens(prompt)
+        time.sleep(self.latency + self.token_latency * len(tokens))
+        return CompletionResponse(text="".join(tokens))
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        tokens = self._tokens(prompt)
+
+        def gen() -> CompletionResponseGen:
+            time.sleep(self.latency)
+            text = ""
+            for token in tokens:
+                time.sleep(self.token_latency)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        tokens = self._tokens(prompt)
+        await asyncio.sleep(self.latency + self.token_latency * len(tokens))
+        return CompletionResponse(text="".join(tokens))
+
+    @llm_completion_callback()
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        tokens = self._tokens(prompt)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            await asyncio.sleep(self.latency)
+            text = ""
+            for token in tokens:
+                await asyncio.sleep(self.token_latency)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
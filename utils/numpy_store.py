@@ -0,0 +1,460 @@
+import json
+import os
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import fsspec
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.indices.query.embedding_utils import get_top_k_mmr_embeddings
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.simple import (
+    SimpleVectorStoreData,
+    _build_metadata_filter_fn,
+)
+from llama_index.core.vector_stores.types import (
+    DEFAULT_PERSIST_DIR,
+    DEFAULT_PERSIST_FNAME,
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+# In-memory vector store for VectorStoreIndex, a drop-in replacement for SimpleVectorStore.
+# SimpleVectorStore keeps embeddings in a dict and scores a query with a Python loop over every node,
+# followed by a full sort. NumpyVectorStore keeps all embeddings L2-normalised in one contiguous
+# float32 matrix, so a query (or a batch of queries) is scored with a single matrix product,
+# and only the top k results are selected with a partial sort (np.argpartition).
+#
+# Metadata filters (MetadataFilters with ExactMatchFilter, IN, NE, ...) use an inverted index from
+# metadata key/value pairs to the rows that have them. A filtered query turns the matching rows into
+# bitmasks, combines them with AND/OR, and scores only the surviving rows, so a filter that matches
+# 1% of the nodes costs about 1% of an unfiltered query, and top k is always filled from matching nodes.
+# Operators the index cannot answer (>, <, contains, text_match, ...) are evaluated on the metadata of
+# the rows that are still candidates, with the same semantics as SimpleVectorStore.
+#
+# The store is persisted in the same default__vector_store.json format as SimpleVectorStore,
+# so existing ./storage/<year> directories can be loaded by either store.
+#
+# Usage:
+#   storage_context = StorageContext.from_defaults(vector_store=NumpyVectorStore())
+#   index = VectorStoreIndex.from_documents(documents, storage_context=storage_context)
+#
+#   vector_store = NumpyVectorStore.from_persist_dir("./storage/2021")
+#
+# Benchmark: python benchmarks/bench_topk.py
+
+
+def normalize(embeddings: np.ndarray) -> np.ndarray:
+    """L2-normalise a vector or every row of a matrix, leaving zero vectors unchanged."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the `k` highest scores along the last axis, from the highest to the lowest.
+
+    Works for a vector of scores (one query) and for a matrix (one row of scores per query).
+    """
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(scores.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        top = np.broadcast_to(np.arange(n), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, top, axis=-1), axis=-1)
+    return np.take_along_axis(top, order, axis=-1)
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """Vector store that keeps all normalised embeddings in one contiguous NumPy matrix."""
+
+    stores_text: bool = False
+
+    _matrix: np.ndarray = PrivateAttr()
+    _count: int = PrivateAttr(default=0)
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _rows: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _ref_doc_ids: List[str] = PrivateAttr(default_factory=list)
+    _metadata: List[Dict[str, Any]] = PrivateAttr(default_factory=list)
+    # key -> value -> rows, and keys with unhashable values (lists, dicts) that are not indexed.
+    _postings: Dict[str, Dict[Any, List[int]]] = PrivateAttr(default_factory=dict)
+    _unindexed_keys: Set[str] = PrivateAttr(default_factory=set)
+    _index_stale: bool = PrivateAttr(default=False)
+    _fs: fsspec.AbstractFileSystem = PrivateAttr()
+
+    def __init__(
+        self,
+        data: Optional[SimpleVectorStoreData] = None,
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self._fs = fs or fsspec.filesystem("file")
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        if data is not None and data.embedding_dict:
+            ids = list(data.embedding_dict)
+            metadata_dict = data.metadata_dict or {}
+            self._append(
+                ids,
+                np.asarray([data.embedding_dict[i] for i in ids], dtype=np.float32),
+                [data.text_id_to_ref_doc_id.get(i, "None") for i in ids],
+                [metadata_dict.get(i, {}) for i in ids],
+            )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @classmethod
+    def from_embeddings(
+        cls,
+        ids: Sequence[str],
+        embeddings: np.ndarray,
+        ref_doc_ids: Optional[Sequence[str]] = None,
+        metadata: Optional[Sequence[Dict[str, Any]]] = None,
+    ) -> "NumpyVectorStore":
+        """Create a store directly from an (n x dim) matrix, without building nodes."""
+        store = cls()
+        store._append(
+            list(ids),
+            embeddings,
+            list(ref_doc_ids) if ref_doc_ids is not None else ["None"] * len(ids),
+            list(metadata) if metadata is not None else [{} for _ in ids],
+        )
+        return store
+
+    @classmethod
+    def from_persist_dir(
+        cls,
+        persist_dir: str = DEFAULT_PERSIST_DIR,
+        namespace: str = "default",
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+    ) -> "NumpyVectorStore":
+        return cls.from_persist_path(
+            os.path.join(persist_dir, f"{namespace}__{DEFAULT_PERSIST_FNAME}"), fs=fs
+        )
+
+    @classmethod
+    def from_persist_path(
+        cls, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None
+    ) -> "NumpyVectorStore":
+        fs = fs or fsspec.filesystem("file")
+        if not fs.exists(persist_path):
+            raise FileNotFoundError(f"No vector store found at {persist_path}")
+        with fs.open(persist_path, "rb") as f:
+            data = SimpleVectorStoreData.from_dict(json.load(f))
+        return cls(data, fs=fs)
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """View of the normalised embeddings, one row per node."""
+        return self._matrix[: self._count]
+
+    # Deliberately not __len__: StorageContext.from_defaults checks `if vector_store:`,
+    # and an empty store would be replaced by a SimpleVectorStore.
+    @property
+    def node_count(self) -> int:
+        return self._count
+
+    def _append(
+        self,
+        ids: List[str],
+        embeddings: np.ndarray,
+        ref_doc_ids: List[str],
+        metadata: List[Dict[str, Any]],
+    ) -> None:
+        if not ids:
+            return
+        embeddings = normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        if self._count == 0 and self._matrix.shape[1] != embeddings.shape[1]:
+            self._matrix = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+        elif embeddings.shape[1] != self._matrix.shape[1]:
+            raise ValueError(
+                f"Embedding dimension {embeddings.shape[1]} does not match "
+                f"the store dimension {self._matrix.shape[1]}."
+            )
+
+        # Nodes that are already in the store are replaced, like in SimpleVectorStore.
+        existing = [i for i, node_id in enumerate(ids) if node_id in self._rows]
+        for i in existing:
+            row = self._rows[ids[i]]
+            self._matrix[row] = embeddings[i]
+            self._ref_doc_ids[row] = ref_doc_ids[i]
+            self._metadata[row] = metadata[i]
+        if existing:
+            self._index_stale = True
+            new = [i for i in range(len(ids)) if ids[i] not in self._rows]
+            ids = [ids[i] for i in new]
+            embeddings = embeddings[new]
+            ref_doc_ids = [ref_doc_ids[i] for i in new]
+            metadata = [metadata[i] for i in new]
+
+        # The matrix grows by doubling, so adding nodes one batch at a time stays cheap.
+        needed = self._count + len(ids)
+        if needed > self._matrix.shape[0]:
+            capacity = max(needed, 2 * self._matrix.shape[0], 64)
+            matrix = np.zeros((capacity, embeddings.shape[1]), dtype=np.float32)
+            matrix[: self._count] = self._matrix[: self._count]
+            self._matrix = matrix
+        self._matrix[self._count : needed] = embeddings
+        for offset, node_id in enumerate(ids):
+            self._rows[node_id] = self._count + offset
+        self._ids.extend(ids)
+        self._ref_doc_ids.extend(ref_doc_ids)
+        self._metadata.extend(metadata)
+        if not self._index_stale:
+            self._index_metadata(self._count, metadata)
+        self._count = needed
+
+    def _remove_rows(self, remove: np.ndarray) -> None:
+        if not remove.any():
+            return
+        keep = np.flatnonzero(~remove)
+        self._matrix[: len(keep)] = self._matrix[keep]
+        self._ids = [self._ids[i] for i in keep]
+        self._ref_doc_ids = [self._ref_doc_ids[i] for i in keep]
+        self._metadata = [self._metadata[i] for i in keep]
+        self._rows = {node_id: row for row, node_id in enumerate(self._ids)}
+        self._count = len(keep)
+        # Rows were renumbered, the inverted index is rebuilt on the next filtered query.
+        self._index_stale = True
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        metadata = []
+        for node in nodes:
+            node_metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+            node_metadata.pop("_node_content", None)
+            metadata.append(node_metadata)
+        self._append(
+            [node.node_id for node in nodes],
+            np.asarray([node.get_embedding() for node in nodes], dtype=np.float32),
+            [node.ref_doc_id or "None" for node in nodes],
+            metadata,
+        )
+        return [node.node_id for node in nodes]
+
+    def get(self, text_id: str) -> List[float]:
+        return self._matrix[self._rows[text_id]].tolist()
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._remove_rows(np.asarray([r == ref_doc_id for r in self._ref_doc_ids], dtype=bool))
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        remove = self._filter_mask(filters)
+        if node_ids is not None:
+            remove &= self._id_mask(node_ids)
+        self._remove_rows(remove)
+
+    def clear(self) -> None:
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._count = 0
+        self._ids, self._rows, self._ref_doc_ids, self._metadata = [], {}, [], []
+        self._postings, self._unindexed_keys, self._index_stale = {}, set(), False
+
+    def _index_metadata(self, start: int, metadata: Sequence[Dict[str, Any]]) -> None:
+        for row, node_metadata in enumerate(metadata, start):
+            for key, value in node_metadata.items():
+                if value is None or key in self._unindexed_keys:
+                    continue
+                try:
+                    self._postings.setdefault(key, {}).setdefault(value, []).append(row)
+                except TypeError:
+                    self._unindexed_keys.add(key)
+                    self._postings.pop(key, None)
+
+    def _ensure_index(self) -> None:
+        if self._index_stale:
+            self._postings, self._unindexed_keys = {}, set()
+            self._index_metadata(0, self._metadata[: self._count])
+            self._index_stale = False
+
+    def _rows_mask(self, posting_lists: Sequence[List[int]]) -> np.ndarray:
+        mask = np.zeros(self._count, dtype=bool)
+        for rows in posting_lists:
+            mask[rows] = True
+        return mask
+
+    def _indexed_mask(self, metadata_filter: MetadataFilter) -> Optional[np.ndarray]:
+        """Rows matching `metadata_filter` from the inverted index, or None if it cannot be answered there."""
+        key, value, operator = metadata_filter.key, metadata_filter.value, metadata_filter.operator
+        if key in self._unindexed_keys:
+            return None
+        postings = self._postings.get(key, {})
+        try:
+            if operator == FilterOperator.EQ:
+                return self._rows_mask([postings.get(value, [])])
+            if operator == FilterOperator.IN and isinstance(value, list):
+                return self._rows_mask([postings.get(v, []) for v in value])
+            if operator == FilterOperator.NE:
+                return self._rows_mask(
+                    [rows for v, rows in postings.items() if v != value]
+                )
+            if operator == FilterOperator.NIN and isinstance(value, list):
+                return self._rows_mask(
+                    [rows for v, rows in postings.items() if v not in value]
+                )
+        except TypeError:
+            return None
+        return None
+
+    def _scan_mask(self, metadata_filter: MetadataFilter, within: Optional[np.ndarray]) -> np.ndarray:
+        # Only rows that are still candidates are checked one by one.
+        rows = np.flatnonzero(within) if within is not None else range(self._count)
+        filter_fn = _build_metadata_filter_fn(
+            lambda row: self._metadata[row], MetadataFilters(filters=[metadata_filter])
+        )
+        mask = np.zeros(self._count, dtype=bool)
+        for row in rows:
+            mask[row] = filter_fn(row)
+        return mask
+
+    def _id_mask(self, node_ids: Sequence[str]) -> np.ndarray:
+        mask = np.zeros(self._count, dtype=bool)
+        rows = [self._rows[node_id] for node_id in node_ids if node_id in self._rows]
+        mask[rows] = True
+        return mask
+
+    def _filter_mask(
+        self, filters: Optional[MetadataFilters], within: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Bitmask of the rows matching `filters` (only rows set in `within` are considered)."""
+        if filters is None or not filters.filters:
+            return np.ones(self._count, dtype=bool) if within is None else within.copy()
+        self._ensure_index()
+        condition = filters.condition or FilterCondition.AND
+
+        if condition == FilterCondition.AND:
+            mask = np.ones(self._count, dtype=bool) if within is None else within.copy()
+            scans = []
+            for metadata_filter in filters.filters:
+                if isinstance(metadata_filter, MetadataFilters):
+                    scans.append(metadata_filter)
+                    continue
+                indexed = self._indexed_mask(metadata_filter)
+                if indexed is None:
+                    scans.append(metadata_filter)
+                else:
+                    mask &= indexed
+            # Nested filters and scans run last, on the rows left by the indexed filters.
+            for metadata_filter in scans:
+                if isinstance(metadata_filter, MetadataFilters):
+                    mask &= self._filter_mask(metadata_filter, within=mask)
+                else:
+                    mask &= self._scan_mask(metadata_filter, within=mask)
+            return mask
+
+        if condition == FilterCondition.OR:
+            mask = np.zeros(self._count, dtype=bool)
+            for metadata_filter in filters.filters:
+                if isinstance(metadata_filter, MetadataFilters):
+                    mask |= self._filter_mask(metadata_filter, within=within)
+                    continue
+                indexed = self._indexed_mask(metadata_filter)
+                if indexed is None:
+                    indexed = self._scan_mask(metadata_filter, within=within)
+                mask |= indexed
+            return mask if within is None else mask & within
+
+        raise ValueError(f"Invalid filter condition: {condition}")
+
+    def _candidates(self, query: VectorStoreQuery) -> Optional[np.ndarray]:
+        """Rows allowed by the node ids and filters of `query`, or None if every row is allowed."""
+        if query.node_ids is None and (query.filters is None or not query.filters.filters):
+            return None
+        mask = self._filter_mask(query.filters)
+        if query.node_ids is not None:
+            mask &= self._id_mask(query.node_ids)
+        return np.flatnonzero(mask)
+
+    def _result(self, rows: np.ndarray, scores: np.ndarray) -> VectorStoreQueryResult:
+        return VectorStoreQueryResult(
+            similarities=scores.tolist(), ids=[self._ids[row] for row in rows]
+        )
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if self._count == 0 or query.query_embedding is None:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        candidates = self._candidates(query)
+        matrix = self.embeddings if candidates is None else self._matrix[candidates]
+        rows = np.arange(self._count) if candidates is None else candidates
+
+        if query.mode == VectorStoreQueryMode.MMR:
+            similarities, ids = get_top_k_mmr_embeddings(
+                query.query_embedding,
+                matrix.tolist(),
+                similarity_top_k=query.similarity_top_k,
+                embedding_ids=[self._ids[row] for row in rows],
+                mmr_threshold=kwargs.get("mmr_threshold", None),
+            )
+            return VectorStoreQueryResult(similarities=similarities, ids=ids)
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Query mode {query.mode} is not supported by NumpyVectorStore.")
+
+        scores = matrix @ normalize(query.query_embedding)
+        top = top_k(scores, query.similarity_top_k)
+        return self._result(rows[top], scores[top])
+
+    def query_batch(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        similarity_top_k: int,
+        filters: Optional[MetadataFilters] = None,
+    ) -> List[VectorStoreQueryResult]:
+        """Score many queries at once with one matrix product, optionally with the same filters."""
+        if self._count == 0 or len(query_embeddings) == 0:
+            return [VectorStoreQueryResult(similarities=[], ids=[]) for _ in query_embeddings]
+        candidates = self._candidates(VectorStoreQuery(filters=filters))
+        matrix = self.embeddings if candidates is None else self._matrix[candidates]
+        rows = np.arange(self._count) if candidates is None else candidates
+
+        scores = normalize(query_embeddings) @ matrix.T
+        top = top_k(scores, similarity_top_k)
+        return [
+            self._result(rows[query_top], query_scores[query_top])
+            for query_top, query_scores in zip(top, scores)
+        ]
+
+    def to_data(self) -> SimpleVectorStoreData:
+        return SimpleVectorStoreData(
+            embedding_dict={node_id: self._matrix[row].tolist() for row, node_id in enumerate(self._ids)},
+            text_id_to_ref_doc_id=dict(zip(self._ids, self._ref_doc_ids)),
+            metadata_dict=dict(zip(self._ids, self._metadata)),
+        )
+
+    def persist(
+        self,
+        persist_path: str = os.path.join(DEFAULT_PERSIST_DIR, DEFAULT_PERSIST_FNAME),
+        fs: Optional[fsspec.AbstractFileSystem] = None,
+    ) -> None:
+        fs = fs or self._fs
+        dirpath = os.path.dirname(persist_path)
+        if dirpath and not fs.exists(dirpath):
+            fs.makedirs(dirpath)
+        with fs.open(persist_path, "w") as f:
+            json.dump(self.to_data().to_dict(), f)
+
+    def to_dict(self, **kwargs: Any) -> Dict[str, Any]:
+        return self.to_data().to_dict()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], **kwargs: Any) -> "NumpyVectorStore":
+        return cls(SimpleVectorStoreData.from_dict(data))
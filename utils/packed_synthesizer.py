@@ -0,0 +1,347 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from llama_index.core.async_utils import asyncio_run
+from llama_index.core.callbacks.base import CallbackManager
+from llama_index.core.indices.prompt_helper import PromptHelper
+from llama_index.core.llms import LLM
+from llama_index.core.node_parser import TokenTextSplitter
+from llama_index.core.prompts import BasePromptTemplate, PromptTemplate
+from llama_index.core.prompts.default_prompt_selectors import DEFAULT_TEXT_QA_PROMPT_SEL
+from llama_index.core.prompts.mixin import PromptDictType
+from llama_index.core.response_synthesizers.base import BaseSynthesizer, QueryTextType
+from llama_index.core.schema import MetadataMode, NodeWithScore, TextNode
+from llama_index.core.types import RESPONSE_TEXT_TYPE
+
+# The default response mode of a query engine (compact) stuffs as many retrieved chunks into the text_qa_template
+# as fit in the context window, and when they do not fit, sends the rest with the refine_template, one call after
+# another: every extra call waits for the previous answer, so each refine adds a full LLM round-trip to the query.
+# The chunks are packed in retrieval order (a large chunk can start a new call although a later small one would
+# still fit), and the overlapping text of neighbouring chunks (TokenTextSplitter/SentenceSplitter overlaps,
+# e.g. 64 tokens) is sent twice.
+#
+# PackedSynthesizer:
+# - counts the tokens of the template with the query and of every chunk up front, and knows the budget for
+#   context per call (context_window - num_output - prompt, see Settings.context_window and Settings.num_output),
+# - drops duplicate chunks and stitches neighbouring chunks of the same document into one text without the
+#   overlap (found by start_char_idx/end_char_idx and checked against the text),
+# - packs the chunks into as few calls as possible (first-fit decreasing; chunks larger than a call are split),
+#   keeping the retrieval order inside every call,
+# - one call: the answer is that call (streamed with streaming=True),
+# - several calls: all of them run in parallel, and one more call merges their answers (merge_template),
+#   instead of a chain of refines. So a query takes at most two LLM round-trips whatever the number of chunks.
+#
+# Usage:
+#   query_engine = index.as_query_engine(similarity_top_k=5, response_synthesizer=PackedSynthesizer())
+#   print(query_engine.query("Branch offices abroad"))
+#   print(query_engine._response_synthesizer.metrics.summary())
+
+DEFAULT_MERGE_PROMPT = PromptTemplate(
+    "Several answers to the same query are below, each one based on a different part of the context.\n"
+    "---------------------\n"
+    "{context_str}\n"
+    "---------------------\n"
+    "Combine them into one answer to the query. Ignore answers that say the context does not contain "
+    "the information, and do not mention that there were several answers.\n"
+    "Query: {query_str}\n"
+    "Answer: "
+)
+
+# Chunks are joined with this separator within one call.
+CHUNK_SEPARATOR = "\n\n"
+
+
+@dataclass
+class PackingMetrics:
+    queries: int = 0
+    nodes: int = 0
+    chunks: int = 0
+    duplicates_dropped: int = 0
+    overlaps_stitched: int = 0
+    overlap_tokens_trimmed: int = 0
+    llm_calls: int = 0
+    sequential_calls: int = 0
+    compact_sequential_calls: int = 0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "queries": self.queries,
+            "nodes": self.nodes,
+            "chunks": self.chunks,
+            "duplicates_dropped": self.duplicates_dropped,
+            "overlaps_stitched": self.overlaps_stitched,
+            "overlap_tokens_trimmed": self.overlap_tokens_trimmed,
+            "llm_calls": self.llm_calls,
+            # LLM round-trips one after another, here and in the compact mode with refines
+            "sequential_calls": self.sequential_calls,
+            "compact_sequential_calls": self.compact_sequential_calls,
+        }
+
+
+def _overlap(first: str, second: str, hint: Optional[int], min_chars: int) -> int:
+    """Number of characters at the end of first that repeat at the start of second (0 if none)."""
+    if hint is not None and 0 < hint <= min(len(first), len(second)) and first[-hint:] == second[:hint]:
+        return hint
+    # The indexes can be off by stripped whitespace, look for the start of second in the tail of first.
+    probe = second[:min_chars]
+    if len(probe) < min_chars:
+        return 0
+    start = first.rfind(probe)
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.rfind(probe, 0, start + len(probe) - 1)
+    return 0
+
+
+def _content(node: TextNode, text: str) -> str:
+    """The text of a node as the LLM sees it (with its metadata), see TextNode.get_content."""
+    metadata_str = node.get_metadata_str(mode=MetadataMode.LLM).strip()
+    if not metadata_str:
+        return text
+    return node.text_template.format(metadata_str=metadata_str, content=text).strip()
+
+
+class PackedSynthesizer(BaseSynthesizer):
+    """Answer from as few LLM calls as fit the context window, run in parallel and merged in one call."""
+
+    def __init__(
+        self,
+        llm: Optional[LLM] = None,
+        callback_manager: Optional[CallbackManager] = None,
+        prompt_helper: Optional[PromptHelper] = None,
+        text_qa_template: Optional[BasePromptTemplate] = None,
+        merge_template: Optional[BasePromptTemplate] = None,
+        streaming: bool = False,
+        dedupe: bool = True,
+        min_overlap_chars: int = 40,
+        max_parallel: int = 8,
+        verbose: bool = False,
+    ) -> None:
+        super().__init__(
+            llm=llm,
+            callback_manager=callback_manager,
+            prompt_helper=prompt_helper,
+            streaming=streaming,
+        )
+        self._text_qa_template = text_qa_template or DEFAULT_TEXT_QA_PROMPT_SEL
+        self._merge_template = merge_template or DEFAULT_MERGE_PROMPT
+        self._dedupe = dedupe
+        self._min_overlap_chars = min_overlap_chars
+        self._max_parallel = max_parallel
+        self._verbose = verbose
+        self.metrics = PackingMetrics()
+
+    def _get_prompts(self) -> PromptDictType:
+        """Get prompts."""
+        return {"text_qa_template": self._text_qa_template, "merge_template": self._merge_template}
+
+    def _update_prompts(self, prompts: PromptDictType) -> None:
+        """Update prompts."""
+        if "text_qa_template" in prompts:
+            self._text_qa_template = prompts["text_qa_template"]
+        if "merge_template" in prompts:
+            self._merge_template = prompts["merge_template"]
+
+    def _count(self, text: str) -> int:
+        return self._prompt_helper._token_counter.get_string_tokens(text)
+
+    def chunks_from_nodes(self, nodes: Sequence[NodeWithScore]) -> List[str]:
+        """Texts for the LLM in retrieval order, without duplicates and with neighbouring chunks stitched."""
+        if not self._dedupe:
+            return [n.node.get_content(metadata_mode=MetadataMode.LLM) for n in nodes]
+
+        # (rank, text) per distinct node; neighbouring text nodes of one document are grouped for stitching.
+        seen = set()
+        groups: Dict[str, List[Tuple[int, TextNode]]] = {}
+        chunks: List[Tuple[int, str]] = []
+        for rank, node_with_score in enumerate(nodes):
+            node = node_with_score.node
+            content = node.get_content(metadata_mode=MetadataMode.LLM)
+            key = hashlib.sha1(content.encode("utf-8")).hexdigest()
+            if key in seen:
+                self.metrics.duplicates_dropped += 1
+                continue
+            seen.add(key)
+            if isinstance(node, TextNode) and node.ref_doc_id and node.start_char_idx is not None:
+                groups.setdefault(node.ref_doc_id, []).append((rank, node))
+            else:
+                chunks.append((rank, content))
+
+        for group in groups.values():
+            group.sort(key=lambda item: item[1].start_char_idx)
+            rank, node = group[0]
+            text, end = node.text, node.end_char_idx
+            for next_rank, next_node in group[1:]:
+                hint = end - next_node.start_char_idx if end is not None else None
+                overlap = _overlap(text, next_node.text, hint, self._min_overlap_chars)
+                if overlap and next_node.get_metadata_str(MetadataMode.LLM) == node.get_metadata_str(
+                    MetadataMode.LLM
+                ):
+                    self.metrics.overlaps_stitched += 1
+                    self.metrics.overlap_tokens_trimmed += self._count(next_node.text[:overlap])
+                    text += next_node.text[overlap:]
+                    end = next_node.end_char_idx
+                    rank = min(rank, next_rank)
+                    continue
+                chunks.append((rank, _content(node, text)))
+                rank, node = next_rank, next_node
+                text, end = node.text, node.end_char_idx
+            chunks.append((rank, _content(node, text)))
+
+        return [text for _, text in sorted(chunks, key=lambda item: item[0])]
+
+    def _budget(self, template: BasePromptTemplate) -> int:
+        """Tokens of context that fit in one call of the (query-formatted) template."""
+        return self._prompt_helper._get_available_chunk_size(template, num_chunks=1, llm=self._llm)
+
+    def pack(self, template: BasePromptTemplate, text_chunks: Sequence[str]) -> List[str]:
+        """Pack the chunks into as few contexts as possible, each one fitting one call of the template."""
+        budget = self._budget(template)
+        if budget <= 0:
+            raise ValueError(f"The prompt leaves no room for context ({budget} tokens).")
+        separator_tokens = self._count(CHUNK_SEPARATOR)
+
+        # Split chunks that do not fit in one call, count the rest once.
+        pieces: List[Tuple[int, str, int]] = []
+        for rank, text in enumerate(text_chunks):
+            tokens = self._count(text)
+            if tokens <= budget:
+                pieces.append((rank, text, tokens))
+                continue
+            splitter = TokenTextSplitter(
+                chunk_size=budget,
+                chunk_overlap=0,
+                separator=self._prompt_helper.separator,
+                tokenizer=self._prompt_helper._token_counter.tokenizer,
+            )
+            pieces.extend((rank, piece, self._count(piece)) for piece in splitter.split_text(text))
+
+        # First-fit decreasing: the largest chunks first, every chunk into the first call with room for it.
+        packs: List[List[Tuple[int, str]]] = []
+        free: List[int] = []
+        for order, (_, text, tokens) in sorted(enumerate(pieces), key=lambda item: -item[1][2]):
+            for i, room in enumerate(free):
+                if tokens + separator_tokens <= room:
+                    packs[i].append((order, text))
+                    free[i] -= tokens + separator_tokens
+                    break
+            else:
+                packs.append([(order, text)])
+                free.append(budget - tokens)
+
+        # Retrieval order within a call, and the call with the best chunk first.
+        packs = sorted((sorted(pack) for pack in packs), key=lambda pack: pack[0][0])
+        return [CHUNK_SEPARATOR.join(text for _, text in pack) for pack in packs]
+
+    def _compact_calls(self, template: BasePromptTemplate, text_chunks: Sequence[str]) -> int:
+        """Number of calls the compact mode makes, one after another, for the same chunks."""
+        return len(self._prompt_helper.repack(template, text_chunks, llm=self._llm))
+
+    def synthesize(
+        self,
+        query: QueryTextType,
+        nodes: List[NodeWithScore],
+        additional_source_nodes: Optional[Sequence[NodeWithScore]] = None,
+        **response_kwargs: Any,
+    ) -> Any:
+        if nodes:
+            response_kwargs["packed_chunks"] = self.chunks_from_nodes(nodes)
+            self.metrics.nodes += len(nodes)
+        return super().synthesize(query, nodes, additional_source_nodes, **response_kwargs)
+
+    async def asynthesize(
+        self,
+        query: QueryTextType,
+        nodes: List[NodeWithScore],
+        additional_source_nodes: Optional[Sequence[NodeWithScore]] = None,
+        **response_kwargs: Any,
+    ) -> Any:
+        if nodes:
+            response_kwargs["packed_chunks"] = self.chunks_from_nodes(nodes)
+            self.metrics.nodes += len(nodes)
+        return await super().asynthesize(query, nodes, additional_source_nodes, **response_kwargs)
+
+    def _plan(
+        self, query_str: str, text_chunks: Sequence[str], response_kwargs: Dict[str, Any]
+    ) -> Tuple[BasePromptTemplate, List[str]]:
+        """The query-formatted QA template and the packed contexts for it."""
+        packed_chunks = response_kwargs.pop("packed_chunks", None)
+        if packed_chunks is None:
+            # Called with texts only (not through synthesize): drop exact duplicates.
+            packed_chunks = list(dict.fromkeys(text_chunks))
+            self.metrics.duplicates_dropped += len(text_chunks) - len(packed_chunks)
+        template = self._text_qa_template.partial_format(query_str=query_str)
+        contexts = self.pack(template, packed_chunks)
+
+        self.metrics.queries += 1
+        self.metrics.chunks += len(packed_chunks)
+        self.metrics.compact_sequential_calls += self._compact_calls(template, text_chunks)
+        if self._verbose:
+            print(f"{len(text_chunks)} chunks -> {len(packed_chunks)} after dedupe -> {len(contexts)} calls")
+        return template, contexts
+
+    async def _amap(
+        self, template: BasePromptTemplate, contexts: Sequence[str], **response_kwargs: Any
+    ) -> List[str]:
+        """Answer every context in parallel, at most max_parallel calls at a time."""
+        limit = asyncio.Semaphore(self._max_parallel)
+
+        async def answer(context: str) -> str:
+            async with limit:
+                return await self._llm.apredict(template, context_str=context, **response_kwargs)
+
+        self.metrics.llm_calls += len(contexts)
+        self.metrics.sequential_calls += 1
+        return await asyncio.gather(*(answer(context) for context in contexts))
+
+    def _merge_contexts(self, query_str: str, answers: Sequence[str]) -> Tuple[BasePromptTemplate, List[str]]:
+        """The merge template and the partial answers packed for it."""
+        template = self._merge_template.partial_format(query_str=query_str)
+        numbered = [f"Answer {i}:\n{answer.strip()}" for i, answer in enumerate(answers, 1)]
+        return template, self.pack(template, numbered)
+
+    def get_response(
+        self,
+        query_str: str,
+        text_chunks: Sequence[str],
+        **response_kwargs: Any,
+    ) -> RESPONSE_TEXT_TYPE:
+        """Answer with one call, or with parallel calls and a merge call."""
+        template, contexts = self._plan(query_str, text_chunks, response_kwargs)
+        # Many partial answers can overflow the merge call too, then they are merged in parallel again.
+        while len(contexts) > 1:
+            answers = asyncio_run(self._amap(template, contexts, **response_kwargs))
+            template, merged = self._merge_contexts(query_str, answers)
+            if len(merged) >= len(contexts):
+                raise ValueError("The partial answers do not fit in fewer merge calls, lower num_output.")
+            contexts = merged
+
+        self.metrics.llm_calls += 1
+        self.metrics.sequential_calls += 1
+        if self._streaming:
+            return self._llm.stream(template, context_str=contexts[0], **response_kwargs)
+        return self._llm.predict(template, context_str=contexts[0], **response_kwargs)
+
+    async def aget_response(
+        self,
+        query_str: str,
+        text_chunks: Sequence[str],
+        **response_kwargs: Any,
+    ) -> RESPONSE_TEXT_TYPE:
+        """Answer with one call, or with parallel calls and a merge call."""
+        template, contexts = self._plan(query_str, text_chunks, response_kwargs)
+        while len(contexts) > 1:
+            answers = await self._amap(template, contexts, **response_kwargs)
+            template, merged = self._merge_contexts(query_str, answers)
+            if len(merged) >= len(contexts):
+                raise ValueError("The partial answers do not fit in fewer merge calls, lower num_output.")
+            contexts = merged
+
+        self.metrics.llm_calls += 1
+        self.metrics.sequential_calls += 1
+        if self._streaming:
+            return await self._llm.astream(template, context_str=contexts[0], **response_kwargs)
+        return await self._llm.apredict(template, context_str=contexts[0], **response_kwargs)
@@ -0,0 +1,226 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple, Union
+
+from llama_index.agent.openai import OpenAIAgent, OpenAIAgentWorker
+from llama_index.agent.openai.step import call_tool_with_error_handling
+from llama_index.core.agent.function_calling.step import get_function_by_name
+from llama_index.core.agent.types import Task, TaskStep, TaskStepOutput
+from llama_index.core.chat_engine.types import AGENT_CHAT_RESPONSE_TYPE, ChatResponseMode
+from llama_index.core.memory import BaseMemory
+from llama_index.core.tools import BaseTool, ToolOutput, adapt_to_async_tool
+from llama_index.core.tools.types import AsyncBaseTool, ToolMetadata
+from llama_index.llms.openai.utils import OpenAIToolCall
+
+# OpenAI can ask for several tool calls in one answer, e.g. one call per yearly report for
+# "Which year had more employes?". OpenAIAgentWorker runs them one after another, so a comparison
+# over N reports takes N retrievals and N LLM answers of wall-clock time.
+#
+# ParallelToolOpenAIAgentWorker starts all tool calls of a turn at once (at most max_concurrency at a time)
+# as soon as the LLM answer arrives. The outputs are then passed to the agent in the original order
+# of the tool calls, through the unchanged OpenAIAgentWorker code path (memory, callbacks, verbose output),
+# so the conversation is the same as with sequential calls.
+#
+# The worker overrides private methods of OpenAIAgentWorker (_run_step, _get_agent_response, _call_function and
+# their async variants) as they are in llama-index-agent-openai 0.3.x, the version pinned in requirements.txt.
+#
+# Usage:
+#   agent = ParallelOpenAIAgent.from_tools(query_engine_tools, max_concurrency=4, verbose=True)
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class _PrefetchedTool(AsyncBaseTool):
+    """Stands in for a tool whose output was already computed."""
+
+    def __init__(self, metadata: ToolMetadata, output: ToolOutput) -> None:
+        self._metadata = metadata
+        self._output = output
+
+    @property
+    def metadata(self) -> ToolMetadata:
+        return self._metadata
+
+    def call(self, *args: Any, **kwargs: Any) -> ToolOutput:
+        return self._output
+
+    async def acall(self, *args: Any, **kwargs: Any) -> ToolOutput:
+        return self._output
+
+
+class ParallelToolOpenAIAgentWorker(OpenAIAgentWorker):
+    """OpenAIAgentWorker that runs the tool calls of one turn concurrently."""
+
+    def __init__(self, *args: Any, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_concurrency = max_concurrency
+        self._prefetched: Dict[str, ToolOutput] = {}
+        self._prefetched_lock = threading.Lock()
+
+    def _pending_calls(self, task: Task) -> List[Tuple[str, BaseTool, Dict]]:
+        """Tool calls of the latest answer that can run ahead: known tool, arguments that parse."""
+        tool_calls = self.get_latest_tool_calls(task) or []
+        if len(tool_calls) < 2:
+            return []
+        tools = self.get_tools(task.input)
+        pending = []
+        for tool_call in tool_calls:
+            if tool_call.type != "function" or tool_call.function is None:
+                continue
+            tool = get_function_by_name(tools, tool_call.function.name)
+            if tool is None:
+                continue
+            try:
+                arguments = self.tool_call_parser(tool_call)
+            except ValueError:
+                # Reported to the LLM by the sequential code path.
+                continue
+            pending.append((tool_call.id, tool, arguments))
+        return pending
+
+    def _will_call_tools(self, task: Task) -> bool:
+        """The same check as OpenAIAgentWorker._run_step, no tools are run past max_function_calls."""
+        return self._should_continue(self.get_latest_tool_calls(task), task.extra_state["n_function_calls"])
+
+    def _store(self, task: Task, outputs: Dict[str, ToolOutput]) -> None:
+        with self._prefetched_lock:
+            self._prefetched.update(outputs)
+        task.extra_state.setdefault("prefetched_call_ids", []).extend(outputs)
+
+    def _discard(self, task: Task) -> None:
+        """Drop the outputs of this step that were not used (e.g. a return_direct tool ended the step)."""
+        with self._prefetched_lock:
+            for call_id in task.extra_state.pop("prefetched_call_ids", []):
+                self._prefetched.pop(call_id, None)
+
+    def _prefetch(self, task: Task) -> None:
+        if not self._will_call_tools(task):
+            return
+        pending = self._pending_calls(task)
+        if not pending:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(pending))) as executor:
+            futures = {
+                call_id: executor.submit(call_tool_with_error_handling, tool, arguments)
+                for call_id, tool, arguments in pending
+            }
+            self._store(task, {call_id: future.result() for call_id, future in futures.items()})
+
+    async def _aprefetch(self, task: Task) -> None:
+        if not self._will_call_tools(task):
+            return
+        pending = self._pending_calls(task)
+        if not pending:
+            return
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(tool: BaseTool, arguments: Dict) -> ToolOutput:
+            async with semaphore:
+                try:
+                    return await adapt_to_async_tool(tool).acall(**arguments)
+                except Exception as e:
+                    return ToolOutput(
+                        content=f"Error: {e!s}",
+                        tool_name=tool.metadata.name,
+                        raw_input={"kwargs": arguments},
+                        raw_output=e,
+                    )
+
+        outputs = await asyncio.gather(*(run(tool, arguments) for _, tool, arguments in pending))
+        self._store(task, {call_id: output for (call_id, _, _), output in zip(pending, outputs)})
+
+    def _run_step(
+        self,
+        step: TaskStep,
+        task: Task,
+        mode: ChatResponseMode = ChatResponseMode.WAIT,
+        tool_choice: Union[str, dict] = "auto",
+    ) -> TaskStepOutput:
+        try:
+            return super()._run_step(step, task, mode=mode, tool_choice=tool_choice)
+        finally:
+            self._discard(task)
+
+    async def _arun_step(
+        self,
+        step: TaskStep,
+        task: Task,
+        mode: ChatResponseMode = ChatResponseMode.WAIT,
+        tool_choice: Union[str, dict] = "auto",
+    ) -> TaskStepOutput:
+        try:
+            return await super()._arun_step(step, task, mode=mode, tool_choice=tool_choice)
+        finally:
+            self._discard(task)
+
+    def _get_agent_response(
+        self, task: Task, mode: ChatResponseMode, **llm_chat_kwargs: Any
+    ) -> AGENT_CHAT_RESPONSE_TYPE:
+        response = super()._get_agent_response(task, mode=mode, **llm_chat_kwargs)
+        self._prefetch(task)
+        return response
+
+    async def _get_async_agent_response(
+        self, task: Task, mode: ChatResponseMode, **llm_chat_kwargs: Any
+    ) -> AGENT_CHAT_RESPONSE_TYPE:
+        response = await super()._get_async_agent_response(task, mode=mode, **llm_chat_kwargs)
+        await self._aprefetch(task)
+        return response
+
+    def _with_prefetched(self, tools: List[BaseTool], tool_call: OpenAIToolCall) -> List[BaseTool]:
+        with self._prefetched_lock:
+            output = self._prefetched.pop(tool_call.id, None)
+        if output is None:
+            return tools
+        return [
+            _PrefetchedTool(tool.metadata, output) if tool.metadata.name == tool_call.function.name else tool
+            for tool in tools
+        ]
+
+    def _call_function(
+        self,
+        tools: List[BaseTool],
+        tool_call: OpenAIToolCall,
+        memory: BaseMemory,
+        sources: List[ToolOutput],
+    ) -> bool:
+        return super()._call_function(self._with_prefetched(tools, tool_call), tool_call, memory, sources)
+
+    async def _acall_function(
+        self,
+        tools: List[BaseTool],
+        tool_call: OpenAIToolCall,
+        memory: BaseMemory,
+        sources: List[ToolOutput],
+    ) -> bool:
+        return await super()._acall_function(
+            self._with_prefetched(tools, tool_call), tool_call, memory, sources
+        )
+
+
+class ParallelOpenAIAgent(OpenAIAgent):
+    """OpenAIAgent that runs independent tool calls of the same turn concurrently."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        worker = self.agent_worker
+        self.agent_worker = ParallelToolOpenAIAgentWorker(
+            tools=[],
+            llm=worker._llm,
+            prefix_messages=worker.prefix_messages,
+            verbose=worker._verbose,
+            max_function_calls=worker._max_function_calls,
+            callback_manager=worker.callback_manager,
+            tool_call_parser=worker.tool_call_parser,
+        )
+        # Same tools (or tool retriever) as the worker created by OpenAIAgent.
+        self.agent_worker._get_tools = worker._get_tools
+
+    @classmethod
+    def from_tools(
+        cls, *args: Any, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, **kwargs: Any
+    ) -> "ParallelOpenAIAgent":
+        agent = super().from_tools(*args, **kwargs)
+        agent.agent_worker.max_concurrency = max_concurrency
+        return agent
@@ -0,0 +1,83 @@
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.schema import Document
+
+# SimpleDirectoryReader(...).load_data() parses files one after another in a single process
+# and returns one big list. iter_documents selects the same files (input_dir, required_exts, recursive, ...),
+# parses them in a pool of processes and yields the documents as soon as they are ready,
+# in the same order as SimpleDirectoryReader would return them.
+#
+# Every file is read with SimpleDirectoryReader(input_files=[file], file_metadata=...), so the metadata
+# and document ids are the same as when loading the whole directory at once.
+#
+# The file_metadata function is sent to the worker processes, so it has to be defined at module level.
+# On Windows and macOS worker processes re-import the script, so the calling code has to be inside
+# an `if __name__ == "__main__":` block.
+#
+# Usage:
+#   for document in iter_documents(input_dir="./whitepapers", required_exts=[".pdf"], recursive=True):
+#       ...
+
+
+def _load_file(
+    input_file: str,
+    file_metadata: Optional[Callable[[str], Dict]],
+    filename_as_id: bool,
+) -> List[Document]:
+    return SimpleDirectoryReader(
+        input_files=[input_file],
+        file_metadata=file_metadata,
+        filename_as_id=filename_as_id,
+    ).load_data()
+
+
+def iter_documents(
+    input_dir: Optional[str] = None,
+    input_files: Optional[List[str]] = None,
+    required_exts: Optional[List[str]] = None,
+    exclude: Optional[List[str]] = None,
+    recursive: bool = False,
+    file_metadata: Optional[Callable[[str], Dict]] = None,
+    filename_as_id: bool = False,
+    num_workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+) -> Iterator[Document]:
+    """Parse files in parallel processes and yield their documents in order.
+
+    At most `max_pending` files (default: twice the number of workers) are parsed ahead
+    of the consumer, so memory stays bounded even for very large directories.
+    """
+    input_paths = SimpleDirectoryReader(
+        input_dir=input_dir,
+        input_files=input_files,
+        required_exts=required_exts,
+        exclude=exclude,
+        recursive=recursive,
+    ).input_files
+    num_workers = num_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * num_workers
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        paths = iter(input_paths)
+        pending: Deque[Future] = deque()
+
+        def submit_next() -> None:
+            path = next(paths, None)
+            if path is not None:
+                pending.append(executor.submit(_load_file, str(path), file_metadata, filename_as_id))
+
+        for _ in range(max_pending):
+            submit_next()
+        try:
+            while pending:
+                documents = pending.popleft().result()
+                submit_next()
+                yield from documents
+        finally:
+            # The consumer stopped early, files that were not started yet are not parsed.
+            for future in pending:
+                future.cancel()
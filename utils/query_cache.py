@@ -0,0 +1,301 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, List, Optional
+
+import numpy as np
+from llama_index.core import QueryBundle, Settings
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.response.schema import (
+    RESPONSE_TYPE,
+    AsyncStreamingResponse,
+    Response,
+    StreamingResponse,
+)
+from llama_index.core.indices.base import BaseIndex
+from llama_index.core.schema import NodeWithScore
+
+from utils.numpy_store import normalize
+
+# Users repeat the same or nearly the same questions, and every query_engine.query call pays for
+# a query embedding, a retrieval and a full LLM answer. CachedQueryEngine sits in front of a query engine
+# and answers repeated questions from memory:
+# - exact tier: the same question (ignoring case, spacing and trailing punctuation),
+# - semantic tier: a question whose embedding has cosine similarity >= similarity_threshold with a cached one.
+#
+# Every entry belongs to a version of the index (by default the number of its nodes and the last node id).
+# When nodes are added or removed, the cache is cleared. Entries are evicted when they are older than ttl seconds or,
+# least recently used first, when there are more than max_entries.
+#
+# Streaming engines (as_query_engine(streaming=True)) are supported: the answer is recorded while it is
+# streamed, and a cached answer is replayed token by token through the same print_response_stream().
+#
+# Usage:
+#   query_engine = CachedQueryEngine(index.as_query_engine(streaming=True), index=index)
+#   query_engine.query("Branch offices abroad").print_response_stream()
+#   print(query_engine.metrics.summary())
+
+
+def index_version(index: BaseIndex) -> Any:
+    """Changes whenever nodes are added to or removed from the index.
+
+    Called on every query, so it does not look at all node ids: inserted nodes get new ids at the end of the
+    index struct's node list and removed nodes shorten it, so the number of nodes and the last id are enough.
+    """
+    nodes = getattr(index.index_struct, "nodes_dict", None)
+    if nodes is not None:
+        return len(nodes), next(reversed(nodes.values()), None)
+    nodes = getattr(index.index_struct, "nodes", None)
+    if isinstance(nodes, list):
+        return len(nodes), nodes[-1] if nodes else None
+    # Index types without an ordered node list.
+    return hash(frozenset(index.docstore.docs))
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!.").strip().casefold()
+
+
+@dataclass
+class CachedAnswer:
+    text: str
+    source_nodes: List[NodeWithScore]
+    metadata: Optional[Dict[str, Any]]
+    # Streamed answers keep their tokens, so they are replayed in the same chunks.
+    tokens: Optional[List[str]]
+    embedding: Optional[np.ndarray]
+    created: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class QueryCacheMetrics:
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.exact_hits + self.semantic_hits + self.misses
+        return (self.exact_hits + self.semantic_hits) / total if total else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"hit rate {self.hit_rate:.0%} ({self.exact_hits} exact, {self.semantic_hits} semantic, "
+            f"{self.misses} misses), {self.evictions} evicted, {self.expirations} expired, "
+            f"{self.invalidations} invalidations"
+        )
+
+
+class CachedQueryEngine(BaseQueryEngine):
+    """Query engine wrapper with an exact and a semantic response cache."""
+
+    def __init__(
+        self,
+        query_engine: BaseQueryEngine,
+        index: Optional[BaseIndex] = None,
+        version_fn: Optional[Callable[[], Any]] = None,
+        embed_model: Optional[BaseEmbedding] = None,
+        similarity_threshold: Optional[float] = 0.95,
+        max_entries: int = 1000,
+        ttl: Optional[float] = 24 * 60 * 60,
+        streaming: Optional[bool] = None,
+    ) -> None:
+        self._query_engine = query_engine
+        if version_fn is None and index is not None:
+            version_fn = lambda: index_version(index)  # noqa: E731
+        self._version_fn = version_fn
+        self._version: Any = None
+        # The query embedding is passed on to the retriever, so it has to come from the index's embedding model.
+        # Without one from the arguments, the index or the wrapped engine, the cache embeds the query with
+        # Settings.embed_model for itself, and the retriever embeds it again.
+        if embed_model is None and index is not None:
+            embed_model = getattr(index, "_embed_model", None)
+        if embed_model is None:
+            retriever = getattr(query_engine, "retriever", None)
+            embed_model = getattr(retriever, "_embed_model", None)
+        if embed_model is None:
+            # Engines without a retriever that say which model they retrieve with (LazyQueryEngine).
+            embed_model = getattr(query_engine, "embed_model", None)
+        self._share_embedding = embed_model is not None
+        self._embed_model = embed_model or Settings.embed_model
+        # None disables the semantic tier (no query embedding is computed on a miss).
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        if streaming is None:
+            synthesizer = getattr(query_engine, "_response_synthesizer", None)
+            streaming = bool(getattr(synthesizer, "_streaming", False))
+        self._streaming = streaming
+        self.metrics = QueryCacheMetrics()
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._lock = threading.Lock()
+        super().__init__(callback_manager=query_engine.callback_manager)
+
+    def _get_prompt_modules(self) -> Dict[str, Any]:
+        return {"query_engine": self._query_engine}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def _check_version(self) -> None:
+        if self._version_fn is None:
+            return
+        version = self._version_fn()
+        if version != self._version:
+            if self._entries:
+                self.metrics.invalidations += 1
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _expired(self, entry: CachedAnswer) -> bool:
+        return self.ttl is not None and time.monotonic() - entry.created > self.ttl
+
+    def _semantic_match(self, embedding: np.ndarray) -> Optional[str]:
+        if self._matrix is None:
+            self._matrix_keys = [k for k, e in self._entries.items() if e.embedding is not None]
+            self._matrix = (
+                np.stack([self._entries[k].embedding for k in self._matrix_keys])
+                if self._matrix_keys
+                else np.zeros((0, len(embedding)), dtype=np.float32)
+            )
+        if not self._matrix_keys:
+            return None
+        scores = self._matrix @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            return self._matrix_keys[best]
+        return None
+
+    def _lookup(self, key: str, embedding: Optional[np.ndarray]) -> Optional[CachedAnswer]:
+        with self._lock:
+            self._check_version()
+            match = key if key in self._entries else None
+            if match is None and embedding is not None:
+                match = self._semantic_match(embedding)
+            if match is None:
+                self.metrics.misses += 1
+                return None
+            entry = self._entries[match]
+            if self._expired(entry):
+                del self._entries[match]
+                self._matrix = None
+                self.metrics.expirations += 1
+                self.metrics.misses += 1
+                return None
+            self._entries.move_to_end(match)
+            if match == key:
+                self.metrics.exact_hits += 1
+            else:
+                self.metrics.semantic_hits += 1
+            return entry
+
+    def _store(self, key: str, entry: CachedAnswer) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.metrics.evictions += 1
+            self._matrix = None
+
+    def _replay(self, entry: CachedAnswer, is_async: bool = False) -> RESPONSE_TYPE:
+        if not self._streaming:
+            return Response(entry.text, list(entry.source_nodes), entry.metadata)
+        tokens = entry.tokens if entry.tokens is not None else [entry.text]
+        if is_async:
+
+            async def agen() -> AsyncGenerator[str, None]:
+                for token in tokens:
+                    yield token
+
+            return AsyncStreamingResponse(agen(), list(entry.source_nodes), entry.metadata)
+        return StreamingResponse(iter(tokens), list(entry.source_nodes), entry.metadata)
+
+    def _record(
+        self, key: str, response: RESPONSE_TYPE, embedding: Optional[np.ndarray]
+    ) -> RESPONSE_TYPE:
+        """Store the answer; streamed answers are stored once the stream has been read to the end."""
+        if isinstance(response, StreamingResponse):
+            inner = response.response_gen
+
+            def gen() -> Generator[str, None, None]:
+                tokens = []
+                for token in inner:
+                    tokens.append(token)
+                    yield token
+                self._store(
+                    key,
+                    CachedAnswer("".join(tokens), response.source_nodes, response.metadata, tokens, embedding),
+                )
+
+            response.response_gen = gen()
+        elif isinstance(response, AsyncStreamingResponse):
+            ainner = response.response_gen
+
+            async def agen() -> AsyncGenerator[str, None]:
+                tokens = []
+                async for token in ainner:
+                    tokens.append(token)
+                    yield token
+                self._store(
+                    key,
+                    CachedAnswer("".join(tokens), response.source_nodes, response.metadata, tokens, embedding),
+                )
+
+            response.response_gen = agen()
+        elif isinstance(response, Response):
+            self._store(
+                key,
+                CachedAnswer(response.response or "", response.source_nodes, response.metadata, None, embedding),
+            )
+        return response
+
+    def _query(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        key = normalize_query(query_bundle.query_str)
+        with self._lock:
+            self._check_version()
+            exact = key in self._entries
+        embedding = None
+        if not exact and self.similarity_threshold is not None:
+            query_embedding = query_bundle.embedding
+            if query_embedding is None:
+                query_embedding = self._embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+                if self._share_embedding:
+                    # The query embedding is passed on, the retriever does not compute it again.
+                    query_bundle.embedding = query_embedding
+            embedding = normalize(query_embedding)
+        entry = self._lookup(key, embedding)
+        if entry is not None:
+            return self._replay(entry)
+        return self._record(key, self._query_engine.query(query_bundle), embedding)
+
+    async def _aquery(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        key = normalize_query(query_bundle.query_str)
+        with self._lock:
+            self._check_version()
+            exact = key in self._entries
+        embedding = None
+        if not exact and self.similarity_threshold is not None:
+            query_embedding = query_bundle.embedding
+            if query_embedding is None:
+                query_embedding = await self._embed_model.aget_agg_embedding_from_queries(
+                    query_bundle.embedding_strs
+                )
+                if self._share_embedding:
+                    query_bundle.embedding = query_embedding
+            embedding = normalize(query_embedding)
+        entry = self._lookup(key, embedding)
+        if entry is not None:
+            return self._replay(entry, is_async=True)
+        return self._record(key, await self._query_engine.aquery(query_bundle), embedding)
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+# Token bucket used to stay under provider limits such as requests per minute or tokens per minute.
+# A caller reserves an amount (1 request, or the estimated number of tokens) and waits until the bucket
+# has refilled enough. Reservations are made under a lock, so the same bucket can be shared by threads
+# and by asyncio tasks.
+
+
+class TokenBucket:
+    """Token bucket that refills at `rate_per_minute` and holds at most `capacity` tokens."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None) -> None:
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount: float) -> float:
+        """Take `amount` tokens and return how many seconds the caller has to wait for them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate_per_second
+            )
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate_per_second
+
+    def refund(self, amount: float) -> None:
+        """Give back tokens that were reserved but not used (e.g. an estimate that was too high)."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def acquire(self, amount: float = 1) -> float:
+        wait = self._reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, amount: float = 1) -> float:
+        wait = self._reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            elapsed = time.monotonic() - self._updated
+            return min(self.capacity, self._tokens + elapsed * self.rate_per_second)
+
+    def try_acquire(self, amount: float = 1) -> float:
+        """Take `amount` tokens only if they are available now. Returns 0, or the seconds until they will be."""
+        # A reservation larger than the bucket would never fit.
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate_per_second
+            )
+            self._updated = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate_per_second
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import uuid
+import zlib
+from importlib import metadata as importlib_metadata
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from llama_index.core.readers.base import BaseReader
+from llama_index.core.schema import Document
+
+from utils.disk_cache import DiskCache
+from utils.manifest import file_sha256
+
+# Every script extracts the text of the same PDFs again on startup.
+# CachedReader wraps a reader (PDFReader used by SimpleDirectoryReader, PyMuPDFReader, ...) and keeps
+# the extracted documents in a local cache, keyed by the hash of the file content, the reader type,
+# its settings and the versions of the reader and parser packages.
+# On a hit, the documents (one per page, with page_label) are returned without opening the PDF.
+#
+# Usage:
+#   SimpleDirectoryReader(input_files=[...], file_extractor=cached_file_extractor()).load_data()
+#   CachedReader(PyMuPDFReader()).load_data(file_path=..., metadata=True)
+#   cached_load(path, load_fn, reader_name="pypdf")      # for custom loading code
+
+DEFAULT_CACHE_PATH = "./storage/cache/parsed.sqlite"
+
+# Packages that do the actual parsing; their version is part of the cache key.
+PARSER_PACKAGES = {
+    "PDFReader": ["pypdf"],
+    "PyMuPDFReader": ["pymupdf"],
+    "DocxReader": ["docx2txt"],
+    "pypdf": ["pypdf"],
+}
+
+_shared_cache: Optional[DiskCache] = None
+
+
+def _get_cache(cache_path: str) -> DiskCache:
+    global _shared_cache
+    if _shared_cache is None or _shared_cache.path != cache_path:
+        _shared_cache = DiskCache(cache_path, max_entries=10_000)
+    return _shared_cache
+
+
+def _package_version(name: str) -> str:
+    try:
+        return importlib_metadata.version(name)
+    except importlib_metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _module_version(module: str) -> str:
+    # llama_index.readers.file.docs.base -> llama-index-readers-file
+    parts = module.split(".")
+    for end in range(len(parts), 0, -1):
+        version = _package_version("-".join(parts[:end]).replace("_", "-"))
+        if version != "unknown":
+            return version
+    return "unknown"
+
+
+def reader_version(reader_name: str, module: str = "") -> str:
+    versions = [_module_version(module)] if module else []
+    versions += [_package_version(name) for name in PARSER_PACKAGES.get(reader_name, [])]
+    return "/".join(versions)
+
+
+def _serialize(documents: List[Document]) -> bytes:
+    return zlib.compress(json.dumps([doc.to_dict() for doc in documents]).encode("utf-8"))
+
+
+def _deserialize(value: bytes) -> List[Document]:
+    documents = [Document.from_dict(d) for d in json.loads(zlib.decompress(value))]
+    # Without the cache every load creates new document ids.
+    for document in documents:
+        document.id_ = str(uuid.uuid4())
+    return documents
+
+
+def cached_load(
+    file_path: str,
+    load_fn: Callable[[], List[Document]],
+    reader_name: str,
+    version: Optional[str] = None,
+    config: str = "",
+    cache_path: str = DEFAULT_CACHE_PATH,
+) -> List[Document]:
+    """Return the documents of `file_path` from the cache, or call `load_fn` and cache its result."""
+    version = version if version is not None else reader_version(reader_name)
+    key = hashlib.sha256(
+        f"{file_sha256(str(file_path))}|{reader_name}|{version}|{config}".encode("utf-8")
+    ).hexdigest()
+    cache = _get_cache(cache_path)
+    value = cache.get(key)
+    if value is not None:
+        return _deserialize(value)
+    documents = load_fn()
+    cache.put(key, _serialize(documents))
+    return documents
+
+
+class CachedReader(BaseReader):
+    """Reader wrapper that caches the documents extracted from each file."""
+
+    def __init__(self, reader: BaseReader, cache_path: str = DEFAULT_CACHE_PATH) -> None:
+        self._reader = reader
+        self._cache_path = cache_path
+        reader_cls = type(reader)
+        self._reader_name = reader_cls.__name__
+        self._version = reader_version(self._reader_name, reader_cls.__module__)
+        self._config = json.dumps(
+            {
+                k: v
+                for k, v in vars(reader).items()
+                if isinstance(v, (str, int, float, bool, type(None)))
+            },
+            sort_keys=True,
+        )
+
+    def load_data(
+        self, *args: Any, extra_info: Optional[Dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        # PDFReader takes `file`, PyMuPDFReader takes `file_path`.
+        file_path = args[0] if args else kwargs.get("file", kwargs.get("file_path"))
+        if file_path is None:
+            raise ValueError("CachedReader needs the path of the file to load.")
+
+        # Documents are cached without extra_info (it contains access dates), which is merged afterwards
+        # the same way the readers do it.
+        call_kwargs = {k: v for k, v in kwargs.items() if k not in ("file", "file_path")}
+        documents = cached_load(
+            str(file_path),
+            lambda: self._reader.load_data(Path(file_path), **call_kwargs),
+            reader_name=self._reader_name,
+            version=self._version,
+            config=self._config + json.dumps(
+                {k: v for k, v in call_kwargs.items() if k != "fs"}, sort_keys=True, default=str
+            ),
+            cache_path=self._cache_path,
+        )
+        # The key is the file content, so the cached documents can come from an identical file at another path:
+        # the path metadata of the readers (PDFReader/DocxReader: file_name, PyMuPDFReader: file_path)
+        # is set from the file being loaded.
+        for document in documents:
+            if "file_name" in document.metadata:
+                document.metadata["file_name"] = Path(file_path).name
+            if "file_path" in document.metadata:
+                document.metadata["file_path"] = str(Path(file_path))
+            if extra_info:
+                document.metadata.update(extra_info)
+        return documents
+
+
+def cached_file_extractor(cache_path: str = DEFAULT_CACHE_PATH) -> Dict[str, BaseReader]:
+    """file_extractor for SimpleDirectoryReader that caches PDF and DOCX parsing."""
+    from llama_index.readers.file import DocxReader, PDFReader
+
+    return {
+        ".pdf": CachedReader(PDFReader(), cache_path=cache_path),
+        ".docx": CachedReader(DocxReader(), cache_path=cache_path),
+    }
@@ -0,0 +1,309 @@
+import asyncio
+import contextvars
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from llama_index.core import Settings
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.llms.generic_utils import messages_to_history_str
+from llama_index.core.base.llms.types import ChatMessage
+from llama_index.core.chat_engine.condense_plus_context import CondensePlusContextChatEngine
+from llama_index.core.llms.llm import LLM
+from llama_index.core.memory import BaseMemory, ChatMemoryBuffer
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.response_synthesizers import CompactAndRefine
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.tools import ToolOutput
+
+# CondensePlusContextChatEngine answers every turn in three steps, one after another: an LLM call that rewrites
+# the message and the history into a standalone question ("Can you tell me more about it?" -> "Can you tell me
+# more about Bitcoin?"), retrieval for that question, and the answer. The time to the first streamed token
+# always includes a full extra LLM round-trip, even for messages that do not need rewriting.
+#
+# SpeculativeCondensePlusContextChatEngine:
+# - does not call the LLM when the history is empty or the message is already standalone (a cheap word check:
+#   no pronouns or words like "more", "else", "that" that refer to the conversation),
+# - caches condensed questions per (history, message), so a repeated or retried turn is not condensed again,
+# - while the condense call is in flight, retrieves for the raw message in the background and keeps the nodes
+#   of the previous turn's condensed question, and uses them when the final question is (nearly) the same
+#   query - by default the same words in any order, see overlap_threshold. Otherwise the final question is
+#   retrieved as usual.
+#
+# Retrieval is usually much faster than the condense call, so the background retrieval is free in terms of
+# latency; it costs one extra query embedding per condensed turn.
+#
+# Usage:
+#   chat_engine = SpeculativeCondensePlusContextChatEngine.from_defaults(retriever=retriever, llm=llm, memory=memory)
+#   chat_engine.stream_chat("Can you tell me more about it?").print_response_stream()
+#   print(chat_engine.metrics.summary())
+
+logger = logging.getLogger(__name__)
+
+# Words that refer to earlier turns, in English and Croatian. The Croatian "to" is left out, in English
+# it is a preposition in almost every question.
+REFERRING_WORDS = frozenset(
+    "it its it's itself they them their theirs those these that this he him his she her hers there "
+    "former latter above previous previously earlier more else another same also again "
+    "ono ona on oni one ta taj tu tog toga tome tom njega njemu nju njoj njih njima ovo ova ovaj "
+    "onaj tamo više još isto prethodno ranije".split()
+)
+# Messages shorter than this ("Why?", "And 2022?") are always condensed.
+MIN_STANDALONE_WORDS = 4
+
+
+def words(text: str) -> List[str]:
+    return re.findall(r"[\w']+", text.casefold())
+
+
+def is_standalone(message: str) -> bool:
+    """True if the message can be answered without the chat history, by a word check."""
+    message_words = words(message)
+    return len(message_words) >= MIN_STANDALONE_WORDS and not REFERRING_WORDS.intersection(message_words)
+
+
+def query_overlap(a: str, b: str) -> float:
+    """Jaccard similarity of the words of two queries."""
+    words_a, words_b = set(words(a)), set(words(b))
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+@dataclass
+class SpeculativeChatMetrics:
+    turns: int = 0
+    condense_calls: int = 0
+    condense_skipped: int = 0
+    condense_cache_hits: int = 0
+    speculative_retrievals: int = 0
+    speculative_hits: int = 0
+    condense_ms: float = 0.0
+
+    def summary(self) -> str:
+        mean_ms = self.condense_ms / self.condense_calls if self.condense_calls else 0.0
+        return (
+            f"{self.turns} turns: {self.condense_calls} condensed (mean {mean_ms:.0f} ms), "
+            f"{self.condense_skipped} standalone, {self.condense_cache_hits} cached; "
+            f"{self.speculative_hits} speculative retrievals used"
+        )
+
+
+class SpeculativeCondensePlusContextChatEngine(CondensePlusContextChatEngine):
+    """CondensePlusContextChatEngine that skips, caches and overlaps the condense step with retrieval."""
+
+    def __init__(
+        self,
+        *args: Any,
+        overlap_threshold: float = 1.0,
+        cache_size: int = 256,
+        max_workers: int = 2,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.overlap_threshold = overlap_threshold
+        self.cache_size = cache_size
+        self.metrics = SpeculativeChatMetrics()
+        self._condensed: "OrderedDict[str, str]" = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative-retrieve")
+        # Condensed question and nodes of the previous turn.
+        self._previous: Optional[Tuple[str, List[NodeWithScore]]] = None
+
+    @classmethod
+    def from_defaults(
+        cls,
+        retriever: BaseRetriever,
+        llm: Optional[LLM] = None,
+        chat_history: Optional[List[ChatMessage]] = None,
+        memory: Optional[BaseMemory] = None,
+        system_prompt: Optional[str] = None,
+        context_prompt: Optional[Union[str, PromptTemplate]] = None,
+        context_refine_prompt: Optional[Union[str, PromptTemplate]] = None,
+        condense_prompt: Optional[Union[str, PromptTemplate]] = None,
+        skip_condense: bool = False,
+        node_postprocessors: Optional[List[BaseNodePostprocessor]] = None,
+        verbose: bool = False,
+        overlap_threshold: float = 1.0,
+        cache_size: int = 256,
+        max_workers: int = 2,
+        **kwargs: Any,
+    ) -> "SpeculativeCondensePlusContextChatEngine":
+        llm = llm or Settings.llm
+        memory = memory or ChatMemoryBuffer.from_defaults(
+            chat_history=chat_history or [], token_limit=llm.metadata.context_window - 256
+        )
+        return cls(
+            retriever=retriever,
+            llm=llm,
+            memory=memory,
+            context_prompt=context_prompt,
+            context_refine_prompt=context_refine_prompt,
+            condense_prompt=condense_prompt,
+            skip_condense=skip_condense,
+            callback_manager=Settings.callback_manager,
+            node_postprocessors=node_postprocessors,
+            system_prompt=system_prompt,
+            verbose=verbose,
+            overlap_threshold=overlap_threshold,
+            cache_size=cache_size,
+            max_workers=max_workers,
+        )
+
+    def _cache_key(self, chat_history: List[ChatMessage], message: str) -> str:
+        history = messages_to_history_str(chat_history)
+        return hashlib.sha256(f"{history}\n\n{message}".encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        condensed = self._condensed.get(key)
+        if condensed is not None:
+            self._condensed.move_to_end(key)
+        return condensed
+
+    def _cache_put(self, key: str, condensed: str) -> None:
+        self._condensed[key] = condensed
+        self._condensed.move_to_end(key)
+        while len(self._condensed) > self.cache_size:
+            self._condensed.popitem(last=False)
+
+    def _without_llm(self, chat_history: List[ChatMessage], message: str) -> Tuple[Optional[str], Optional[str]]:
+        """The condensed question if it is known without the LLM, and the cache key."""
+        self.metrics.turns += 1
+        if self._skip_condense or not chat_history:
+            return message, None
+        key = self._cache_key(chat_history, message)
+        condensed = self._cache_get(key)
+        if condensed is not None:
+            self.metrics.condense_cache_hits += 1
+            return condensed, key
+        if is_standalone(message):
+            self.metrics.condense_skipped += 1
+            return message, key
+        return None, key
+
+    def _speculative_match(self, condensed: str, candidates: Dict[str, Any]) -> Optional[str]:
+        best, best_overlap = None, 0.0
+        for query in candidates:
+            overlap = query_overlap(condensed, query)
+            if overlap >= self.overlap_threshold and overlap > best_overlap:
+                best, best_overlap = query, overlap
+        return best
+
+    def _log_condensed(self, condensed: str) -> None:
+        logger.info(f"Condensed question: {condensed}")
+        if self._verbose:
+            print(f"Condensed question: {condensed}")
+
+    def _finish(
+        self,
+        chat_history: List[ChatMessage],
+        condensed: str,
+        context_nodes: List[NodeWithScore],
+        streaming: bool,
+    ) -> Tuple[CompactAndRefine, ToolOutput, List[NodeWithScore]]:
+        self._previous = (condensed, context_nodes)
+        context_source = ToolOutput(
+            tool_name="retriever",
+            content=str(context_nodes),
+            raw_input={"message": condensed},
+            raw_output=context_nodes,
+        )
+        response_synthesizer = self._get_response_synthesizer(chat_history, streaming=streaming)
+        return response_synthesizer, context_source, context_nodes
+
+    def _run_c3(
+        self,
+        message: str,
+        chat_history: Optional[List[ChatMessage]] = None,
+        streaming: bool = False,
+    ) -> Tuple[CompactAndRefine, ToolOutput, List[NodeWithScore]]:
+        if chat_history is not None:
+            self._memory.set(chat_history)
+        chat_history = self._memory.get(input=message)
+
+        condensed, key = self._without_llm(chat_history, message)
+        if condensed is not None:
+            self._log_condensed(condensed)
+            return self._finish(chat_history, condensed, self._get_nodes(condensed), streaming)
+
+        # Retrieval for the raw message runs while the LLM condenses. The worker thread gets a copy of
+        # the context, so its callback events belong to this chat turn.
+        candidates: Dict[str, Any] = {}
+        if self._previous is not None:
+            candidates[self._previous[0]] = self._previous[1]
+        if message not in candidates:
+            context = contextvars.copy_context()
+            candidates[message] = self._executor.submit(context.run, self._get_nodes, message)
+            self.metrics.speculative_retrievals += 1
+
+        start = time.perf_counter()
+        condensed = self._condense_question(chat_history, message)
+        self.metrics.condense_ms += (time.perf_counter() - start) * 1000
+        self.metrics.condense_calls += 1
+        self._cache_put(key, condensed)
+        self._log_condensed(condensed)
+
+        match = self._speculative_match(condensed, candidates)
+        if match is None:
+            context_nodes = self._get_nodes(condensed)
+        else:
+            self.metrics.speculative_hits += 1
+            result = candidates[match]
+            context_nodes = result.result() if isinstance(result, Future) else result
+        return self._finish(chat_history, condensed, context_nodes, streaming)
+
+    async def _arun_c3(
+        self,
+        message: str,
+        chat_history: Optional[List[ChatMessage]] = None,
+        streaming: bool = False,
+    ) -> Tuple[CompactAndRefine, ToolOutput, List[NodeWithScore]]:
+        if chat_history is not None:
+            self._memory.set(chat_history)
+        chat_history = self._memory.get(input=message)
+
+        condensed, key = self._without_llm(chat_history, message)
+        if condensed is not None:
+            self._log_condensed(condensed)
+            return self._finish(chat_history, condensed, await self._aget_nodes(condensed), streaming)
+
+        candidates: Dict[str, Any] = {}
+        if self._previous is not None:
+            candidates[self._previous[0]] = self._previous[1]
+        if message not in candidates:
+            candidates[message] = asyncio.ensure_future(self._aget_nodes(message))
+            self.metrics.speculative_retrievals += 1
+
+        start = time.perf_counter()
+        try:
+            condensed = await self._acondense_question(chat_history, message)
+        except BaseException:
+            for result in candidates.values():
+                if isinstance(result, asyncio.Future):
+                    result.cancel()
+            raise
+        self.metrics.condense_ms += (time.perf_counter() - start) * 1000
+        self.metrics.condense_calls += 1
+        self._cache_put(key, condensed)
+        self._log_condensed(condensed)
+
+        match = self._speculative_match(condensed, candidates)
+        for query, result in candidates.items():
+            if query != match and isinstance(result, asyncio.Future):
+                result.cancel()
+        if match is None:
+            context_nodes = await self._aget_nodes(condensed)
+        else:
+            self.metrics.speculative_hits += 1
+            result = candidates[match]
+            context_nodes = await result if isinstance(result, asyncio.Future) else result
+        return self._finish(chat_history, condensed, context_nodes, streaming)
+
+    def reset(self) -> None:
+        super().reset()
+        self._previous = None
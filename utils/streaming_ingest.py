@@ -0,0 +1,62 @@
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, TypeVar
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import Document, TransformComponent
+
+# Streaming ingestion for the low-level path in 5_lowlevel_docs_metadata.py.
+# Instead of building a list of all pages, then a list of all nodes, then more lists in the pipeline,
+# pages are read one at a time and flow through the transformations (splitting, metadata extraction)
+# in small batches. Every batch is embedded and inserted into the index as soon as it is ready,
+# so only one batch of pages and nodes is held in memory, no matter how long the document is.
+#
+# Usage:
+#   index = VectorStoreIndex([])
+#   stream_into_index(
+#       iter_pdf_pages("./whitepapers/bitcoin.pdf", metadata={"filename": "bitcoin.pdf", "coin": "btc"}),
+#       index,
+#       transformations=[node_parser, *extractors],
+#   )
+
+T = TypeVar("T")
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_pdf_pages(file_path: str, metadata: Optional[Dict[str, Any]] = None) -> Iterator[Document]:
+    """Yield one Document per page, extracting the text only when the page is requested."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    for i in range(len(reader.pages)):
+        yield Document(
+            text=reader.pages[i].extract_text(),
+            metadata={**(metadata or {}), "page_label": i + 1},
+        )
+
+
+def stream_into_index(
+    documents: Iterable[Document],
+    index: VectorStoreIndex,
+    transformations: Sequence[TransformComponent],
+    batch_size: int = 8,
+) -> int:
+    """Run `transformations` on batches of `documents` and insert every batch into `index`.
+
+    Returns the number of inserted nodes.
+    """
+    inserted = 0
+    for batch in batched(documents, batch_size):
+        nodes = run_transformations(batch, transformations, in_place=True)
+        # insert_nodes embeds the nodes that have no embedding yet.
+        index.insert_nodes(nodes)
+        inserted += len(nodes)
+    return inserted